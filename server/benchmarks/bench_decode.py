@@ -0,0 +1,61 @@
+"""
+Detection image decoding benchmark
+
+Times decoding a large JPEG (12 MP phone photo by default) for inference, from its bytes in memory:
+full resolution decode (FRManager.to_npy) against FRManager.decode_for_inference with and without draft mode, at several max input sides.
+Only decoding is timed; no model is loaded.
+
+Usage (from the server directory):
+    python -m benchmarks.bench_decode [--width 4032] [--height 3024] [--max-sides 1280 1920] [--runs 30]
+"""
+import argparse
+import io
+import time
+
+import numpy as np
+from PIL import Image
+
+from managers.FRManager import FRManager
+
+def make_jpeg(width: int, height: int) -> bytes:
+    #Smooth gradients with some noise compress like a photo (pure noise would make the JPEG unrealistically large)
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    noise = np.random.default_rng(0).normal(0, 8, (height, width)).astype(np.float32)
+    img = np.stack([(x + y) / 2 + noise, x + noise * 0, y + noise], axis=-1).clip(0, 255).astype(np.uint8)
+
+    buffer = io.BytesIO()
+    Image.fromarray(img).save(buffer, format='JPEG', quality=90)
+    return buffer.getvalue()
+
+def percentiles(fn, runs: int) -> tuple[float, float]:
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1e3)
+    return float(np.percentile(times, 50)), float(np.percentile(times, 99))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--width', type=int, default=4032)
+    parser.add_argument('--height', type=int, default=3024)
+    parser.add_argument('--max-sides', type=int, nargs='+', default=[1280, 1920])
+    parser.add_argument('--runs', type=int, default=30)
+    args = parser.parse_args()
+
+    img_bytes = make_jpeg(args.width, args.height)
+    print('{}x{} JPEG, {:.1f} MB'.format(args.width, args.height, len(img_bytes) / 1e6))
+
+    fr_manager = FRManager.__new__(FRManager) #only the decoding attributes are needed, which avoids creating model and index
+    cases = [('full decode', 0, False)] + [(label.format(side), side, fast) for side in args.max_sides
+                                           for label, fast in (('max side {} resize', False), ('max side {} draft', True))]
+
+    for label, max_side, fast_decode in cases:
+        fr_manager.max_input_side, fr_manager.fast_decode = max_side, fast_decode
+        shape = fr_manager.decode_for_inference(img_bytes)[0].shape
+        p50, p99 = percentiles(lambda: fr_manager.decode_for_inference(img_bytes), args.runs)
+        print('{:<22} | {:>16} | p50 {:8.1f} ms | p99 {:8.1f} ms'.format(label, 'x'.join(map(str, shape)), p50, p99))
+
+if __name__ == '__main__':
+    main()
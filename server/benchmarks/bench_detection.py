@@ -0,0 +1,107 @@
+"""
+Face detection resolution benchmark: latency and recall of detector settings on single portraits and large group photos
+
+Runs FRManager.infer with the fake face model (benchmarks.fake_model, with blob_faces) on synthetic images: portraits with one large face,
+and group photos with many small faces. For each setting of det_size and det_cascade_size, reports the mean latency per image, the recall
+(faces found with an IoU of at least 0.5 with a face of the image) and the top-1 accuracy of the faces found. The fake detector takes
+--detection-ms at a 640x640 input (scaled with the input area) and misses faces smaller than fake_model.MIN_FACE_SIDE pixels at its input size.
+
+Usage (from the server directory):
+    python -m benchmarks.bench_detection [--images 20] [--group-faces 40] [--group-size 1920 1280] [--detection-ms 50] [--recognition-ms 5]
+"""
+import argparse
+import time
+
+import numpy as np
+
+from managers.FRManager import FRManager
+from managers.FaceTracker import box_iou
+from benchmarks.fake_model import FakeFaceAnalysis, MAX_IDENTITIES, identity_colour, fake_embedding, make_scene_image
+
+#(label, det_size, det_cascade_size)
+SETTINGS = [
+    ('320', 320, 0),
+    ('640', 640, 0),
+    ('1024', 1024, 0),
+    ('1280', 1280, 0),
+    ('cascade 320 -> 640', 640, 320),
+    ('cascade 320 -> 1024', 1024, 320),
+    ('cascade 320 -> 1280', 1280, 320)
+]
+
+def make_portrait(rng: np.random.Generator, identity: int, width: int = 1280, height: int = 960) -> tuple[np.ndarray, list[tuple[int, tuple]]]:
+    side = int(rng.uniform(0.3, 0.6) * height)
+    x, y = int(rng.uniform(0, width - side)), int(rng.uniform(0, height - side))
+    faces = [(identity, (x, y, x + side, y + side))]
+    return make_scene_image(faces, width, height), faces
+
+def make_group(rng: np.random.Generator, identities: np.ndarray, width: int, height: int, min_side: int = 20, max_side: int = 60) -> tuple[np.ndarray, list[tuple[int, tuple]]]:
+    """
+    Rows of faces (like a class photo) in the middle of the image, each face in its own cell so that faces do not touch
+    """
+    cell = 2 * max_side
+    columns = width // cell
+    top = (height - cell * int(np.ceil(len(identities) / columns))) // 2
+    faces = []
+    for idx, identity in enumerate(identities):
+        side = int(rng.uniform(min_side, max_side))
+        x = (idx % columns) * cell + int(rng.uniform(0, cell - side))
+        y = max(top, 0) + (idx // columns) * cell + int(rng.uniform(0, cell - side))
+        faces.append((int(identity), (x, y, x + side, y + side)))
+    return make_scene_image(faces, width, height), faces
+
+def evaluate(fr_manager: FRManager, scenes: list[tuple[np.ndarray, list[tuple[int, tuple]]]]) -> tuple[float, float, float]:
+    """
+    Returns the mean latency (ms), recall and top-1 accuracy of the faces found over the scenes
+    """
+    elapsed, found, correct, total = 0.0, 0, 0, 0
+    for img, faces in scenes:
+        start = time.perf_counter()
+        results = fr_manager.infer(img=img, k=1)
+        elapsed += time.perf_counter() - start
+
+        total += len(faces)
+        if not results: continue
+        ious = box_iou(np.array([box for _, box in faces]), np.array([result['bbox'] for result in results]))
+        for face_idx, (identity, _) in enumerate(faces):
+            result_idx = int(np.argmax(ious[face_idx]))
+            if ious[face_idx, result_idx] < 0.5: continue
+            found += 1
+            correct += results[result_idx]['targets'][:1] == ['id_{}'.format(identity)]
+    return elapsed / len(scenes) * 1e3, found / total, correct / max(found, 1)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--images', type=int, default=20, help='images of each kind')
+    parser.add_argument('--group-faces', type=int, default=40)
+    parser.add_argument('--group-size', type=int, nargs=2, default=[1920, 1280], metavar=('WIDTH', 'HEIGHT'))
+    parser.add_argument('--detection-ms', type=float, default=50, help='simulated detection time at a 640x640 input')
+    parser.add_argument('--recognition-ms', type=float, default=5, help='simulated recognition time per face')
+    args = parser.parse_args()
+
+    FakeFaceAnalysis.blob_faces = True
+    FakeFaceAnalysis.detection_delay = args.detection_ms / 1e3
+    FakeFaceAnalysis.recognition_delay = args.recognition_ms / 1e3
+
+    #Bright identities only, so that faces stay visible to the fake detector once downscaled
+    rng = np.random.default_rng(0)
+    identities = rng.choice(np.arange(MAX_IDENTITIES // 2, MAX_IDENTITIES), size=args.images * (1 + args.group_faces), replace=False)
+    scenes = {
+        'portrait': [make_portrait(rng, identity) for identity in identities[:args.images]],
+        'group': [make_group(rng, group_identities, *args.group_size) for group_identities in np.split(identities[args.images:], args.images)]
+    }
+    names = ['id_{}'.format(identity) for identity in identities]
+    vectors = [fake_embedding(np.full((112, 112, 3), identity_colour(int(identity)), dtype=np.uint8)) for identity in identities]
+
+    print('{:22s} {:>28s} {:>28s}'.format('', 'portrait (1 face)', 'group ({} faces, {}x{})'.format(args.group_faces, *args.group_size)))
+    print('{:22s} {:>10s} {:>8s} {:>8s} {:>10s} {:>8s} {:>8s}'.format('setting', 'ms/image', 'recall', 'top-1', 'ms/image', 'recall', 'top-1'))
+    for label, det_size, det_cascade_size in SETTINGS:
+        fr_manager = FRManager(model_factory=FakeFaceAnalysis, det_size=det_size, det_cascade_size=det_cascade_size, search_backend='exact')
+        fr_manager.add_to_vector_index_multi(names, vectors)
+        fr_manager.warm_up()
+
+        row = [value for kind in ('portrait', 'group') for value in evaluate(fr_manager, scenes[kind])]
+        print('{:22s} {:10.1f} {:8.3f} {:8.3f} {:10.1f} {:8.3f} {:8.3f}'.format(label, *row))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""
+Embedding storage benchmark
+
+Builds a gallery of synthetic identities (two noisy embeddings around a random centre, with the norm of InsightFace embeddings)
+for each embedding dtype, and reports the bytes of the database blobs, vector index and embedding store files, the time to load the
+vector index snapshot, and the top-1 accuracy of queries from held-out embeddings of each identity (and the largest difference
+between the distance reported for the top match and its exact float32 distance). No model is loaded.
+
+Usage (from the server directory):
+    python -m benchmarks.bench_embedding_storage [--identities 20000] [--queries 2000] [--noise 0.6] [--k 5]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from managers.FRManager import FRManager
+from managers.EmbeddingStore import EMBEDDING_DTYPES, encode_embeddings
+
+def make_gallery(identities: int, noise: float, seed: int = 0) -> tuple[np.ndarray, np.ndarray]:
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((identities, 512)).astype(np.float32)
+    samples = centres[:, None, :] + noise * rng.standard_normal((identities, 2, 512)).astype(np.float32)
+    samples *= 20 / np.linalg.norm(samples, axis=2, keepdims=True)
+    return samples[:, 0], samples[:, 1] #enrolled embeddings, held-out query embeddings
+
+def file_megabytes(folder_path: str, *names: str) -> float:
+    return sum(os.path.getsize(os.path.join(folder_path, name)) for name in names if os.path.exists(os.path.join(folder_path, name))) / 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--identities', type=int, default=20000)
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--noise', type=float, default=0.6)
+    parser.add_argument('--k', type=int, default=5)
+    args = parser.parse_args()
+
+    enrolled, queries = make_gallery(args.identities, args.noise)
+    names = ['person {}'.format(idx) for idx in range(args.identities)]
+    query_ids = np.random.default_rng(1).choice(args.identities, min(args.queries, args.identities), replace=False)
+
+    for dtype in EMBEDDING_DTYPES:
+        fr_manager = FRManager(embedding_dtype=dtype, search_backend='hnsw')
+        fr_manager.load_vectors_from_sql(names, list(enrolled), reset=True)
+
+        snapshot_path = tempfile.mkdtemp()
+        fr_manager.save_snapshot(snapshot_path)
+        start = time.perf_counter()
+        fr_manager.load_snapshot(snapshot_path)
+        load_ms = (time.perf_counter() - start) * 1e3
+
+        #Same search as FRManager.search_faces (neighbours re-scored from the embedding store if the index has 8-bit components)
+        neighbours, distances = fr_manager.vector_index.query(queries[query_ids], k=args.k)
+        if fr_manager.vector_index.lossy: neighbours, distances = fr_manager.rescore_neighbours(queries[query_ids], neighbours)
+        accuracy = float(np.mean(neighbours[:, 0] == query_ids))
+        exact = 1 - np.sum(fr_manager.normalise(queries[query_ids]) * fr_manager.normalise(enrolled[neighbours[:, 0].astype(int)]), axis=1)
+        distance_error = float(np.abs(distances[:, 0] - exact).max())
+        blob_bytes = sum(len(encode_embeddings(vector, dtype)) for vector in enrolled[:1000]) / min(1000, args.identities)
+
+        print('{:<8} | blob {:6.0f} B/vector | index {:7.1f} MB | store (memory-mapped) {:7.1f} MB | load {:7.1f} ms | top-1 {:.4f} | max distance error {:.4f}'.format(
+            dtype, blob_bytes, file_megabytes(snapshot_path, 'index' + fr_manager.vector_index.file_extension), file_megabytes(snapshot_path, 'vectors.npy', 'scales.npy'), load_ms, accuracy, distance_error))
+
+if __name__ == '__main__':
+    main()
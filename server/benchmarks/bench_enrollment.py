@@ -0,0 +1,55 @@
+"""
+Enrollment throughput benchmark (images/sec)
+
+Compares the per-image extraction loop (FRManager.extract_embeddings called once per image) 
+against the batched pipeline in FRManager.extract_embeddings_multi.
+
+Usage (from the server directory):
+    python -m benchmarks.bench_enrollment <folder of face images> [--repeats 3] [--decode-workers 4] [--batch-size 32]
+"""
+import argparse
+import os
+import time
+
+from managers.FRManager import FRManager
+
+IMG_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+def loop_extract(fr_manager: FRManager, img_list: list[str], folder_path: str) -> None:
+    for img in img_list:
+        fr_manager.extract_embeddings(img_filepath=os.path.join(folder_path, img))
+
+def batched_extract(fr_manager: FRManager, img_list: list[str], folder_path: str) -> None:
+    fr_manager.extract_embeddings_multi(img_list, folder_path)
+
+def time_throughput(fn, fr_manager: FRManager, img_list: list[str], folder_path: str, repeats: int) -> float:
+    fn(fr_manager, img_list[:1], folder_path) #warm-up
+
+    start = time.perf_counter()
+    for _ in range(repeats): fn(fr_manager, img_list, folder_path)
+    elapsed = time.perf_counter() - start
+
+    return len(img_list) * repeats / elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('folder', help='folder containing face images')
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--decode-workers', type=int, default=4)
+    parser.add_argument('--batch-size', type=int, default=32)
+    args = parser.parse_args()
+
+    img_list = sorted(img for img in os.listdir(args.folder) if img.lower().endswith(IMG_EXTENSIONS))
+    if not img_list: raise SystemExit('No images found in {}'.format(args.folder))
+
+    fr_manager = FRManager(decode_workers=args.decode_workers, rec_batch_size=args.batch_size)
+
+    loop_ips = time_throughput(loop_extract, fr_manager, img_list, args.folder, args.repeats)
+    batched_ips = time_throughput(batched_extract, fr_manager, img_list, args.folder, args.repeats)
+
+    print('images: {}, repeats: {}'.format(len(img_list), args.repeats))
+    print('per-image loop : {:8.2f} images/sec'.format(loop_ips))
+    print('batched        : {:8.2f} images/sec ({:.2f}x)'.format(batched_ips, batched_ips / loop_ips))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+Face quality benchmark: latency and stored faces of crowd photos with and without quality gating
+
+Runs FRManager.infer with the fake face model (benchmarks.fake_model, with blob_faces) on synthetic crowd photos with --faces faces each,
+of random sizes, a --sharp-fraction of them sharp and the rest blurred (see make_scene_image). For each setting of min_face_quality,
+max_faces and report_skipped_faces, reports the mean latency per image, the faces recognised and returned (each returned face is a row
+of the Face table when the image comes from /FR/detection/) per image, and the top-1 accuracy of the faces recognised.
+The fake recognizer takes --recognition-ms per face, so latency grows with the faces recognised.
+
+Usage (from the server directory):
+    python -m benchmarks.bench_quality [--images 10] [--faces 200] [--sharp-fraction 0.5] [--size 2560 1920] [--recognition-ms 5]
+"""
+import argparse
+import time
+
+import numpy as np
+
+from managers.FRManager import FRManager
+from managers.FaceTracker import box_iou
+from benchmarks.fake_model import FakeFaceAnalysis, MAX_IDENTITIES, identity_colour, fake_embedding, make_scene_image
+
+#(label, min_face_quality, max_faces, report_skipped_faces)
+SETTINGS = [
+    ('no gating', 0.0, 0, False),
+    ('min quality 0.3', 0.3, 0, False),
+    ('max 20 faces', 0.0, 20, False),
+    ('min 0.3, max 20', 0.3, 20, False),
+    ('min 0.3, max 20, skipped', 0.3, 20, True)
+]
+
+def make_crowd(rng: np.random.Generator, identities: np.ndarray, width: int, height: int, sharp_fraction: float,
+               min_side: int = 16, max_side: int = 64) -> tuple[np.ndarray, list[tuple[int, tuple]]]:
+    """
+    Faces scattered over the image, each in its own cell of a grid so that faces do not touch
+    """
+    cell = max_side + 8
+    columns, rows = width // cell, height // cell
+    if len(identities) > columns * rows: raise ValueError("{} faces do not fit in a {}x{} image".format(len(identities), width, height))
+
+    faces = []
+    for identity, cell_idx in zip(identities, rng.choice(columns * rows, size=len(identities), replace=False)):
+        side = int(rng.uniform(min_side, max_side))
+        x = (cell_idx % columns) * cell + int(rng.uniform(0, cell - side))
+        y = (cell_idx // columns) * cell + int(rng.uniform(0, cell - side))
+        faces.append((int(identity), (x, y, x + side, y + side)))
+    sharp = list(rng.random(len(faces)) < sharp_fraction)
+    return make_scene_image(faces, width, height, sharp=sharp), faces
+
+def evaluate(fr_manager: FRManager, scenes: list[tuple[np.ndarray, list[tuple[int, tuple]]]]) -> tuple[float, float, float, float]:
+    """
+    Returns the mean latency (ms), faces recognised and returned per image, and the top-1 accuracy of the faces recognised over the scenes
+    """
+    elapsed, recognised, returned, correct = 0.0, 0, 0, 0
+    for img, faces in scenes:
+        start = time.perf_counter()
+        results = fr_manager.infer(img=img, k=1)
+        elapsed += time.perf_counter() - start
+
+        returned += len(results)
+        results = [result for result in results if result['embedding'] is not None]
+        recognised += len(results)
+        if not results: continue
+        ious = box_iou(np.array([result['bbox'] for result in results]), np.array([box for _, box in faces]))
+        for result, result_ious in zip(results, ious):
+            face_idx = int(np.argmax(result_ious))
+            correct += result_ious[face_idx] >= 0.5 and result['targets'][:1] == ['id_{}'.format(faces[face_idx][0])]
+    return elapsed / len(scenes) * 1e3, recognised / len(scenes), returned / len(scenes), correct / max(recognised, 1)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--images', type=int, default=10)
+    parser.add_argument('--faces', type=int, default=200, help='faces per image')
+    parser.add_argument('--sharp-fraction', type=float, default=0.5, help='fraction of faces that are sharp')
+    parser.add_argument('--size', type=int, nargs=2, default=[2560, 1920], metavar=('WIDTH', 'HEIGHT'))
+    parser.add_argument('--recognition-ms', type=float, default=5, help='simulated recognition time per face')
+    args = parser.parse_args()
+
+    FakeFaceAnalysis.blob_faces = True
+    FakeFaceAnalysis.recognition_delay = args.recognition_ms / 1e3
+
+    rng = np.random.default_rng(0)
+    identities = rng.choice(np.arange(MAX_IDENTITIES // 2, MAX_IDENTITIES), size=args.images * args.faces, replace=False)
+    scenes = [make_crowd(rng, crowd_identities, *args.size, args.sharp_fraction) for crowd_identities in np.split(identities, args.images)]
+    names = ['id_{}'.format(identity) for identity in identities]
+    vectors = [fake_embedding(np.full((112, 112, 3), identity_colour(int(identity)), dtype=np.uint8)) for identity in identities]
+
+    print('{} images of {} faces ({:.0%} sharp), {}x{}'.format(args.images, args.faces, args.sharp_fraction, *args.size))
+    print('{:26s} {:>10s} {:>11s} {:>9s} {:>8s}'.format('setting', 'ms/image', 'recognised', 'returned', 'top-1'))
+    for label, min_face_quality, max_faces, report_skipped_faces in SETTINGS:
+        fr_manager = FRManager(model_factory=FakeFaceAnalysis, det_size=max(args.size), search_backend='exact', min_face_quality=min_face_quality,
+                               max_faces=max_faces, report_skipped_faces=report_skipped_faces)
+        fr_manager.add_to_vector_index_multi(names, vectors)
+        fr_manager.warm_up()
+        print('{:26s} {:10.1f} {:11.1f} {:9.1f} {:8.3f}'.format(label, *evaluate(fr_manager, scenes)))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+Identity registry micro-benchmarks
+
+Times the per-request bookkeeping of PATCH/DELETE /FR/person/ and of mapping query results to names,
+with the previous list-based structures (name_list.index, deleted_ids list) against managers.IdentityRegistry.
+
+Usage (from the server directory):
+    python -m benchmarks.bench_registry [--sizes 10000 100000 1000000] [--ops 1000]
+"""
+import argparse
+import random
+import time
+
+import numpy as np
+
+from managers.IdentityRegistry import IdentityRegistry
+
+def time_per_op(fn, ops: int) -> float:
+    start = time.perf_counter()
+    fn()
+    return (time.perf_counter() - start) / ops * 1e6
+
+def bench_lists(name_list: list[str], names: list[str], neighbours: np.ndarray) -> dict[str, float]:
+    deleted_ids = list(range(0, len(name_list), 10)) #10% of slots deleted
+
+    def lookup():
+        for name in names: name_list.index(name)
+
+    def delete_and_restore():
+        for name in names:
+            idx = name_list.index(name)
+            if idx not in deleted_ids: deleted_ids.append(idx)
+            if idx in deleted_ids: deleted_ids.remove(idx)
+
+    def map_neighbours():
+        for row in neighbours: [name_list[idx] for idx in row]
+
+    return {
+        'lookup_us': time_per_op(lookup, len(names)),
+        'delete_restore_us': time_per_op(delete_and_restore, len(names)),
+        'map_query_us': time_per_op(map_neighbours, len(neighbours))
+    }
+
+def bench_registry(name_list: list[str], names: list[str], neighbours: np.ndarray) -> dict[str, float]:
+    registry = IdentityRegistry.from_lists(name_list, list(range(0, len(name_list), 10)))
+
+    def lookup():
+        for name in names: registry.get_slots(name)
+
+    def delete_and_restore():
+        for name in names:
+            idx = registry.get_slots(name)[0]
+            registry.mark_deleted(idx)
+            registry.unmark_deleted(idx)
+
+    def map_neighbours():
+        for row in neighbours: registry.get_names(row).tolist()
+
+    return {
+        'lookup_us': time_per_op(lookup, len(names)),
+        'delete_restore_us': time_per_op(delete_and_restore, len(names)),
+        'map_query_us': time_per_op(map_neighbours, len(neighbours)),
+        'compact_ms': time_per_op(registry.compact, 1) / 1e3
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--ops', type=int, default=1000)
+    parser.add_argument('--k', type=int, default=10, help='neighbours per query result')
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    for size in args.sizes:
+        name_list = ['PERSON {}'.format(i) for i in range(size)]
+        names = rng.choices(name_list, k=args.ops)
+        neighbours = np.random.default_rng(0).integers(0, size, size=(args.ops, args.k), dtype=np.uint64)
+
+        for label, fn in (('lists', bench_lists), ('registry', bench_registry)):
+            results = fn(name_list, names, neighbours)
+            print('{:>9} identities | {:<8} | '.format(size, label) + ' | '.join('{} {:10.2f}'.format(key, value) for key, value in results.items()))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""
+Search backend benchmark
+
+For several gallery sizes, builds the 'hnsw' and 'exact' search backends (managers.SearchBackend) from the same synthetic embeddings
+and reports build time, latency of single queries (one face), throughput of batched queries (several faces or micro-batched
+requests), how often the top match is the gallery vector a query was made from, and recall@k of each backend against exact search.
+No model is loaded.
+
+Usage (from the server directory):
+    python -m benchmarks.bench_search [--sizes 1000 10000 50000] [--queries 200] [--batch-size 32] [--k 10]
+"""
+import argparse
+import time
+
+import numpy as np
+
+from managers.SearchBackend import HNSWBackend, ExactBackend
+
+def make_embeddings(count: int, seed: int) -> np.ndarray:
+    return np.random.default_rng(seed).standard_normal((count, 512)).astype(np.float32)
+
+def recall(neighbours: np.ndarray, exact_neighbours: np.ndarray) -> float:
+    return float(np.mean([len(set(row) & set(exact_row)) / len(exact_row) for row, exact_row in zip(neighbours.tolist(), exact_neighbours.tolist())]))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 50000])
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--k', type=int, default=10)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        gallery = make_embeddings(size, seed=0)
+        #Queries close to gallery vectors, like faces of enrolled individuals
+        sources = np.random.default_rng(1).integers(0, size, args.queries)
+        queries = gallery[sources] + make_embeddings(args.queries, seed=2)
+        exact_neighbours = None
+
+        for backend in (ExactBackend(capacity=size), HNSWBackend()):
+            start = time.perf_counter()
+            backend.add_items(gallery, ids=list(range(size)))
+            build_s = time.perf_counter() - start
+
+            times = []
+            for query in queries:
+                start = time.perf_counter()
+                backend.query(query[None], k=args.k)
+                times.append((time.perf_counter() - start) * 1e3)
+
+            start = time.perf_counter()
+            neighbours = np.vstack([backend.query(queries[idx:idx + args.batch_size], k=args.k)[0] for idx in range(0, args.queries, args.batch_size)])
+            batch_qps = args.queries / (time.perf_counter() - start)
+
+            if exact_neighbours is None: exact_neighbours = neighbours
+            print('{:>7} vectors | {:<5} | build {:7.2f} s | query p50 {:7.3f} ms | p99 {:7.3f} ms | batched {:9.0f} queries/s | top-1 {:.4f} | recall@{} {:.4f}'.format(
+                size, backend.name, build_s, np.percentile(times, 50), np.percentile(times, 99), batch_qps, 
+                np.mean(neighbours[:, 0] == sources), args.k, recall(neighbours, exact_neighbours)))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""
+SQLite storage profile benchmark
+
+Inserts detections (one transaction per detection with its faces, like POST /FR/detection/) from several writer threads
+while a reader thread repeatedly loads a page of detection history, first with the previous settings
+(rollback journal, synchronous=FULL, no mmap, default cache) and then with the settings of config.py.
+Reports insert throughput and reader latency. Runs on temporary database files.
+
+Usage (from the server directory):
+    python -m benchmarks.bench_sqlite [--detections 2000] [--writers 4]
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+from sqlmodel import Session, SQLModel, select
+
+from config import DB_JOURNAL_MODE, DB_SYNCHRONOUS, DB_MMAP_SIZE, DB_CACHE_SIZE, DB_BUSY_TIMEOUT, DB_POOL_SIZE, DB_POOL_MAX_OVERFLOW
+from database.database import create_sqlite_engine
+from database.Detection import Detection_SQL, Face
+
+PROFILES = {
+    'previous': dict(journal_mode='DELETE', synchronous='FULL', mmap_size=0, cache_size=-2000, busy_timeout=5000),
+    'configured': dict(journal_mode=DB_JOURNAL_MODE, synchronous=DB_SYNCHRONOUS, mmap_size=DB_MMAP_SIZE, cache_size=DB_CACHE_SIZE,
+                       busy_timeout=DB_BUSY_TIMEOUT, pool_size=DB_POOL_SIZE, max_overflow=DB_POOL_MAX_OVERFLOW)
+}
+
+def run_profile(settings: dict, detections: int, writers: int) -> dict[str, float]:
+    folder = tempfile.mkdtemp()
+    engine = create_sqlite_engine('sqlite:///{}'.format(os.path.join(folder, 'bench.db')), **settings)
+    SQLModel.metadata.create_all(engine)
+
+    done = threading.Event()
+    read_times = []
+
+    def write(count: int):
+        for _ in range(count):
+            with Session(engine) as session:
+                session.add(Detection_SQL(date_time=datetime.now(), image='x.jpg',
+                                          bboxes=[Face(bbox=[0, 0, 10, 10], names=['A'] * 10, probs=[0.1] * 10) for _ in range(2)]))
+                session.commit()
+
+    def read():
+        while not done.is_set():
+            start = time.perf_counter()
+            with Session(engine) as session:
+                for detection in session.exec(select(Detection_SQL).order_by(Detection_SQL.date_time.desc()).limit(30)).all(): detection.bboxes
+            read_times.append((time.perf_counter() - start) * 1e3)
+
+    reader = threading.Thread(target=read)
+    reader.start()
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=write, args=(detections // writers,)) for _ in range(writers)]
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+    elapsed = time.perf_counter() - start
+
+    done.set()
+    reader.join()
+    engine.dispose()
+
+    return {
+        'inserts_per_s': detections // writers * writers / elapsed,
+        'read_p50_ms': float(np.percentile(read_times, 50)),
+        'read_p99_ms': float(np.percentile(read_times, 99)),
+        'reads': len(read_times)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--detections', type=int, default=2000)
+    parser.add_argument('--writers', type=int, default=4)
+    args = parser.parse_args()
+
+    for label, settings in PROFILES.items():
+        results = run_profile(settings, args.detections, args.writers)
+        print('{:<10} | '.format(label) + ' | '.join('{} {:10.1f}'.format(key, value) for key, value in results.items()))
+
+if __name__ == '__main__':
+    main()
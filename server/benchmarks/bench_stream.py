@@ -0,0 +1,114 @@
+"""
+Video stream recognition benchmark
+
+1. Tracking: simulates people walking through a camera's view (boxes drifting and growing as they approach, noisy detection scores
+   and head poses, faster walkers blurred more, faces appearing and leaving) and reports how many faces are recognised per second of video when every detected face is recognised
+   (FRManager.infer on every frame) and with FaceTracker (FRManager.infer_stream), for several sampling rates.
+2. End to end: writes a synthetic video file and times FRManager.infer on every sampled frame against FRManager.infer_stream, with the
+   fake face model (benchmarks.fake_model, whose faces do not move) taking --recognition-ms per recognised face.
+
+Usage (from the server directory):
+    python -m benchmarks.bench_stream [--seconds 60] [--people 20] [--fps 30] [--sample-fps 5 10 30] [--recognition-ms 5]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+from managers.FaceTracker import FaceTracker
+from managers.FRManager import FRManager
+from managers.VideoSource import iter_video_frames
+from benchmarks.fake_model import FakeFaceAnalysis, identity_colour, KPS_TEMPLATE
+
+def simulate_faces(seconds: float, people: int, fps: float, seed: int = 0) -> list[list[tuple[dict, np.ndarray]]]:
+    """
+    Returns the faces detected in each frame of a 1280x720 video where people walk through the view at random times, with their aligned face crops
+    """
+    rng = np.random.default_rng(seed)
+    frames = [[] for _ in range(int(seconds * fps))]
+    for _ in range(people):
+        start, duration = rng.uniform(0, seconds), rng.uniform(3, 10)
+        x, y, side = rng.uniform(0, 1100), rng.uniform(100, 500), rng.uniform(60, 120)
+        velocity, growth = rng.uniform(-80, 80), rng.uniform(0, 8) #pixels per second
+        #Crop of a textured face, blurred more the faster the person walks
+        aligned_face = cv2.GaussianBlur(rng.integers(0, 256, (112, 112, 3), dtype=np.uint8), (0, 0), 0.5 + abs(velocity) / 20)
+
+        for frame_idx in range(int(start * fps), min(int((start + duration) * fps), len(frames))):
+            elapsed = frame_idx / fps - start
+            frame_side = side + growth * elapsed
+            frame_x = x + velocity * elapsed + rng.normal(0, 2)
+            if rng.random() < 0.05: continue #missed detection
+            kps = KPS_TEMPLATE * frame_side + (frame_x, y)
+            kps[2, 0] += rng.normal(0, 0.05) * frame_side #the head turning a little
+            face = dict(bbox=np.array([frame_x, y, frame_x + frame_side, y + frame_side], dtype=np.float32), kps=kps,
+                        det_score=float(np.clip(rng.normal(0.8, 0.05), 0.5, 1.0)))
+            frames[frame_idx].append((face, aligned_face))
+    return frames
+
+def bench_tracking(args: argparse.Namespace) -> None:
+    frames = simulate_faces(args.seconds, args.people, args.fps)
+    for sample_fps in args.sample_fps:
+        step = max(1, round(args.fps / sample_fps))
+        sampled = frames[::step]
+        tracker, recognitions, tracks = FaceTracker(), 0, 0
+        for frame_idx, frame_faces in enumerate(sampled):
+            faces, aligned_faces = [face for face, _ in frame_faces], [aligned_face for _, aligned_face in frame_faces]
+            to_recognise, ended = tracker.update(faces, aligned_faces, frame_idx * step / args.fps)
+            for track, face_idx in to_recognise: track.set_recognition(faces[face_idx], None, None, [], [])
+            recognitions += len(to_recognise)
+            tracks += len(ended)
+        tracks += len(tracker.flush())
+
+        per_frame = sum(len(faces) for faces in sampled)
+        print('sampled at {:5.1f} fps | recognitions per second of video: every face {:7.2f}, tracked {:6.2f} ({:5.1f}x fewer) | {} tracks for {} people'.format(
+            args.fps / step, per_frame / args.seconds, recognitions / args.seconds, per_frame / max(recognitions, 1), tracks, args.people))
+
+def write_video(file_path: str, seconds: float, fps: float) -> None:
+    writer = cv2.VideoWriter(file_path, cv2.VideoWriter_fourcc(*'MJPG'), fps, (1280, 720))
+    for frame_idx in range(int(seconds * fps)):
+        #A different person every 5 seconds (the fake model recognises faces by the colour of the frame), with no one in the last second of each
+        person, elapsed = divmod(frame_idx / fps, 5)
+        writer.write(np.full((720, 1280, 3), identity_colour(int(person))[::-1] if elapsed < 4 else (0, 0, 0), dtype=np.uint8))
+    writer.release()
+
+def bench_end_to_end(args: argparse.Namespace) -> None:
+    FakeFaceAnalysis.faces_per_image = 2
+    FakeFaceAnalysis.recognition_delay = args.recognition_ms / 1000
+    fr_manager = FRManager(model_factory=FakeFaceAnalysis)
+    fr_manager.add_to_vector_index_multi(['person_{}'.format(idx) for idx in range(1000)], list(np.random.default_rng(0).standard_normal((1000, 512)).astype(np.float32)))
+
+    file_path = os.path.join(tempfile.mkdtemp(), 'stream.avi')
+    seconds = min(args.seconds, 20)
+    write_video(file_path, seconds, args.fps)
+
+    for sample_fps in args.sample_fps:
+        start = time.perf_counter()
+        faces = sum(len(fr_manager.infer(img=frame, k=10)) for _, frame in iter_video_frames(file_path, sample_fps))
+        per_frame_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        tracks = list(fr_manager.infer_stream(iter_video_frames(file_path, sample_fps), k=10))
+        tracked_s = time.perf_counter() - start
+
+        print('sampled at {:5.1f} fps | {:.0f} s of video: every face {:6.2f} s ({} recognitions), tracked {:6.2f} s ({} recognitions, {} tracks)'.format(
+            sample_fps, seconds, per_frame_s, faces, tracked_s, sum(track.recognitions for track in tracks), len(tracks)))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seconds', type=float, default=60)
+    parser.add_argument('--people', type=int, default=20)
+    parser.add_argument('--fps', type=float, default=30)
+    parser.add_argument('--sample-fps', type=float, nargs='+', default=[5, 10, 30])
+    parser.add_argument('--recognition-ms', type=float, default=5, help='simulated recognition time per face in the end-to-end benchmark')
+    args = parser.parse_args()
+
+    print('Tracking ({} people over {:.0f} s of {:.0f} fps video)'.format(args.people, args.seconds, args.fps))
+    bench_tracking(args)
+    print('End to end (fake model)')
+    bench_end_to_end(args)
+
+if __name__ == '__main__':
+    main()
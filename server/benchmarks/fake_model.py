@@ -0,0 +1,126 @@
+"""
+Fake face model for benchmarks, used instead of InsightFace's FaceAnalysis so that the server runs without model downloads
+
+Set FR_MODEL_FACTORY='benchmarks.fake_model:FakeFaceAnalysis' (see config.MODEL_FACTORY) to run the server with it.
+Every image has faces_per_image faces side by side, and the embedding of a face is a pseudo-random vector seeded by the (median) colour of its crop,
+so faces in images made by make_face_image for the same identity get the same embedding (and match that identity). Black images have no faces.
+With blob_faces, faces are instead the coloured rectangles on a black background of images made by make_scene_image, and faces smaller than
+MIN_FACE_SIDE pixels at the detector input size are missed (as small faces are by the real detector).
+The time the real models take can be simulated with detection_delay (at a 640x640 detector input, scaled with its area) and recognition_delay.
+"""
+import io
+import time
+
+import cv2
+import numpy as np
+from PIL import Image
+from insightface.app.common import Face
+from insightface.utils import face_align
+
+#Colours are quantised to steps of COLOUR_STEP, so that identities survive JPEG compression
+COLOUR_STEP = 8
+COLOUR_LEVELS = 256 // COLOUR_STEP
+MAX_IDENTITIES = COLOUR_LEVELS ** 3
+
+#Smallest side in pixels, at the detector input size, of faces found with blob_faces
+MIN_FACE_SIDE = 10
+
+#Keypoints (eyes, nose, mouth corners) of a face filling a 1x1 box
+KPS_TEMPLATE = np.array([[0.3, 0.35], [0.7, 0.35], [0.5, 0.55], [0.35, 0.75], [0.65, 0.75]], dtype=np.float32)
+
+def identity_colour(identity: int) -> tuple[int, int, int]:
+    if not 0 <= identity < MAX_IDENTITIES: raise ValueError("identity must be between 0 and {}".format(MAX_IDENTITIES - 1))
+    levels = (identity // COLOUR_LEVELS ** 2, identity // COLOUR_LEVELS % COLOUR_LEVELS, identity % COLOUR_LEVELS)
+    return tuple(level * COLOUR_STEP + COLOUR_STEP // 2 for level in levels)
+
+def make_face_image(identity: int, width: int = 640, height: int = 480, img_format: str = 'JPEG') -> bytes:
+    """
+    Returns an encoded image whose faces the fake model recognises as identity (0 to MAX_IDENTITIES - 1)
+    """
+    buffer = io.BytesIO()
+    Image.new('RGB', (width, height), identity_colour(identity)).save(buffer, format=img_format)
+    return buffer.getvalue()
+
+def make_scene_image(faces: list[tuple[int, tuple[int, int, int, int]]], width: int, height: int, sharp: list[bool] | None = None) -> np.ndarray:
+    """
+    Returns an image (RGB numpy array) with a black background and a face of each identity in its box (x1, y1, x2, y2), found by the fake model with blob_faces
+
+    Faces are flat colours (as blurred as can be), except those marked in sharp, which get a texture of sparse light and dark dots that keeps their (median) colour.
+    """
+    img = np.zeros((height, width, 3), dtype=np.uint8)
+    for idx, (identity, (x1, y1, x2, y2)) in enumerate(faces):
+        colour = np.array(identity_colour(identity))
+        img[y1:y2, x1:x2] = colour
+        if sharp and sharp[idx]:
+            dots = np.zeros((y2 - y1, x2 - x1), dtype=np.int64)
+            dots[::3, ::3] = np.indices(dots[::3, ::3].shape).sum(axis=0) % 2 * 2 - 1
+            amplitude = np.minimum(np.minimum(colour, 255 - colour), 64) #as much contrast as each channel allows, without clipping
+            img[y1:y2, x1:x2] = (colour + dots[..., None] * amplitude).astype(np.uint8)
+    return img
+
+def fake_embedding(crop: np.ndarray) -> np.ndarray:
+    levels = np.clip(np.median(crop.reshape((-1, 3)), axis=0) // COLOUR_STEP, 0, COLOUR_LEVELS - 1).astype(np.int64)
+    seed = int(levels[0] * COLOUR_LEVELS ** 2 + levels[1] * COLOUR_LEVELS + levels[2])
+    return np.random.default_rng(seed).standard_normal(512).astype(np.float32)
+
+class FakeDetector():
+    def __init__(self, owner: 'FakeFaceAnalysis'):
+        self.owner = owner
+
+    def detect(self, img: np.ndarray, input_size: tuple[int, int] | None = None, max_num: int = 0, metric: str = 'default') -> tuple[np.ndarray, np.ndarray]:
+        input_size = input_size or (640, 640)
+        if self.owner.detection_delay: time.sleep(self.owner.detection_delay * input_size[0] * input_size[1] / (640 * 640))
+        if self.owner.blob_faces: return self.detect_blobs(img, input_size)
+
+        height, width = img.shape[:2]
+        count = self.owner.faces_per_image if max_num == 0 else min(max_num, self.owner.faces_per_image)
+        if img.size == 0 or img[::8, ::8].max() < COLOUR_STEP // 2: count = 0
+        side = min(height, width // max(count, 1))
+        bboxes = np.array([[idx * side, 0, (idx + 1) * side, side, 0.99 - idx * 0.01] for idx in range(count)], dtype=np.float32).reshape((-1, 5))
+        kpss = np.array([KPS_TEMPLATE * side + (idx * side, 0) for idx in range(count)], dtype=np.float32).reshape((-1, 5, 2))
+        return bboxes, kpss
+
+    def detect_blobs(self, img: np.ndarray, input_size: tuple[int, int]) -> tuple[np.ndarray, np.ndarray]:
+        height, width = img.shape[:2]
+        scale = min(input_size[0] / width, input_size[1] / height)
+        resized = cv2.resize(img, (max(1, int(width * scale)), max(1, int(height * scale))), interpolation=cv2.INTER_AREA)
+        _, _, stats, _ = cv2.connectedComponentsWithStats((resized.max(axis=2) >= COLOUR_STEP // 2).astype(np.uint8), connectivity=4)
+
+        bboxes, kpss = [], []
+        for x, y, w, h, _ in stats[1:]:
+            if min(w, h) < MIN_FACE_SIDE: continue
+            x1, y1, side = x / scale, y / scale, min(w, h) / scale
+            bboxes.append([x1, y1, (x + w) / scale, (y + h) / scale, 0.9])
+            kpss.append(KPS_TEMPLATE * side + (x1, y1))
+        return np.array(bboxes, dtype=np.float32).reshape((-1, 5)), np.array(kpss, dtype=np.float32).reshape((-1, 5, 2))
+
+class FakeRecognizer():
+    taskname = 'recognition'
+    input_size = (112, 112)
+
+    def __init__(self, owner: 'FakeFaceAnalysis'):
+        self.owner = owner
+
+    def get_feat(self, imgs: list[np.ndarray] | np.ndarray) -> np.ndarray:
+        if not isinstance(imgs, list): imgs = [imgs]
+        if self.owner.recognition_delay: time.sleep(self.owner.recognition_delay * len(imgs))
+        return np.stack([fake_embedding(img) for img in imgs])
+
+class FakeFaceAnalysis():
+    """
+    Prepared fake model with the parts of the FaceAnalysis API used by FRManager (det_model, models['recognition'] and get)
+    """
+    faces_per_image: int = 1
+    blob_faces: bool = False #find faces as coloured rectangles (see make_scene_image) instead of faces_per_image faces side by side
+    detection_delay: float = 0.0 #seconds per image
+    recognition_delay: float = 0.0 #seconds per face
+
+    def __init__(self):
+        self.det_model = FakeDetector(self)
+        self.models = {'detection': self.det_model, 'recognition': FakeRecognizer(self)}
+
+    def get(self, img: np.ndarray, max_num: int = 0) -> list[Face]:
+        bboxes, kpss = self.det_model.detect(img, max_num=max_num)
+        crops = [face_align.norm_crop(img, landmark=kps, image_size=FakeRecognizer.input_size[0]) for kps in kpss]
+        embeddings = self.models['recognition'].get_feat(crops) if crops else []
+        return [Face(bbox=bbox[:4], kps=kps, det_score=bbox[4], embedding=embedding) for bbox, kps, embedding in zip(bboxes, kpss, embeddings)]
@@ -0,0 +1,314 @@
+"""
+End-to-end benchmark suite, run offline on CPU with the fake face model (benchmarks.fake_model) and synthetic galleries
+
+Sections (all run by default):
+- index: builds each search backend from a synthetic gallery of each size, and reports build time, single-query latency,
+  batched throughput and top-1 accuracy of queries made from gallery vectors
+- startup: for a database of each gallery size, time to open it and load the vector index, from the database (no snapshot)
+  and from a snapshot
+- app: starts the FastAPI app in a temporary folder and reports app import, startup and readiness time, enrollment throughput (POST /FR/person/),
+  detection latency (POST /FR/detection/, with --app-gallery synthetic vectors in the index; the result and embedding caches are
+  disabled, then enabled for detection_repeat: every image sent a second time, once with another top_n) and detection history page
+  latency (GET /FR/detection/, with --history detections in the database)
+
+Results are written as JSON ({"meta": {...}, "results": {"<section>.<...>.<metric>": value}}); --compare reports the changes between two
+results files and exits with status 1 if a metric got worse by more than --tolerance (metrics ending in _ms/_s/_mb are lower-is-better,
+_per_s/_accuracy higher-is-better).
+
+Usage (from the server directory):
+    python -m benchmarks.suite [--sizes 1000 10000 100000] [--sections index startup app] [--output results.json]
+    python -m benchmarks.suite --sizes 1000 10000 100000 1000000 --fake-detection-ms 20 --fake-recognition-ms 5
+    python -m benchmarks.suite --compare baseline.json results.json [--tolerance 0.1]
+"""
+import argparse
+import base64
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def percentiles(times: list[float], prefix: str) -> dict[str, float]:
+    return {'{}_p{}_ms'.format(prefix, p): float(np.percentile(times, p)) for p in (50, 95, 99)}
+
+def timed_ms(fn, *args, **kwargs) -> tuple[object, float]:
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, (time.perf_counter() - start) * 1e3
+
+def make_gallery(count: int, seed: int) -> np.ndarray:
+    return np.random.default_rng(seed).standard_normal((count, 512)).astype(np.float32)
+
+def bench_index(sizes: list[int], queries: int, batch_size: int, fr_manager_options: dict) -> dict[str, float]:
+    from managers.SearchBackend import HNSWBackend, ExactBackend
+
+    results = {}
+    for size in sizes:
+        gallery = make_gallery(size, seed=0)
+        sources = np.random.default_rng(1).integers(0, size, queries)
+        query_vectors = gallery[sources] + make_gallery(queries, seed=2)
+
+        backends = (ExactBackend(capacity=size), HNSWBackend(M=fr_manager_options['hnsw_m'], ef_construction=fr_manager_options['hnsw_ef_construction'],
+                                                              ef=fr_manager_options['hnsw_ef'], max_elements=size))
+        for backend in backends:
+            start = time.perf_counter()
+            for idx in range(0, size, 100000): backend.add_items(gallery[idx:idx + 100000], ids=list(range(idx, min(idx + 100000, size))))
+            prefix = 'index.{}.{}.'.format(backend.name, size)
+            results[prefix + 'build_s'] = time.perf_counter() - start
+
+            times = [timed_ms(backend.query, query, k=10)[1] for query in query_vectors]
+            results.update({prefix + key: value for key, value in percentiles(times, 'query').items()})
+
+            start = time.perf_counter()
+            neighbours = np.vstack([backend.query(query_vectors[idx:idx + batch_size], k=10)[0] for idx in range(0, queries, batch_size)])
+            results[prefix + 'batch_queries_per_s'] = queries / (time.perf_counter() - start)
+            results[prefix + 'top1_accuracy'] = float(np.mean(neighbours[:, 0].astype(np.int64) == sources))
+            print_results(results, prefix)
+
+        del backends, gallery
+    return results
+
+def populate_personnel(engine, size: int, embedding_dtype: str) -> None:
+    """
+    Inserts size personnel records with one synthetic embedding each
+    """
+    from sqlmodel import Session, insert
+    from managers.EmbeddingStore import encode_embeddings
+    from database.Personnel import PersonnelFR_SQL, GalleryState_SQL, init_PersonFR_search
+
+    with Session(engine) as session:
+        init_PersonFR_search(session)
+        for idx in range(0, size, 10000):
+            vectors = make_gallery(min(10000, size - idx), seed=idx)
+            session.execute(insert(PersonnelFR_SQL), [
+                dict(name='person_{:07d}'.format(idx + offset), images=[], embeddings=encode_embeddings(vector[None], embedding_dtype),
+                     ave_embedding=encode_embeddings(vector, embedding_dtype), embedding_dtype=embedding_dtype, generation=1)
+                for offset, vector in enumerate(vectors)])
+        session.add(GalleryState_SQL(id=0, generation=1))
+        session.commit()
+
+def bench_startup(sizes: list[int], workdir: str, fr_manager_options: dict) -> dict[str, float]:
+    from sqlmodel import Session, SQLModel
+    from config import DB_JOURNAL_MODE, DB_SYNCHRONOUS, DB_MMAP_SIZE, DB_CACHE_SIZE, DB_BUSY_TIMEOUT
+    from managers.FRManager import FRManager
+    from database.database import create_sqlite_engine
+    from database.Personnel import init_PersonFR_search, load_PersonFR_vector_index
+
+    def start_server(engine, snapshot_path: str) -> FRManager:
+        #What routers.FRroutes.startup does, apart from creating missing tables and columns and starting the inference workers
+        with Session(engine) as session:
+            init_PersonFR_search(session)
+            fr_manager = FRManager(**fr_manager_options)
+            load_PersonFR_vector_index(session, fr_manager, snapshot_path)
+        return fr_manager
+
+    results = {}
+    for size in sizes:
+        folder = tempfile.mkdtemp(dir=workdir)
+        engine = create_sqlite_engine('sqlite:///{}'.format(os.path.join(folder, 'startup.db')), journal_mode=DB_JOURNAL_MODE, synchronous=DB_SYNCHRONOUS,
+                                      mmap_size=DB_MMAP_SIZE, cache_size=DB_CACHE_SIZE, busy_timeout=DB_BUSY_TIMEOUT)
+        SQLModel.metadata.create_all(engine)
+        populate_personnel(engine, size, fr_manager_options['embedding_dtype'])
+
+        snapshot_path = os.path.join(folder, 'vector_index')
+        prefix = 'startup.{}.'.format(size)
+        fr_manager, elapsed = timed_ms(start_server, engine, snapshot_path)
+        results[prefix + 'from_database_s'] = elapsed / 1e3
+        results[prefix + 'snapshot_save_s'] = timed_ms(fr_manager.save_snapshot, snapshot_path)[1] / 1e3
+        results[prefix + 'from_snapshot_s'] = timed_ms(start_server, engine, snapshot_path)[1] / 1e3
+        print_results(results, prefix)
+
+        engine.dispose()
+        del fr_manager
+    return results
+
+def bench_app(args: argparse.Namespace) -> dict[str, float]:
+    from fastapi.testclient import TestClient
+    from sqlmodel import Session, insert
+    from benchmarks.fake_model import make_face_image
+
+    start = time.perf_counter()
+    import main
+    results = {'app.import_s': time.perf_counter() - start}
+    from routers import FRroutes
+    from database.database import engine
+    from database.Detection import Detection_SQL, Face
+    from managers.ResultCache import ResultCache
+
+    def encode(img: bytes) -> str:
+        return base64.b64encode(img).decode('utf-8')
+
+    start = time.perf_counter()
+    with TestClient(main.app) as client:
+        #The app serves requests once its lifespan has started (database opened, vector index loaded), and is ready once the models are warmed up
+        results['app.startup_s'] = time.perf_counter() - start
+        while client.get('/ready').status_code != 200: time.sleep(0.01)
+        results['app.ready_s'] = time.perf_counter() - start
+
+        #Enrollment: one request per person, each with several images
+        person_imgs = [[encode(make_face_image(person)) for _ in range(args.images_per_person)] for person in range(args.enroll)]
+        start = time.perf_counter()
+        for person, imgs in enumerate(person_imgs):
+            response = client.post('/FR/person/', json={'name': 'enrolled_{}'.format(person), 'images': imgs})
+            response.raise_for_status()
+        results['app.enrollment_images_per_s'] = args.enroll * args.images_per_person / (time.perf_counter() - start)
+
+        #Detection, with synthetic vectors added to the vector index so that it has the size of a large gallery
+        if args.app_gallery:
+            FRroutes.fr_manager.add_to_vector_index_multi(['synthetic_{}'.format(idx) for idx in range(args.app_gallery)], list(make_gallery(args.app_gallery, seed=3)))
+
+        detection_imgs = [(person, encode(make_face_image(person, args.image_width, args.image_height))) for person in np.random.default_rng(4).integers(0, args.enroll, args.detections)]
+        for _, img in detection_imgs[:5]: client.post('/FR/detection/', json={'image_data': img}, params={'top_n': 10}) #warm-up
+
+        times, correct = [], 0
+        for person, img in detection_imgs:
+            response, elapsed = timed_ms(client.post, '/FR/detection/', json={'image_data': img}, params={'top_n': 10})
+            response.raise_for_status()
+            times.append(elapsed)
+            correct += response.json()['bboxes'][0]['names'][0] == 'enrolled_{}'.format(person)
+        results.update({'app.' + key: value for key, value in percentiles(times, 'detection').items()})
+        results['app.detection_requests_per_s'] = len(times) / (sum(times) / 1e3)
+        results['app.detection_top1_accuracy'] = correct / len(times)
+
+        #Repeated detections: the first request of each image fills the caches, then the same request is answered from the result cache
+        #and one with another top_n from the embedding cache
+        FRroutes.fr_manager.result_cache = ResultCache(len(detection_imgs))
+        FRroutes.fr_manager.embedding_cache = ResultCache(len(detection_imgs))
+        for _, img in detection_imgs: client.post('/FR/detection/', json={'image_data': img}, params={'top_n': 10})
+        times = [timed_ms(client.post, '/FR/detection/', json={'image_data': img}, params={'top_n': 10})[1] for _, img in detection_imgs]
+        results.update({'app.' + key: value for key, value in percentiles(times, 'detection_repeat').items()})
+        times = [timed_ms(client.post, '/FR/detection/', json={'image_data': img}, params={'top_n': 5})[1] for _, img in detection_imgs]
+        results.update({'app.' + key: value for key, value in percentiles(times, 'detection_repeat_top_n').items()})
+
+        #Detection history
+        with Session(engine) as session:
+            first_time = datetime(2000, 1, 1)
+            for idx in range(0, args.history, 10000):
+                detections = [dict(id='{:032x}'.format(idx + offset), date_time=first_time + timedelta(seconds=idx + offset), image='history.jpg')
+                              for offset in range(min(10000, args.history - idx))]
+                session.execute(insert(Detection_SQL), detections)
+                session.execute(insert(Face), [dict(id='{:032x}'.format(args.history + int(detection['id'], 16)), bbox=[0, 0, 100, 100],
+                                                    names=['enrolled_0'] * 10, probs=[0.1] * 10, detection_id=detection['id']) for detection in detections])
+            session.commit()
+
+        params = {'limit': args.page_size, 'descending': True, 'img_format': 'url'}
+        times = [timed_ms(client.get, '/FR/detection/', params=params)[1] for _ in range(20)]
+        results.update({'app.' + key: value for key, value in percentiles(times, 'history_first_page').items()})
+
+        #Walk all pages with cursors, timing the pages of the oldest tenth of the history
+        times, cursor, page = [], None, 0
+        while True:
+            response, elapsed = timed_ms(client.get, '/FR/detection/', params=dict(params, **({'after': cursor} if cursor else {})))
+            page += 1
+            if page * args.page_size >= 0.9 * args.history: times.append(elapsed)
+            cursor = response.headers.get('X-Next-Cursor')
+            if not cursor: break
+        results.update({'app.' + key: value for key, value in percentiles(times, 'history_deep_page').items()})
+
+        deep_offset = max(0, args.history - args.page_size)
+        times = [timed_ms(client.get, '/FR/detection/', params=dict(params, offset=deep_offset))[1] for _ in range(5)]
+        results['app.history_deep_offset_page_p50_ms'] = float(np.percentile(times, 50))
+
+    print_results(results, 'app.')
+    return results
+
+def print_results(results: dict[str, float], prefix: str) -> None:
+    for key, value in results.items():
+        if key.startswith(prefix): print('{:<60} {:14.4f}'.format(key, value))
+
+def git_commit() -> str | None:
+    try: return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=SERVER_DIR, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError): return None
+
+def metric_direction(key: str) -> int:
+    """
+    Returns 1 if higher values of the metric are better, -1 if lower values are better, and 0 if neither
+    """
+    if key.endswith(('_per_s', '_accuracy')): return 1
+    if key.endswith(('_ms', '_s', '_mb')): return -1
+    return 0
+
+def compare(baseline_path: str, results_path: str, tolerance: float) -> int:
+    """
+    Prints the change of every metric in both results files, and returns the number of metrics worse by more than tolerance
+    """
+    with open(baseline_path) as file: baseline = json.load(file)['results']
+    with open(results_path) as file: results = json.load(file)['results']
+
+    regressions = 0
+    for key in sorted(set(baseline) & set(results)):
+        direction = metric_direction(key)
+        change = (results[key] - baseline[key]) / baseline[key] if baseline[key] else 0.0
+        regressed = direction != 0 and -direction * change > tolerance
+        regressions += regressed
+        print('{:<60} {:14.4f} -> {:14.4f} {:+8.1%}{}'.format(key, baseline[key], results[key], change, '  REGRESSION' if regressed else ''))
+
+    print('{} of {} metrics regressed by more than {:.0%}'.format(regressions, len(set(baseline) & set(results)), tolerance))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sections', nargs='+', choices=('index', 'startup', 'app'), default=['index', 'startup', 'app'])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000], help='gallery sizes of the index and startup sections')
+    parser.add_argument('--queries', type=int, default=200, help='queries per gallery size in the index section')
+    parser.add_argument('--batch-size', type=int, default=32, help='queries per batch in the index section')
+    parser.add_argument('--enroll', type=int, default=100, help='people enrolled through the app')
+    parser.add_argument('--images-per-person', type=int, default=3)
+    parser.add_argument('--app-gallery', type=int, default=10000, help='synthetic vectors added to the vector index of the app')
+    parser.add_argument('--detections', type=int, default=200, help='detection requests timed')
+    parser.add_argument('--image-width', type=int, default=1280)
+    parser.add_argument('--image-height', type=int, default=720)
+    parser.add_argument('--history', type=int, default=100000, help='detections in the history')
+    parser.add_argument('--page-size', type=int, default=30)
+    parser.add_argument('--faces-per-image', type=int, default=1)
+    parser.add_argument('--fake-detection-ms', type=float, default=0.0, help='simulated detection time per image')
+    parser.add_argument('--fake-recognition-ms', type=float, default=0.0, help='simulated recognition time per face')
+    parser.add_argument('--output', default='', help='results file [benchmark-<time>.json]')
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'RESULTS'), help='compare two results files instead of running benchmarks')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='relative change of a metric reported as a regression by --compare')
+    args = parser.parse_args()
+
+    if args.compare: sys.exit(1 if compare(*args.compare, args.tolerance) else 0)
+    output = os.path.abspath(args.output or 'benchmark-{}.json'.format(datetime.now().strftime('%Y%m%d-%H%M%S')))
+
+    #The server keeps its database, images and snapshots relative to the working directory, so it runs in a temporary one
+    #(modules are still imported from the server directory)
+    workdir = tempfile.mkdtemp(prefix='fr-benchmark-')
+    sys.path.insert(0, SERVER_DIR)
+    os.chdir(workdir)
+    os.environ.update(FR_MODEL_FACTORY='benchmarks.fake_model:FakeFaceAnalysis', FR_LOG_LEVEL=os.environ.get('FR_LOG_LEVEL', 'WARNING'),
+                      FR_RESULT_CACHE_SIZE='0', FR_EMBEDDING_CACHE_SIZE='0')
+
+    from config import FR_MANAGER_OPTIONS
+    from benchmarks.fake_model import FakeFaceAnalysis
+    FakeFaceAnalysis.faces_per_image = args.faces_per_image
+    FakeFaceAnalysis.detection_delay = args.fake_detection_ms / 1e3
+    FakeFaceAnalysis.recognition_delay = args.fake_recognition_ms / 1e3
+
+    results = {}
+    if 'index' in args.sections: results.update(bench_index(args.sizes, args.queries, args.batch_size, FR_MANAGER_OPTIONS))
+    if 'startup' in args.sections: results.update(bench_startup(args.sizes, workdir, FR_MANAGER_OPTIONS))
+    if 'app' in args.sections: results.update(bench_app(args))
+
+    meta = {
+        'time': datetime.now().isoformat(timespec='seconds'),
+        'git_commit': git_commit(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'arguments': {key: value for key, value in vars(args).items() if key not in ('output', 'compare', 'tolerance')},
+        'fr_manager_options': {key: value for key, value in FR_MANAGER_OPTIONS.items() if isinstance(value, (str, int, float, bool, type(None)))}
+    }
+    with open(output, 'w') as file: json.dump({'meta': meta, 'results': results}, file, indent=2)
+    print('Results written to {}'.format(output))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+"""
+Offline importer for filling the personnel database from a folder of images
+
+Images are grouped per person following the naming convention in ReadME.md ('XXyy.jpg', 'XXyy (1).jpg', ...).
+Run from the server directory while the server is stopped (the server loads the vector index on start-up):
+    python bulk_import.py <folder> [--recursive] [--chunk-size 256]
+"""
+import argparse
+import logging
+import zipfile
+
+from sqlmodel import Session
+
+from config import VECTOR_INDEX_SNAPSHOT_PATH, FR_MANAGER_OPTIONS, LOG_LEVEL
+from managers.FRManager import FRManager
+from database.database import engine, init_database
+from database.imgfs import init_img_filesystem, iter_img_folder, iter_img_zip, group_img_sources
+from database.Personnel import init_PersonFR_search, load_PersonFR_vector_index, bulk_add_PersonFR
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('source', help='folder (or zip archive) containing images named after each individual')
+    parser.add_argument('--recursive', action='store_true', help='also import images in sub-folders')
+    parser.add_argument('--chunk-size', type=int, default=256, help='number of individuals written per transaction')
+    args = parser.parse_args()
+    logging.basicConfig(level=LOG_LEVEL, format='%(levelname)s %(name)s: %(message)s')
+
+    init_img_filesystem()
+    init_database()
+
+    with Session(engine) as session:
+        init_PersonFR_search(session)
+        fr_manager = FRManager(**FR_MANAGER_OPTIONS)
+        load_PersonFR_vector_index(session, fr_manager, VECTOR_INDEX_SNAPSHOT_PATH)
+
+        if zipfile.is_zipfile(args.source):
+            with zipfile.ZipFile(args.source) as zip_file:
+                summary = bulk_add_PersonFR(session, group_img_sources(iter_img_zip(zip_file)), fr_manager, args.chunk_size)
+        else:
+            summary = bulk_add_PersonFR(session, group_img_sources(iter_img_folder(args.source, args.recursive)), fr_manager, args.chunk_size)
+
+    #Save the updated vector index so the server does not have to catch up on the whole import when it starts
+    if VECTOR_INDEX_SNAPSHOT_PATH: fr_manager.save_snapshot(VECTOR_INDEX_SNAPSHOT_PATH)
+
+    print("Added: {}, Updated: {}, Skipped (no face found, or image could not be read): {}".format(len(summary.added), len(summary.updated), len(summary.skipped)))
+    for name in summary.skipped: print("SKIPPED: {}".format(name))
+
+if __name__ == '__main__':
+    main()
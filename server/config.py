@@ -0,0 +1,145 @@
+"""
+Server configuration, read from environment variables (defaults in brackets)
+"""
+import os
+
+#SQLite database file ['frdatabase.db']
+DB_PATH = os.environ.get('FR_DB_PATH', 'frdatabase.db')
+#Log every SQL statement, 1 or 0 [0]
+DB_ECHO = os.environ.get('FR_DB_ECHO', '0') == '1'
+#SQLite journal mode; WAL lets history/person reads run while detections are written (DELETE was used before) ['WAL']
+DB_JOURNAL_MODE = os.environ.get('FR_DB_JOURNAL_MODE', 'WAL')
+#SQLite synchronous setting; NORMAL is safe with WAL, only the last commits may be lost on power loss (FULL was used before) ['NORMAL']
+DB_SYNCHRONOUS = os.environ.get('FR_DB_SYNCHRONOUS', 'NORMAL')
+#Bytes of the database file memory-mapped for reads [268435456]
+DB_MMAP_SIZE = int(os.environ.get('FR_DB_MMAP_SIZE', 256 * 1024 * 1024))
+#SQLite page cache per connection, in KiB if negative [-65536]
+DB_CACHE_SIZE = int(os.environ.get('FR_DB_CACHE_SIZE', -64 * 1024))
+#Milliseconds a connection waits for a lock before failing with "database is locked" [5000]
+DB_BUSY_TIMEOUT = int(os.environ.get('FR_DB_BUSY_TIMEOUT', 5000))
+#Connections kept open in the pool [8], and extra connections opened under load [8]
+DB_POOL_SIZE = int(os.environ.get('FR_DB_POOL_SIZE', 8))
+DB_POOL_MAX_OVERFLOW = int(os.environ.get('FR_DB_POOL_MAX_OVERFLOW', 8))
+
+#Vector index snapshot ('' disables snapshots) ['temp/vector_index']
+VECTOR_INDEX_SNAPSHOT_PATH = os.environ.get('FR_VECTOR_INDEX_SNAPSHOT_PATH', 'temp/vector_index')
+#Seconds between checks for unsaved changes to the vector index [60]
+VECTOR_INDEX_SNAPSHOT_INTERVAL = float(os.environ.get('FR_VECTOR_INDEX_SNAPSHOT_INTERVAL', 60))
+
+#Vectors indexed per individual: 'average' (one average embedding) or 'all' (one embedding per enrolled image) ['average']
+GALLERY_MODE = os.environ.get('FR_GALLERY_MODE', 'average')
+#How matches to several images of an individual are combined in the 'all' gallery mode: 'max' or 'topk_mean' ['max']
+GALLERY_AGGREGATION = os.environ.get('FR_GALLERY_AGGREGATION', 'max')
+#Number of closest images averaged by the 'topk_mean' aggregation [3]
+GALLERY_AGGREGATION_K = int(os.environ.get('FR_GALLERY_AGGREGATION_K', 3))
+#Neighbours fetched per requested match in the 'all' gallery mode [5]
+GALLERY_OVERFETCH = int(os.environ.get('FR_GALLERY_OVERFETCH', 5))
+#Precision of stored embeddings: 'float32', 'float16' or 'int8' ('int8' also stores the vector index with 8-bit components) ['float32']
+EMBEDDING_DTYPE = os.environ.get('FR_EMBEDDING_DTYPE', 'float32')
+#How the vector index is searched: 'hnsw' (approximate), 'exact' (matrix multiplication with every vector) or 'auto' ['hnsw']
+SEARCH_BACKEND = os.environ.get('FR_SEARCH_BACKEND', 'hnsw')
+#Largest number of vectors searched exactly by the 'auto' search backend (an HNSW index moves back to exact search at half as many) [100000]
+EXACT_SEARCH_MAX_SIZE = int(os.environ.get('FR_EXACT_SEARCH_MAX_SIZE', 100000))
+#HNSW index parameters (see managers.SearchBackend.HNSWBackend; tune_index.py measures their effect on recall, speed and memory):
+#links per vector [12], candidates searched per insertion [200], candidates searched per query [64], and vectors allocated for up front [1]
+HNSW_M = int(os.environ.get('FR_HNSW_M', 12))
+HNSW_EF_CONSTRUCTION = int(os.environ.get('FR_HNSW_EF_CONSTRUCTION', 200))
+HNSW_EF = int(os.environ.get('FR_HNSW_EF', 64))
+HNSW_MAX_ELEMENTS = int(os.environ.get('FR_HNSW_MAX_ELEMENTS', 1))
+
+#Detection requests whose recognition and vector index search are run as one batch (0 or 1 disables micro-batching) [0]
+MICROBATCH_MAX_SIZE = int(os.environ.get('FR_MICROBATCH_MAX_SIZE', 0))
+#Milliseconds a batch waits for more detection requests after its first one arrived [5]
+MICROBATCH_MAX_WAIT_MS = float(os.environ.get('FR_MICROBATCH_MAX_WAIT_MS', 5))
+
+#Images larger than this (longest side in pixels) are downscaled before detection; 0 disables downscaling [0]
+INFER_MAX_INPUT_SIDE = int(os.environ.get('FR_INFER_MAX_INPUT_SIDE', 0))
+#Downscale large JPEGs while decoding them (PIL draft mode), 1 or 0 [1]
+INFER_FAST_DECODE = os.environ.get('FR_INFER_FAST_DECODE', '1') == '1'
+
+#Side in pixels of the face detector input; larger finds smaller faces (e.g. in group photos) but is slower [640]
+DET_SIZE = int(os.environ.get('FR_DET_SIZE', 640))
+#Minimum detection score of a face [0.5]
+DET_THRESHOLD = float(os.environ.get('FR_DET_THRESHOLD', 0.5))
+#Detect at this smaller size first, and again at FR_DET_SIZE only if no face is found or the faces found are tiny (0 disables the cascade) [0]; 
+#faces smaller than FR_DET_CASCADE_MIN_FACE pixels at FR_DET_CASCADE_SIZE count as tiny [24] (benchmarks/bench_detection.py compares settings)
+DET_CASCADE_SIZE = int(os.environ.get('FR_DET_CASCADE_SIZE', 0))
+DET_CASCADE_MIN_FACE = int(os.environ.get('FR_DET_CASCADE_MIN_FACE', 24))
+
+#Faces recognised per image: only those of at least this quality (0 to 1, from their size, detection score, pose and sharpness; 
+#see managers.FaceQuality) [0], and at most this many of the best quality (0 for no limit) [0]
+FACE_MIN_QUALITY = float(os.environ.get('FR_FACE_MIN_QUALITY', 0))
+MAX_FACES_PER_IMAGE = int(os.environ.get('FR_MAX_FACES_PER_IMAGE', 0))
+#Also return (and store in the history) the faces that were not recognised, with their box and no matches, 1 or 0 [0]
+REPORT_SKIPPED_FACES = os.environ.get('FR_REPORT_SKIPPED_FACES', '0') == '1'
+
+#Detection results kept for images sent again (0 disables the cache) [256], and seconds they are kept for [300]; 
+#results are also dropped as soon as the people enrolled change
+RESULT_CACHE_SIZE = int(os.environ.get('FR_RESULT_CACHE_SIZE', 256))
+RESULT_CACHE_TTL = float(os.environ.get('FR_RESULT_CACHE_TTL', 300))
+#Faces and embeddings kept for images sent again, reused when the results are not cached (e.g. another top_n) (0 disables the cache) [1024]
+EMBEDDING_CACHE_SIZE = int(os.environ.get('FR_EMBEDDING_CACHE_SIZE', 1024))
+
+#Import path ('module:function') of a function returning the face model to use instead of InsightFace's FaceAnalysis, e.g. 
+#'benchmarks.fake_model:FakeFaceAnalysis' to run without model downloads ['']
+MODEL_FACTORY = os.environ.get('FR_MODEL_FACTORY', '')
+
+#Keyword arguments of managers.FRManager.FRManager
+FR_MANAGER_OPTIONS = dict(
+    gallery_mode=GALLERY_MODE,
+    aggregation=GALLERY_AGGREGATION,
+    aggregation_k=GALLERY_AGGREGATION_K,
+    overfetch=GALLERY_OVERFETCH,
+    microbatch_max_size=MICROBATCH_MAX_SIZE,
+    microbatch_max_wait=MICROBATCH_MAX_WAIT_MS / 1000,
+    max_input_side=INFER_MAX_INPUT_SIDE,
+    fast_decode=INFER_FAST_DECODE,
+    embedding_dtype=EMBEDDING_DTYPE,
+    search_backend=SEARCH_BACKEND,
+    exact_max_size=EXACT_SEARCH_MAX_SIZE,
+    hnsw_m=HNSW_M,
+    hnsw_ef_construction=HNSW_EF_CONSTRUCTION,
+    hnsw_ef=HNSW_EF,
+    hnsw_max_elements=HNSW_MAX_ELEMENTS,
+    result_cache_size=RESULT_CACHE_SIZE,
+    result_cache_ttl=RESULT_CACHE_TTL,
+    embedding_cache_size=EMBEDDING_CACHE_SIZE,
+    det_size=DET_SIZE,
+    det_threshold=DET_THRESHOLD,
+    det_cascade_size=DET_CASCADE_SIZE,
+    det_cascade_min_face=DET_CASCADE_MIN_FACE,
+    min_face_quality=FACE_MIN_QUALITY,
+    max_faces=MAX_FACES_PER_IMAGE,
+    report_skipped_faces=REPORT_SKIPPED_FACES,
+    model_factory=MODEL_FACTORY or None
+)
+
+#Worker threads running model inference, each with its own model session [2]
+INFERENCE_WORKERS = int(os.environ.get('FR_INFERENCE_WORKERS', 2))
+#Requests waiting for an inference worker before new ones are rejected with 429 [16]
+INFERENCE_QUEUE_SIZE = int(os.environ.get('FR_INFERENCE_QUEUE_SIZE', 16))
+#Seconds a detection request may take, or an enrollment may wait for a worker, before responding with 504 (bulk imports have no timeout) [30]
+INFERENCE_TIMEOUT = float(os.environ.get('FR_INFERENCE_TIMEOUT', 30))
+
+#Directory of the video files POST /FR/detection/stream/ may read, given as paths relative to it ('' allows no files) ['']
+STREAM_SOURCE_DIR = os.environ.get('FR_STREAM_SOURCE_DIR', '')
+#Comma-separated URL prefixes (scheme, host, port and path, e.g. 'rtsp://camera1:554/live') of the streams it may read ('' allows no URLs) ['']
+STREAM_URL_ALLOWLIST = [url.strip() for url in os.environ.get('FR_STREAM_URL_ALLOWLIST', '').split(',') if url.strip()]
+#Longest stream request, both in seconds of video (max_seconds) and in seconds of processing [300]
+STREAM_MAX_SECONDS = float(os.environ.get('FR_STREAM_MAX_SECONDS', 300))
+#Worker threads running stream requests, each with its own model session (apart from the inference workers, so streams never hold up detections) [1]
+STREAM_WORKERS = int(os.environ.get('FR_STREAM_WORKERS', 1))
+#Stream requests waiting for a stream worker before new ones are rejected with 429 (a request that got a worker within FR_INFERENCE_TIMEOUT seconds runs until done) [2]
+STREAM_QUEUE_SIZE = int(os.environ.get('FR_STREAM_QUEUE_SIZE', 2))
+
+#Bytes of image thumbnails kept in memory [64 MB]
+THUMBNAIL_CACHE_BYTES = int(os.environ.get('FR_THUMBNAIL_CACHE_BYTES', 64 * 1024 * 1024))
+#Detection images waiting to be written to disk by the background writer before detections wait for room [64]
+IMG_WRITER_QUEUE_SIZE = int(os.environ.get('FR_IMG_WRITER_QUEUE_SIZE', 64))
+#fsync every detection image written (slower, but saved images survive a power loss), 1 or 0 [0]
+IMG_WRITER_FSYNC = os.environ.get('FR_IMG_WRITER_FSYNC', '0') == '1'
+
+#Level of the server's log messages (DEBUG also logs every change to the vector index) ['INFO']
+LOG_LEVEL = os.environ.get('FR_LOG_LEVEL', 'INFO').upper()
+#Record an OpenTelemetry span for every timed stage of a request (requires opentelemetry-api, and an SDK to export them), 1 or 0 [0]
+OTEL_ENABLED = os.environ.get('FR_OTEL_ENABLED', '0') == '1'
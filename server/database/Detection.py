@@ -1,13 +1,22 @@
-from sqlmodel import Session, SQLModel, Column, JSON, Field, select, delete, Relationship
-import os
+from sqlmodel import Session, SQLModel, Column, JSON, Field, Index, select, delete, Relationship
+from sqlalchemy import tuple_
+from sqlalchemy.orm import selectinload
+from typing import IO
+import base64
+import io
 from datetime import datetime, time, timedelta
 import uuid
 
+from PIL import Image
+
+from metrics import timed
 from managers.FRManager import FRManager
+from managers.VideoSource import iter_video_frames
 from database.database import ResponseMessage, MessageType
-from database.imgfs import save_img_to_file, fetch_img_from_file, reset_img_db, INFERENCE_IMGS_DIR
+from database.imgfs import save_img_bytes_to_file, fetch_img, reset_img_db, ImgFormat
 
 DATE_STR_FORMAT = '%Y%m%d'
+CURSOR_SEPARATOR = '_' #cursor of a detection is '<date_time in ISO format>_<id>' (see get_detections)
 
 def generate_uuid():
     #x = uuid.uuid1().hex
@@ -17,25 +26,37 @@ def generate_uuid():
 class Detection_Create(SQLModel):
     image_data: str #base64 str image data
     
+class Detection_Stream(SQLModel):
+    source: str #path of a video file relative to FR_STREAM_SOURCE_DIR, or URL of a stream in FR_STREAM_URL_ALLOWLIST (e.g. rtsp://...)
+    sample_fps: float = 5.0 #frames per second of video processed
+    max_seconds: float = 60.0 #seconds of video processed, at most FR_STREAM_MAX_SECONDS (a live stream never ends)
+    loop: bool = False #start a video file again when it ends (e.g. to stand in for a stream)
+
 class Detection_Read(SQLModel):
     id: str
     date_time: str #datetime converted to string in ISO format
-    image_data: str #base64 str image data
+    image_data: str #base64 str image data, or image URL / base64 thumbnail (see ImgFormat)
     bboxes: list["Face_Read"]  = []
     
     class Config:
         arbitrary_types_allowed=True
         
     @classmethod
-    def model_validate_from_sql(cls, detection_sql: 'Detection_SQL') -> 'Detection_Read':
+    def model_validate_from_sql(cls, detection_sql: 'Detection_SQL', img_format: ImgFormat = ImgFormat.base64, image_data: str | None = None) -> 'Detection_Read':
+        """
+        image_data: base64 image data already in memory, returned instead of reading the image file
+        """
         return cls(
                 id=detection_sql.id,
                 date_time=detection_sql.date_time.isoformat(),
-                image_data=fetch_img_from_file(detection_sql.image, 1, detection_sql.date_time.strftime(DATE_STR_FORMAT)),
+                image_data=image_data or fetch_img(detection_sql.image, 1, detection_sql.date_time.strftime(DATE_STR_FORMAT), img_format),
                 bboxes = detection_sql.bboxes
                 )
     
 class Detection_SQL(SQLModel, table = True):
+    #Serves date range filters and keyset pagination ordered by (date_time, id)
+    __table_args__ = (Index('ix_detection_sql_date_time_id', 'date_time', 'id'),)
+    
     id: str = Field(default_factory=generate_uuid, primary_key=True)
     date_time: datetime
     image: str #Reference to image folder
@@ -57,21 +78,34 @@ class Face(SQLModel, table = True):
     names: list[str] = Field(default=[], sa_column=Column(JSON))
     probs: list[float] = Field(default=[], sa_column=Column(JSON))
     
-    detection_id: str = Field(foreign_key='detection_sql.id')
+    detection_id: str = Field(foreign_key='detection_sql.id', index=True)
     detection: Detection_SQL = Relationship(back_populates='bboxes')
     
     class Config:
         arbitrary_types_allowed=True
         
-def get_detections(session: Session, id: str | None = None, dateRange: str | None = None, offset: int | None = None, limit: int | None = 30) -> Detection_Read:
+def get_detection_cursor(detection: Detection_Read | Detection_SQL) -> str:
+    """
+    Returns the cursor to pass as after to get_detections to continue after the given detection
+    """
+    date_time = detection.date_time if isinstance(detection.date_time, str) else detection.date_time.isoformat()
+    return '{}{}{}'.format(date_time, CURSOR_SEPARATOR, detection.id)
+
+def get_detections(session: Session, id: str | None = None, dateRange: str | None = None, offset: int | None = None, limit: int | None = 30, 
+                   img_format: ImgFormat = ImgFormat.base64, after: str | None = None, descending: bool = False) -> list[Detection_Read]:
     """
-    Returns detection info
+    Returns detection info, ordered by date_time (then id)
     
     date: filter by this date
-    offset: discount the first x results
+    offset: discount the first x results (slow deep into the history; prefer after)
     limit: limit to the first x results
+    img_format: return images as base64, URLs or thumbnails
+    after: cursor of the last detection of the previous page (see get_detection_cursor); the page continues after it
+    descending: newest detections first
+    
+    Raises ValueError if after is not a valid cursor
     """    
-    statement = select(Detection_SQL)
+    statement = select(Detection_SQL).options(selectinload(Detection_SQL.bboxes)) #faces of the whole page in one query
     
     if id: statement = statement.where(Detection_SQL.id == id)
     if dateRange: 
@@ -83,31 +117,39 @@ def get_detections(session: Session, id: str | None = None, dateRange: str | Non
         end = datetime.combine(end_date + timedelta(days=1), time(0, 0, 0))
         
         statement = statement.where(Detection_SQL.date_time >=  start).where(Detection_SQL.date_time < end)
+    if after:
+        after_date_time, _, after_id = after.rpartition(CURSOR_SEPARATOR)
+        key, after_key = tuple_(Detection_SQL.date_time, Detection_SQL.id), tuple_(datetime.fromisoformat(after_date_time), after_id)
+        statement = statement.where(key < after_key if descending else key > after_key)
+    
+    if descending: statement = statement.order_by(Detection_SQL.date_time.desc(), Detection_SQL.id.desc())
+    else: statement = statement.order_by(Detection_SQL.date_time, Detection_SQL.id)
     if offset: statement = statement.offset(offset)
     if limit: statement = statement.limit(limit)
     
-    print(statement)
-    
     detections_sql = session.exec(statement).all()
     
-    return [Detection_Read.model_validate_from_sql(detection_sql) for detection_sql in detections_sql]
+    return [Detection_Read.model_validate_from_sql(detection_sql, img_format) for detection_sql in detections_sql]
     
-def add_detections(session: Session, fr_manager: FRManager, image_data: str, top_n: int = 10) -> Detection_Read:
+def add_detections(session: Session, fr_manager: FRManager, image_data: str | None = None, top_n: int = 10, image_file: IO[bytes] | None = None) -> Detection_Read:
     """
     Creates new detection info and returns it 
     
     fr_manager: instance of FRManager created
     image_data: data of image sent represented as a base64 string
+    image_file: binary file object of the image sent (multipart/raw uploads), used instead of image_data
+    
+    The image is decoded once from memory for inference, while it is written to disk in the background (see imgfs.BackgroundImgWriter)
     """
     curr_datetime = datetime.now()
     curr_date = curr_datetime.strftime(DATE_STR_FORMAT)
     detection_uuid = uuid.uuid1().hex
     
-    img_filename = save_img_to_file(image_data, 1, date_str=curr_date, file_uuid=detection_uuid)
-    results = fr_manager.infer(img_filepath=os.path.join(INFERENCE_IMGS_DIR, 
-                                                      curr_date, 
-                                                      img_filename), 
-                            k=top_n)
+    if image_file is not None: img_bytes = image_file.read()
+    else:
+        with timed('base64_decode'): img_bytes = base64.b64decode(image_data.encode('utf-8'))
+    img_filename = save_img_bytes_to_file(img_bytes, 1, date_str=curr_date, file_uuid=detection_uuid)
+    results = fr_manager.infer(img=img_bytes, k=top_n)
     
     if len(results) == 0: return None
     
@@ -128,10 +170,52 @@ def add_detections(session: Session, fr_manager: FRManager, image_data: str, top
     )
         
     session.add(detection_sql)
-    session.commit()
+    with timed('db_commit'): session.commit()
     session.refresh(detection_sql)
     
-    return Detection_Read.model_validate_from_sql(detection_sql)
+    return Detection_Read.model_validate_from_sql(detection_sql, image_data=image_data or base64.b64encode(img_bytes).decode('utf-8'))
+
+def add_stream_detections(session: Session, fr_manager: FRManager, stream: Detection_Stream, top_n: int = 10, img_format: ImgFormat = ImgFormat.url,
+                          timeout: float | None = None) -> list[Detection_Read]:
+    """
+    Runs inference on a video file or stream, creating one detection per tracked face instead of one per frame (see FRManager.infer_stream)
+    
+    fr_manager: instance of FRManager created
+    stream: video source (already checked with VideoSource.resolve_video_source) and how much of it to process
+    top_n: number of matches returned per face
+    img_format: how images are returned; each detection's image is the frame its face was best recognised in
+    timeout: seconds after which no more frames are read (the faces tracked by then are still stored)
+    
+    Detections are committed as their tracks end, and dated by when their face first appeared.
+    Raises ValueError if the source cannot be opened.
+    """
+    start_datetime = datetime.now()
+    frames = iter_video_frames(stream.source, stream.sample_fps, stream.max_seconds, stream.loop, timeout=timeout)
+    
+    detections = []
+    for track in fr_manager.infer_stream(frames, k=top_n):
+        date_time = start_datetime + timedelta(seconds=track.first_seen)
+        detection_uuid = uuid.uuid1().hex
+        
+        img_buffer = io.BytesIO()
+        Image.fromarray(track.frame).save(img_buffer, format='JPEG', quality=90)
+        img_bytes = img_buffer.getvalue()
+        img_filename = save_img_bytes_to_file(img_bytes, 1, date_str=date_time.strftime(DATE_STR_FORMAT), file_uuid=detection_uuid)
+        
+        detection_sql = Detection_SQL(
+            id=detection_uuid,
+            date_time=date_time,
+            image=img_filename,
+            bboxes=[Face(bbox=track.face['bbox'], names=track.names, probs=track.sim_scores)]
+        )
+        session.add(detection_sql)
+        with timed('db_commit'): session.commit()
+        session.refresh(detection_sql)
+        
+        image_data = base64.b64encode(img_bytes).decode('utf-8') if img_format == ImgFormat.base64 else None
+        detections.append(Detection_Read.model_validate_from_sql(detection_sql, img_format, image_data=image_data))
+    
+    return detections
 
 def delete_detections(session: Session, id:str) -> ResponseMessage:
     """
@@ -152,7 +236,7 @@ def delete_detections(session: Session, id:str) -> ResponseMessage:
     for face in detection_sql.bboxes:
         session.delete(face)
     session.delete(detection_sql)
-    session.commit()
+    with timed('db_commit'): session.commit()
     
     return ResponseMessage(
             type=MessageType.success,
@@ -166,7 +250,7 @@ def delete_all_detections(session: Session) -> ResponseMessage:
     
     session.exec(delete(Detection_SQL))
     session.exec(delete(Face))
-    session.commit()
+    with timed('db_commit'): session.commit()
     reset_img_db([1])
     
     return ResponseMessage(
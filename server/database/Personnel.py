@@ -1,10 +1,34 @@
-from sqlmodel import Field, Session, SQLModel, select, Column, JSON, delete
+from sqlmodel import Field, Session, SQLModel, select, Column, JSON, delete, text
+from sqlalchemy import literal_column, table
+from sqlalchemy.orm import load_only
+from sqlalchemy.exc import DatabaseError
 import numpy as np
 import os
-
+import base64
+import threading
+import functools
+import logging
+import zipfile
+from typing import IO, Callable
+
+from metrics import timed
 from managers.FRManager import FRManager
+from managers.EmbeddingStore import encode_embeddings, decode_embeddings
 from database.database import ResponseMessage, MessageType
-from database.imgfs import save_img_to_file, fetch_img_from_file, rename_img_folder, reset_img_folder, reset_img_db, DATABASE_IMGS_DIR
+from database.imgfs import save_img_to_file, save_img_fileobj_to_file, write_img_bytes_to_file, fetch_img_from_file, fetch_img, ImgFormat, rename_img_folder, reset_img_folder, reset_img_db, \
+    hash_img_data, get_img_hash, delete_img_files, ImgSource, DATABASE_IMGS_DIR
+
+logger = logging.getLogger(__name__)
+
+#Changes to personnel records run one at a time (they may run on several inference workers), so that gallery generations 
+#are committed and applied to the vector index in the same order
+gallery_write_lock = threading.RLock()
+
+def gallery_write(fn: Callable) -> Callable:
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with gallery_write_lock: return fn(*args, **kwargs)
+    return wrapper
 
 class PersonnelFR_Base(SQLModel):
     #honorific: str | None = None
@@ -14,11 +38,11 @@ class PersonnelFR_Base(SQLModel):
 class PersonnelFR_Read(PersonnelFR_Base):
     
     @classmethod 
-    def model_validate_from_sql(cls, person_sql: 'PersonnelFR_SQL') -> 'PersonnelFR_Read':
+    def model_validate_from_sql(cls, person_sql: 'PersonnelFR_SQL', img_format: ImgFormat = ImgFormat.base64) -> 'PersonnelFR_Read':
         return cls(
             #honorific=person_sql.honorific,
             name=person_sql.name,
-            images=[fetch_img_from_file(img, mode=0, details=person_sql.name) for img in person_sql.images]
+            images=[fetch_img(img, mode=0, details=person_sql.name, img_format=img_format) for img in person_sql.images]
         )
 
 class PersonnelFR_Update(PersonnelFR_Base):
@@ -27,6 +51,23 @@ class PersonnelFR_Update(PersonnelFR_Base):
     """
     new_images: list[str] | None = None
 
+class PersonnelFR_Summary(SQLModel):
+    """
+    Lightweight listing entry of a person (for search results; no image data)
+    """
+    name: str
+    image_count: int = 0
+    thumbnail: str | None = None #URL of the thumbnail of the first image
+
+class PersonnelFR_BulkRead(SQLModel):
+    """
+    Summary of a bulk import (names of individuals added, updated with new images, or skipped as no face was found, 
+    and filenames of images skipped as they could not be read or decoded)
+    """
+    added: list[str] = []
+    updated: list[str] = []
+    skipped: list[str] = []
+
 class PersonnelFR_SQL(SQLModel, table=True):
     """
     Model for SQL database
@@ -35,48 +76,199 @@ class PersonnelFR_SQL(SQLModel, table=True):
     #honorific: str | None = None
     name: str = Field(primary_key=True)
     images: list[str] | None = Field(default=None, sa_column=Column(JSON))
+    image_hashes: list[str] | None = Field(default=None, sa_column=Column(JSON)) #content hash of each image (see imgfs.hash_img_data), in the order of images and of the rows of embeddings
     embeddings: bytes = bytes()
     ave_embedding: bytes = bytes()
+    embedding_dtype: str = 'float32' #encoding of embeddings and ave_embedding (see managers.EmbeddingStore.encode_embeddings)
+    generation: int = Field(default=0, index=True) #gallery generation at which the row was last changed
 
     class Config:
         arbitrary_types_allowed=True,    
+
+class GalleryState_SQL(SQLModel, table=True):
+    """
+    Single row holding the gallery generation, incremented in the same transaction as every change to personnel records.
+    Compared against the generation of the vector index snapshot to tell whether it is stale.
+    """
+    id: int = Field(default=0, primary_key=True)
+    generation: int = 0
     
+#Full-text index of names: an FTS5 table using the trigram tokenizer (substring search) over the names in personnelfr_sql, 
+#kept in sync by triggers so that every insert, rename and deletion (including bulk ones) updates it in the same transaction
+PERSONNEL_FTS_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS personnel_fts USING fts5(name, content='personnelfr_sql', content_rowid='rowid', tokenize='trigram')",
+    "CREATE TRIGGER IF NOT EXISTS personnel_fts_insert AFTER INSERT ON personnelfr_sql BEGIN "
+        "INSERT INTO personnel_fts(rowid, name) VALUES (new.rowid, new.name); END",
+    "CREATE TRIGGER IF NOT EXISTS personnel_fts_delete AFTER DELETE ON personnelfr_sql BEGIN "
+        "INSERT INTO personnel_fts(personnel_fts, rowid, name) VALUES ('delete', old.rowid, old.name); END",
+    "CREATE TRIGGER IF NOT EXISTS personnel_fts_rename AFTER UPDATE OF name ON personnelfr_sql BEGIN "
+        "INSERT INTO personnel_fts(personnel_fts, rowid, name) VALUES ('delete', old.rowid, old.name); "
+        "INSERT INTO personnel_fts(rowid, name) VALUES (new.rowid, new.name); END"
+]
+FTS_MIN_QUERY_LENGTH = 3 #trigrams need at least 3 characters; shorter queries fall back to LIKE
+
+def init_PersonFR_search(session: Session) -> None:
+    """
+    Creates the name search index and its triggers if needed, and rebuilds the index if it does not match personnelfr_sql
+    (e.g. the database was created before the index existed)
+    """
+    for ddl in PERSONNEL_FTS_DDL: session.exec(text(ddl))
+    
+    try: session.exec(text("INSERT INTO personnel_fts(personnel_fts, rank) VALUES ('integrity-check', 1)"))
+    except DatabaseError:
+        session.rollback()
+        logger.info("Rebuilding personnel name search index")
+        for ddl in PERSONNEL_FTS_DDL: session.exec(text(ddl))
+        session.exec(text("INSERT INTO personnel_fts(personnel_fts) VALUES ('rebuild')"))
+    session.commit()
+
+def PersonFR_name_filter(name: str):
+    """
+    Returns the condition selecting personnel whose name contains name (case insensitive), served by the name search index
+    """
+    if len(name) < FTS_MIN_QUERY_LENGTH: 
+        return PersonnelFR_SQL.name.contains(name, autoescape=True)
+
+    fts_query = '"{}"'.format(name.replace('"', '""')) #quoted so the query is matched as a literal substring
+    fts_match = select(literal_column('rowid')).select_from(table('personnel_fts')).where(literal_column('personnel_fts').op('MATCH')(fts_query))
+    return literal_column('personnelfr_sql.rowid').in_(fts_match)
+
 #embeddings = np.frombuffer(person.embeddings, dtype=np.float32).reshape((-1,512)) if len(person.embeddings) else None,
 #ave_embedding = np.frombuffer(person.embedding, dtype=np.float32) if person.embeddings.any() else None
  
-def get_all_PersonFR(session: Session, name: str | None = None, offset: int | None = None, limit: int | None = None) -> list[PersonnelFR_Read]:
+def get_all_PersonFR(session: Session, name: str | None = None, offset: int | None = None, limit: int | None = None, img_format: ImgFormat = ImgFormat.base64) -> list[PersonnelFR_Read]:
     """
-    Returns all personnel info
+    Returns all personnel info (images as base64, URLs or thumbnails depending on img_format)
     """
-    statement = select(PersonnelFR_SQL)
-    if name: statement = statement.where(PersonnelFR_SQL.name.contains(name)) 
+    statement = select(PersonnelFR_SQL).options(load_only(PersonnelFR_SQL.name, PersonnelFR_SQL.images)).order_by(PersonnelFR_SQL.name)
+    if name: statement = statement.where(PersonFR_name_filter(name)) 
     if offset: statement = statement.offset(offset)
     if limit: statement = statement.limit(limit)
     
     personnel_sql = session.exec(statement).all()
         
-    return [PersonnelFR_Read.model_validate_from_sql(person_sql) for person_sql in personnel_sql]
+    return [PersonnelFR_Read.model_validate_from_sql(person_sql, img_format) for person_sql in personnel_sql]
+
+def search_PersonFR(session: Session, name: str | None = None, after: str | None = None, limit: int = 50) -> list[PersonnelFR_Summary]:
+    """
+    Returns lightweight entries of the personnel whose name contains name, ordered by name
 
-def get_all_PersonFR_embed(session: Session) -> tuple[list[str], list[np.ndarray]]:
+    Arguments
+    name: substring of the name to search for (case insensitive); all personnel if None
+    after: name of the last entry of the previous page; the page continues after it
+    limit: maximum number of entries returned
     """
-    Returns all personnel info
+    statement = select(PersonnelFR_SQL.name, PersonnelFR_SQL.images).order_by(PersonnelFR_SQL.name).limit(limit)
+    if name: statement = statement.where(PersonFR_name_filter(name))
+    if after: statement = statement.where(PersonnelFR_SQL.name > after)
+
+    return [PersonnelFR_Summary(name=person_name, image_count=len(images or []), 
+                                thumbnail=fetch_img(images[0], mode=0, details=person_name, img_format=ImgFormat.thumbnail_url) if images else None)
+            for person_name, images in session.exec(statement).all()]
+
+def get_all_PersonFR_embed(session: Session, all_embeddings: bool = False) -> tuple[list[str], list[np.ndarray]]:
+    """
+    Returns names and average embeddings (or all embeddings) of all personnel with at least 1 face enrolled
     """
 
-    personnel_sql = session.exec(select(PersonnelFR_SQL)).all()
+    return get_PersonFR_embed_since(session, generation=-1, all_embeddings=all_embeddings)
+
+def get_PersonFR_embed_since(session: Session, generation: int, all_embeddings: bool = False) -> tuple[list[str], list[np.ndarray]]:
+    """
+    Returns names and average embeddings of personnel changed after the given gallery generation 
+    (personnel changed to have no faces enrolled are included with an empty embedding, except when loading everything with generation=-1)
+
+    all_embeddings: return an array of all embeddings of each person (shape (number of faces, 512)) instead of the average embedding
+    """
+
+    statement = select(PersonnelFR_SQL.name, PersonnelFR_SQL.embeddings if all_embeddings else PersonnelFR_SQL.ave_embedding, PersonnelFR_SQL.embedding_dtype)
+    if generation >= 0: statement = statement.where(PersonnelFR_SQL.generation > generation)
+    personnel_sql = session.exec(statement).all()
     
-    print("PERSONNEL_SQL RESULTS", len(personnel_sql))
+    logger.debug("Personnel embeddings read: %d", len(personnel_sql))
     
     name_list, vector_list = [], []
-    for person_sql in personnel_sql:
-        #if type(person_sql.ave_embedding)== np.ndarray and person_sql.ave_embedding.shape == (512,):
-        name_list.append(person_sql.name)
-        vector_list.append(np.frombuffer(person_sql.ave_embedding, dtype=np.float32))
+    for name, embedding, embedding_dtype in personnel_sql:
+        if generation < 0 and not embedding: continue
+        name_list.append(name)
+        vectors = decode_embeddings(embedding, embedding_dtype)
+        vector_list.append(vectors if all_embeddings else vectors.reshape(-1))
         
     return name_list, vector_list
 
-def get_one_PersonFR(session: Session, name: str) -> PersonnelFR_Read | ResponseMessage:
+def set_PersonFR_embeddings(person_sql: PersonnelFR_SQL, embeddings_list: np.ndarray | list, ave_embedding: np.ndarray, embedding_dtype: str) -> None:
+    """
+    Stores the embeddings and average embedding of a person, encoded with embedding_dtype (FRManager.embedding_dtype)
+    """
+    person_sql.embeddings = encode_embeddings(embeddings_list, embedding_dtype)
+    person_sql.ave_embedding = encode_embeddings(ave_embedding, embedding_dtype)
+    person_sql.embedding_dtype = embedding_dtype
+
+def get_PersonFR_img_hashes(person_sql: PersonnelFR_SQL, folder_name: str | None = None) -> list[str]:
+    """
+    Returns the content hashes of the images of a person (in the order of person_sql.images), hashing the image files of records saved before hashes were kept
+
+    folder_name: name of the image folder of the person, if it was already renamed
     """
-    Returns info of person with given name
+    if person_sql.image_hashes is not None and len(person_sql.image_hashes) == len(person_sql.images): return list(person_sql.image_hashes)
+
+    img_hashes = []
+    for img in person_sql.images:
+        try: img_hashes.append(get_img_hash(img, mode=0, details=folder_name or person_sql.name))
+        except FileNotFoundError: img_hashes.append('') #matches no image, so the image is replaced if it is sent again
+    return img_hashes
+
+def get_gallery_generation(session: Session) -> int:
+    """
+    Returns the current gallery generation
+    """
+    
+    state = session.get(GalleryState_SQL, 0)
+    return state.generation if state else 0
+
+def bump_gallery_generation(session: Session) -> int:
+    """
+    Increments the gallery generation (committed together with the rest of the session) and returns the new generation
+    """
+    
+    state = session.get(GalleryState_SQL, 0) or GalleryState_SQL(id=0)
+    state.generation += 1
+    session.add(state)
+    
+    return state.generation
+
+def load_PersonFR_vector_index(session: Session, fr_manager: FRManager, snapshot_path: str = '') -> None:
+    """
+    Loads the vector index of fr_manager, from a snapshot if one exists (catching up on changes made after it was saved), otherwise from the database
+
+    Arguments
+    snapshot_path: path to vector index snapshot folder ('' to always load from the database)
+    """
+
+    generation = get_gallery_generation(session)
+    snapshot_generation = fr_manager.load_snapshot(snapshot_path) if snapshot_path else None
+    all_embeddings = fr_manager.gallery_mode == 'all'
+    
+    if snapshot_generation is None or snapshot_generation > generation:
+        name_list, vector_list = get_all_PersonFR_embed(session, all_embeddings)
+        fr_manager.load_vectors_from_sql(name_list, vector_list, reset=True)
+    elif snapshot_generation < generation:
+        existing_names = set(session.exec(select(PersonnelFR_SQL.name)).all())
+        for name in set(fr_manager.registry.slots_of) - existing_names: fr_manager.update_to_vector_index(name, name, [])
+        
+        name_list, vector_list = get_PersonFR_embed_since(session, snapshot_generation, all_embeddings)
+        for name, vectors in zip(name_list, vector_list): 
+            fr_manager.update_to_vector_index(name, name, vectors, embeddings=vectors if all_embeddings else None)
+        
+        logger.info("Vector index snapshot caught up from generation %d to %d", snapshot_generation, generation)
+    
+    fr_manager.generation = generation
+    
+    return None
+
+def get_one_PersonFR(session: Session, name: str, img_format: ImgFormat = ImgFormat.base64) -> PersonnelFR_Read | ResponseMessage:
+    """
+    Returns info of person with given name (images as base64, URLs or thumbnails depending on img_format)
     """
 
     person_sql = session.get(PersonnelFR_SQL, name)
@@ -90,11 +282,13 @@ def get_one_PersonFR(session: Session, name: str) -> PersonnelFR_Read | Response
     #         np.frombuffer(person_sql.embeddings, dtype=np.float32).reshape((-1,512)).shape if len(person_sql.embeddings) else None,
     #         np.frombuffer(person_sql.ave_embedding, dtype=np.float32).shape if person_sql.embeddings else None)
     
-    return PersonnelFR_Read.model_validate_from_sql(person_sql)
+    return PersonnelFR_Read.model_validate_from_sql(person_sql, img_format)
 
-def add_PersonFR(session: Session, create_person: PersonnelFR_Update, fr_manager: FRManager, check: bool = True) -> PersonnelFR_Read | ResponseMessage: 
+@gallery_write
+def add_PersonFR(session: Session, create_person: PersonnelFR_Update, fr_manager: FRManager, check: bool = True, img_files: list[IO[bytes]] | None = None) -> PersonnelFR_Read | ResponseMessage: 
     """
     Add record of a person to database
+    img_files: binary file objects of the images (multipart/raw uploads), streamed to disk instead of decoding base64 images of create_person
     Returns True on success
     """
 
@@ -108,20 +302,22 @@ def add_PersonFR(session: Session, create_person: PersonnelFR_Update, fr_manager
 
     if not create_person.images and create_person.new_images: create_person.images = create_person.new_images
     
-    #Convert base64 img data to reference filename to img file
-    create_person.images = [save_img_to_file(img, mode=0, name = create_person.name) for img in create_person.images]
+    #Convert base64 img data (or uploaded files) to reference filename to img file
+    if img_files is not None: create_person.images = [save_img_fileobj_to_file(img_file, mode=0, name=create_person.name) for img_file in img_files]
+    else: create_person.images = [save_img_to_file(img, mode=0, name = create_person.name) for img in create_person.images]
 
     person_sql = PersonnelFR_SQL.model_validate(create_person)
 
     person_sql.images, embeddings_list = fr_manager.extract_embeddings_multi(person_sql.images, os.path.join(DATABASE_IMGS_DIR, person_sql.name))
+    person_sql.image_hashes = [get_img_hash(img, mode=0, details=person_sql.name) for img in person_sql.images]
     
     ave_embedding = fr_manager.get_average_embeddings(embeddings_list)
 
-    person_sql.embeddings = np.array(embeddings_list).tobytes() 
-    person_sql.ave_embedding = ave_embedding.tobytes()
+    set_PersonFR_embeddings(person_sql, embeddings_list, ave_embedding, fr_manager.embedding_dtype)
+    person_sql.generation = generation = bump_gallery_generation(session)
 
     session.add(person_sql)
-    session.commit()
+    with timed('db_commit'): session.commit()
     session.refresh(person_sql)
     
     #Convert reference filename to img file to base64 img data
@@ -129,10 +325,12 @@ def add_PersonFR(session: Session, create_person: PersonnelFR_Update, fr_manager
 
     #print(person_sql)
     
-    if ave_embedding.size != 0: fr_manager.add_to_vector_index(person_sql.name, ave_embedding)
+    if ave_embedding.size != 0: fr_manager.add_to_vector_index(person_sql.name, ave_embedding, np.array(embeddings_list))
+    fr_manager.generation = generation
 
     return PersonnelFR_Read.model_validate(person_sql)
 
+@gallery_write
 def update_PersonFR(session: Session, name: str, update_person: PersonnelFR_Update, fr_manager=FRManager) -> list[str, PersonnelFR_Read] | ResponseMessage:
     """
     Update record of a person to database
@@ -149,18 +347,39 @@ def update_PersonFR(session: Session, name: str, update_person: PersonnelFR_Upda
     
     img_list = []
     img_list.extend(person_sql.images)
+    img_hashes = get_PersonFR_img_hashes(person_sql, update_person.name)
+    removed_imgs = [] #image files deleted once the update is committed
     
-    embeddings_list = []
+    embeddings_list = decode_embeddings(person_sql.embeddings, person_sql.embedding_dtype)
+    ave_embedding = decode_embeddings(person_sql.ave_embedding, person_sql.embedding_dtype).reshape(-1)
 
     if update_person.images != None:
-        reset_img_folder(update_person.name, remake=True)
-        img_list, embeddings_list = fr_manager.extract_embeddings_multi([save_img_to_file(img, mode=0, name=update_person.name) for img in update_person.images], os.path.join(DATABASE_IMGS_DIR, update_person.name))
+        #Images identical to stored ones keep their file and embedding, so only images that are new are saved and run through the model
+        stored = {}
+        for img, img_hash, embedding in zip(img_list, img_hashes, embeddings_list): stored.setdefault(img_hash, []).append((img, embedding))
+
+        kept = [] #(filename, embedding or None if it is a new image, hash)
+        for img_data_str in update_person.images:
+            with timed('base64_decode'): img_data = base64.b64decode(img_data_str.encode('utf-8'))
+            img_hash = hash_img_data(img_data)
+            if stored.get(img_hash): kept.append((*stored[img_hash].pop(0), img_hash))
+            else: kept.append((write_img_bytes_to_file(img_data, mode=0, name=update_person.name), None, img_hash))
+        
+        new_imgs = [img for img, embedding, _ in kept if embedding is None]
+        new_embeddings = dict(zip(*fr_manager.extract_embeddings_multi(new_imgs, os.path.join(DATABASE_IMGS_DIR, update_person.name))))
+        kept = [(img, embedding if embedding is not None else new_embeddings[img], img_hash) for img, embedding, img_hash in kept if embedding is not None or img in new_embeddings]
+        removed_imgs = [img for entries in stored.values() for img, _ in entries] + [img for img in new_imgs if img not in new_embeddings]
+
+        img_list, img_hashes = [img for img, _, _ in kept], [img_hash for _, _, img_hash in kept]
+        embeddings_list = np.array([embedding for _, embedding, _ in kept], dtype=np.float32).reshape((-1, 512))
         ave_embedding = fr_manager.get_average_embeddings(embeddings_list)
 
-        print("RESET IMAGES\n", len(embeddings_list))
+        logger.debug("Updated images of %s (%d reused, %d extracted, %d removed)", update_person.name, len(kept) - len(new_embeddings), len(new_imgs), len(removed_imgs))
     elif update_person.new_images:
-        embeddings_list = np.frombuffer(person_sql.embeddings, dtype=np.float32).reshape((-1,512)) if person_sql.embeddings else np.empty((0, 512), dtype=np.float32)
-        img_list, new_embeddings_list = fr_manager.extract_embeddings_multi([save_img_to_file(img, mode=0, name=update_person.name) for img in update_person.new_images], os.path.join(DATABASE_IMGS_DIR, update_person.name))
+        new_img_list, new_embeddings_list = fr_manager.extract_embeddings_multi([save_img_to_file(img, mode=0, name=update_person.name) for img in update_person.new_images], os.path.join(DATABASE_IMGS_DIR, update_person.name))
+        img_list.extend(new_img_list)
+        img_hashes.extend(get_img_hash(img, mode=0, details=update_person.name) for img in new_img_list)
+        new_embeddings_list = np.array(new_embeddings_list, dtype=np.float32).reshape((-1, 512))
 
         
         # new_img_ref = save_img_to_file(update_person.new_image, mode=0, name=update_person.name)
@@ -177,26 +396,121 @@ def update_PersonFR(session: Session, name: str, update_person: PersonnelFR_Upda
 
         embeddings_list = np.vstack((embeddings_list, new_embeddings_list))
         ave_embedding = fr_manager.get_average_embeddings(embeddings_list)
-        print("ADD IMAGES\n", embeddings_list.shape)
+        logger.debug("Added images of %s (%d embeddings)", update_person.name, len(embeddings_list))
 
     #Updating person_sql in database
     update_person_data = update_person.model_dump(exclude_unset=True)
     person_sql.sqlmodel_update(update_person_data)
     person_sql.images = img_list
-    person_sql.embeddings = np.array(embeddings_list).tobytes()
-    person_sql.ave_embedding = np.array(ave_embedding).tobytes()
+    person_sql.image_hashes = img_hashes
+    set_PersonFR_embeddings(person_sql, embeddings_list, ave_embedding, fr_manager.embedding_dtype)
+    person_sql.generation = generation = bump_gallery_generation(session)
  
     session.add(person_sql)
-    session.commit()
+    with timed('db_commit'): session.commit()
     session.refresh(person_sql)
+    delete_img_files(removed_imgs, mode=0, details=person_sql.name)
     
-    fr_manager.update_to_vector_index(name, person_sql.name, ave_embedding)
+    fr_manager.update_to_vector_index(name, person_sql.name, ave_embedding, np.array(embeddings_list))
+    fr_manager.generation = generation
     
     person_sql = PersonnelFR_Read.model_validate(person_sql)
     person_sql.images = [fetch_img_from_file(img, mode=0, details=person_sql.name) for img in person_sql.images]
     
     return ['patch', person_sql]
 
+@gallery_write
+def bulk_add_PersonFR(session: Session, grouped_imgs: dict[str, list[ImgSource]], fr_manager: FRManager, chunk_size: int = 256) -> PersonnelFR_BulkRead:
+    """
+    Add records of many people to database at once (images of people already in the database are appended, as with new_images in update_PersonFR)
+
+    Individuals are processed in chunks of chunk_size. For each chunk, images are streamed to the image filesystem, embeddings are extracted 
+    in one batched call, and the rows and vector index entries are written together. If a chunk fails, its rows are rolled back and its image files removed.
+    Images that cannot be read or decoded are left out (and listed in the skipped field of the summary) instead of failing their chunk.
+
+    Arguments
+    grouped_imgs: dictionary mapping each name to the (filename, opener) pairs of that person's images (see imgfs.group_img_sources)
+    chunk_size: number of individuals written per transaction
+    """
+
+    summary = PersonnelFR_BulkRead()
+    names = list(grouped_imgs.keys())
+
+    for chunk_start in range(0, len(names), chunk_size):
+        chunk_names = names[chunk_start:chunk_start + chunk_size]
+        existing = {person_sql.name: person_sql for person_sql in session.exec(select(PersonnelFR_SQL).where(PersonnelFR_SQL.name.in_(chunk_names))).all()}
+        saved_imgs, validated_imgs, undecodable_imgs, source_filenames, unreadable_filenames = [], [], [], {}, []
+        
+        try:
+            for name in chunk_names:
+                for filename, opener in grouped_imgs[name]:
+                    try:
+                        with opener() as img_file: saved_img = os.path.join(name, save_img_fileobj_to_file(img_file, mode=0, name=name))
+                    except (OSError, zipfile.BadZipFile) as e: #e.g. a corrupted member of a zip archive
+                        logger.warning("Image %s could not be read: %s", filename, e)
+                        unreadable_filenames.append(filename)
+                        continue
+                    saved_imgs.append(saved_img)
+                    source_filenames[saved_img] = filename
+
+            validated_imgs, embeddings_list = fr_manager.extract_embeddings_multi(saved_imgs, DATABASE_IMGS_DIR, undecodable=undecodable_imgs)
+            
+            validated_per_person = {}
+            for img, embedding in zip(validated_imgs, embeddings_list):
+                name, img_filename = os.path.split(img)
+                img_list, new_embeddings_list = validated_per_person.setdefault(name, ([], []))
+                img_list.append(img_filename)
+                new_embeddings_list.append(embedding)
+
+            added, updated = {}, {}
+            generation = bump_gallery_generation(session)
+            for name in chunk_names:
+                if name not in validated_per_person: continue
+                
+                img_list, new_embeddings_list = validated_per_person[name]
+                person_sql = existing.get(name)
+
+                img_hashes = [get_img_hash(img, mode=0, details=name) for img in img_list]
+                if person_sql:
+                    embeddings_list = decode_embeddings(person_sql.embeddings, person_sql.embedding_dtype)
+                    embeddings_list = np.vstack((embeddings_list, new_embeddings_list))
+                    person_sql.image_hashes = [*get_PersonFR_img_hashes(person_sql), *img_hashes]
+                    person_sql.images = [*person_sql.images, *img_list]
+                else:
+                    embeddings_list = np.array(new_embeddings_list)
+                    person_sql = PersonnelFR_SQL(name=name, images=img_list, image_hashes=img_hashes)
+
+                ave_embedding = fr_manager.get_average_embeddings(embeddings_list)
+                set_PersonFR_embeddings(person_sql, embeddings_list, ave_embedding, fr_manager.embedding_dtype)
+                person_sql.generation = generation
+                session.add(person_sql)
+                
+                (updated if name in existing else added)[name] = (ave_embedding, embeddings_list)
+
+            with timed('db_commit'): session.commit()
+        except Exception:
+            session.rollback()
+            validated_imgs = []
+            raise
+        finally:
+            #Remove image files that were not kept (no face detected, or the whole chunk failed)
+            for img in set(saved_imgs) - set(validated_imgs): os.remove(os.path.join(DATABASE_IMGS_DIR, img))
+            for name in chunk_names:
+                folder_path = os.path.join(DATABASE_IMGS_DIR, name)
+                if name not in existing and os.path.isdir(folder_path) and not os.listdir(folder_path): os.rmdir(folder_path)
+
+        fr_manager.add_to_vector_index_multi(list(added.keys()), [ave_embedding for ave_embedding, _ in added.values()], [embeddings for _, embeddings in added.values()])
+        for name, (ave_embedding, embeddings) in updated.items(): fr_manager.update_to_vector_index(name, name, ave_embedding, embeddings)
+        fr_manager.generation = generation
+        
+        summary.added.extend(added.keys())
+        summary.updated.extend(updated.keys())
+        summary.skipped.extend(name for name in chunk_names if name not in added and name not in updated)
+        summary.skipped.extend(unreadable_filenames + sorted(source_filenames[img] for img in undecodable_imgs))
+
+    return summary
+
+@gallery_write
 def delete_PersonFR(session: Session, name: str, fr_manager: FRManager) -> ResponseMessage:
     """
     Delete record of a person to database
@@ -210,24 +524,29 @@ def delete_PersonFR(session: Session, name: str, fr_manager: FRManager) -> Respo
         )
 
     session.delete(person_sql)
-    session.commit()
+    generation = bump_gallery_generation(session)
+    with timed('db_commit'): session.commit()
     reset_img_folder(name)
     fr_manager.update_to_vector_index(person_sql.name, person_sql.name, [])
+    fr_manager.generation = generation
 
     return ResponseMessage(
             type=MessageType.success,
             message='Successfully deleted record of {}'.format(name)
         )
 
+@gallery_write
 def delete_all_PersonFR(session: Session, fr_manager: FRManager) -> ResponseMessage:
     """
     Delete all records in database
     """
 
     session.exec(delete(PersonnelFR_SQL))
-    session.commit()
+    generation = bump_gallery_generation(session)
+    with timed('db_commit'): session.commit()
     reset_img_db([0, 1])
     fr_manager.load_vectors_from_sql([], [], reset=True)
+    fr_manager.generation = generation
 
     return ResponseMessage(
             type=MessageType.success,
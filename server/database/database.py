@@ -1,6 +1,12 @@
 from sqlmodel import Session, SQLModel, create_engine
+from sqlalchemy import Engine, event, inspect, text
 from pydantic import BaseModel
 from enum import Enum
+import logging
+
+from config import DB_PATH, DB_ECHO, DB_JOURNAL_MODE, DB_SYNCHRONOUS, DB_MMAP_SIZE, DB_CACHE_SIZE, DB_BUSY_TIMEOUT, DB_POOL_SIZE, DB_POOL_MAX_OVERFLOW
+
+logger = logging.getLogger(__name__)
     
 class MessageType(str, Enum):
     error = 'error'
@@ -12,14 +18,90 @@ class ResponseMessage(BaseModel):
     type: MessageType
     message: str
 
-sqlite_file_name = "frdatabase.db"
+def create_sqlite_engine(sqlite_url: str, echo: bool = False, journal_mode: str = 'WAL', synchronous: str = 'NORMAL', 
+                         mmap_size: int = 0, cache_size: int = -2000, busy_timeout: int = 5000, 
+                         pool_size: int = 5, max_overflow: int = 10) -> Engine:
+    """
+    Creates an engine for a SQLite database, applying the given pragmas to every pooled connection
+
+    Arguments
+    sqlite_url: SQLAlchemy URL of the database
+    echo: log every SQL statement
+    journal_mode: SQLite journal mode ('WAL' lets readers run concurrently with a writer)
+    synchronous: SQLite synchronous setting ('NORMAL' only syncs at WAL checkpoints, 'FULL' at every commit)
+    mmap_size: bytes of the database file memory-mapped for reads (0 disables)
+    cache_size: page cache per connection, in pages if positive or in KiB if negative
+    busy_timeout: milliseconds a connection waits for a lock before failing with "database is locked"
+    pool_size, max_overflow: connections kept open in the pool, and extra connections opened under load
+
+    Returns the engine.
+    """
+    engine = create_engine(sqlite_url, echo=echo, pool_size=pool_size, max_overflow=max_overflow,
+                           connect_args={"check_same_thread": False, "timeout": busy_timeout / 1000})
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA journal_mode={}'.format(journal_mode))
+        cursor.execute('PRAGMA synchronous={}'.format(synchronous))
+        cursor.execute('PRAGMA mmap_size={:d}'.format(mmap_size))
+        cursor.execute('PRAGMA cache_size={:d}'.format(cache_size))
+        cursor.execute('PRAGMA busy_timeout={:d}'.format(busy_timeout))
+        cursor.close()
+
+    return engine
+
+sqlite_file_name = DB_PATH
 sqlite_url = "sqlite:///{}".format(sqlite_file_name)
 
-connect_args = {"check_same_thread": False}
-engine = create_engine(sqlite_url, echo=True, connect_args=connect_args)
+engine = create_sqlite_engine(sqlite_url, DB_ECHO, DB_JOURNAL_MODE, DB_SYNCHRONOUS, DB_MMAP_SIZE, DB_CACHE_SIZE, DB_BUSY_TIMEOUT, DB_POOL_SIZE, DB_POOL_MAX_OVERFLOW)
 
 #SQLModel.metadata.create_all(engine)
 
+def init_database() -> None:
+    """
+    Creates missing tables, then adds columns and indexes introduced after the database file was created 
+    (create_all only creates tables that do not exist yet)
+    """
+    SQLModel.metadata.create_all(engine)
+    
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for table in SQLModel.metadata.sorted_tables:
+            existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing_columns: continue
+                
+                column_ddl = '{} {}'.format(column.name, column.type.compile(dialect=engine.dialect))
+                if column.default is not None and column.default.is_scalar: column_ddl += ' DEFAULT {!r}'.format(column.default.arg)
+                connection.execute(text('ALTER TABLE {} ADD COLUMN {}'.format(table.name, column_ddl)))
+                
+            for index in table.indexes: index.create(connection, checkfirst=True)
+
+    check_database_settings()
+
+def check_database_settings() -> dict[str, str]:
+    """
+    Reads back the storage settings of a connection and warns about those SQLite did not apply 
+    (e.g. WAL is not available on some network filesystems)
+    
+    Returns the settings in effect.
+    """
+    with engine.connect() as connection:
+        settings = {pragma: str(connection.execute(text('PRAGMA {}'.format(pragma))).scalar()) 
+                    for pragma in ('journal_mode', 'synchronous', 'mmap_size', 'cache_size', 'busy_timeout')}
+
+    synchronous_levels = {'0': 'OFF', '1': 'NORMAL', '2': 'FULL', '3': 'EXTRA'}
+    expected = {'journal_mode': DB_JOURNAL_MODE.lower(), 'synchronous': DB_SYNCHRONOUS.upper(), 'mmap_size': str(DB_MMAP_SIZE),
+                'cache_size': str(DB_CACHE_SIZE), 'busy_timeout': str(DB_BUSY_TIMEOUT)}
+    actual = dict(settings, synchronous=synchronous_levels.get(settings['synchronous'], settings['synchronous']))
+
+    for pragma, value in expected.items():
+        if actual[pragma].lower() != value.lower(): logger.warning('SQLite %s is %s instead of the configured %s', pragma, actual[pragma], value)
+    logger.info('SQLite storage settings: %s', actual)
+
+    return actual
+
 def get_session(): 
     with Session(engine) as session: yield session
     
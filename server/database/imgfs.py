@@ -1,81 +1,405 @@
 import os
+import re
 import shutil
 import uuid
 import base64
-from enum import IntEnum
+import hashlib
+import zipfile
+import threading
+import queue
+import logging
+from collections import OrderedDict
+from enum import Enum, IntEnum
+from typing import IO, Callable, Iterator
+from urllib.parse import quote
+
+from PIL import Image, ImageOps
+
+from config import THUMBNAIL_CACHE_BYTES, IMG_WRITER_QUEUE_SIZE, IMG_WRITER_FSYNC
+from metrics import timed
+
+logger = logging.getLogger(__name__)
 
 class Mode(IntEnum):
     database = 0
     inference = 1
 
+class ImgFormat(str, Enum):
+    """
+    How images are returned by read models: full image as base64, URL of the image endpoint, a small base64 JPEG thumbnail, or URL of that thumbnail
+    """
+    base64 = 'base64'
+    url = 'url'
+    thumbnail = 'thumbnail'
+    thumbnail_url = 'thumbnail_url'
+
 INFERENCE_IMGS_DIR = 'Images/Infer'
 DATABASE_IMGS_DIR = 'Images/Database'
+IMG_URL_PREFIX = '/FR/image' #see routers.FRroutes.get_image_router
+THUMBNAIL_SIZES = (64, 160, 320) #longest side of the thumbnails that can be generated, in pixels
+THUMBNAIL_SIZE = 160 #default thumbnail size
+THUMBNAIL_DIR = '.thumbs' #thumbnails of the images of a folder are saved in <folder>/.thumbs/<size>/
+
+IMG_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+#Same pattern as the client's upload dropbox: 'XXyy.jpg', 'XXyy (1).jpg' and 'XXyy - Copy.jpg' all belong to XXyy
+IMG_OWNER_PATTERN = re.compile(r'^(.+?)( \(\d+\))?( - Copy)?(\.[^.]+)?$')
+
+ImgSource = tuple[str, Callable[[], IO[bytes]]] #(filename, opener returning a readable binary file object)
+
+class DerivedImageCache():
+    """
+    In-memory LRU cache of derived images (e.g. thumbnails) keyed by (path of original image, variant), bounded by the total bytes cached
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def get(self, key: tuple[str, int]) -> bytes | None:
+        with self.lock:
+            data = self.entries.get(key)
+            if data is not None: self.entries.move_to_end(key)
+            return data
+
+    def put(self, key: tuple[str, int], data: bytes) -> None:
+        if len(data) > self.max_bytes: return
+
+        with self.lock:
+            if key in self.entries: self.size -= len(self.entries.pop(key))
+            self.entries[key] = data
+            self.size += len(data)
+
+            while self.size > self.max_bytes: self.size -= len(self.entries.popitem(last=False)[1])
+
+    def invalidate_folder(self, folder_path: str) -> None:
+        """
+        Drops every entry derived from an image in folder_path (or its subfolders)
+        """
+        prefix = os.path.join(folder_path, '')
+        with self.lock:
+            for key in [key for key in self.entries if key[0].startswith(prefix)]: self.size -= len(self.entries.pop(key))
+
+class BackgroundImgWriter():
+    """
+    Writes image files on a background thread, so that requests do not wait for the disk
+
+    Files wait in a bounded queue (submit blocks while it is full). Readers of a file that may still be queued call wait_written first.
+    """
+
+    def __init__(self, queue_size: int = 64, fsync: bool = False):
+        """
+        Arguments
+        queue_size: maximum number of files waiting to be written
+        fsync: whether every file (and its folder entry) is flushed to the disk with fsync after being written
+        """
+
+        self.fsync = fsync
+        self.jobs = queue.Queue(maxsize=queue_size)
+        self.pending = {} #file path -> threading.Event set once written
+        self.lock = threading.Lock()
+
+        threading.Thread(target=self._run, name='img-writer', daemon=True).start()
+
+    def submit(self, file_path: str, data: bytes) -> None:
+        with self.lock: self.pending[file_path] = threading.Event()
+        self.jobs.put((file_path, data))
+
+    def wait_written(self, file_path: str, timeout: float | None = None) -> None:
+        with self.lock: written = self.pending.get(file_path)
+        if written: written.wait(timeout)
+
+    def flush(self) -> None:
+        """
+        Waits until every file submitted so far is written
+        """
+        self.jobs.join()
+
+    def _run(self) -> None:
+        while True:
+            file_path, data = self.jobs.get()
+            try:
+                folder_path = os.path.dirname(file_path)
+                os.makedirs(folder_path, exist_ok=True)
+                with timed('file_write'), open(file_path, 'wb') as file:
+                    file.write(data)
+                    if self.fsync:
+                        file.flush()
+                        os.fsync(file.fileno())
+                
+                if self.fsync:
+                    folder_fd = os.open(folder_path, os.O_RDONLY)
+                    try: os.fsync(folder_fd)
+                    finally: os.close(folder_fd)
+            except OSError as e:
+                logger.error('Failed to write image %s: %s', file_path, e)
+            finally:
+                with self.lock: self.pending.pop(file_path).set()
+                self.jobs.task_done()
+
+thumbnail_cache = DerivedImageCache(THUMBNAIL_CACHE_BYTES)
+img_writer = BackgroundImgWriter(IMG_WRITER_QUEUE_SIZE, IMG_WRITER_FSYNC)
 
 def init_img_filesystem():
     os.makedirs(INFERENCE_IMGS_DIR, exist_ok=True)
     os.makedirs(DATABASE_IMGS_DIR, exist_ok=True)
     
-def save_img_to_file(img_data_str: str, mode: Mode, name: str = '', date_str: str = '', file_uuid: str = '') -> str:
-    #decoded_img = img_data_str.split(',')[1]
-    
+def get_img_folder_path(mode: Mode, name: str = '', date_str: str = '') -> str:
     match mode:
         case Mode.database:
-            folder_path = os.path.join(DATABASE_IMGS_DIR, name)
+            return os.path.join(DATABASE_IMGS_DIR, name)
         case Mode.inference:
-            folder_path = os.path.join(INFERENCE_IMGS_DIR, date_str)
+            return os.path.join(INFERENCE_IMGS_DIR, date_str)
         case _:
             raise ValueError('Mode must match one of Mode Enum types!')
+
+def save_img_to_file(img_data_str: str, mode: Mode, name: str = '', date_str: str = '', file_uuid: str = '') -> str:
+    #decoded_img = img_data_str.split(',')[1]
+    
+    with timed('base64_decode'): img_data = base64.b64decode(img_data_str.encode('utf-8'))
+    file_name = write_img_bytes_to_file(img_data, mode, name, date_str, file_uuid)
+    
+    logger.debug('Image saved: %s', os.path.join(get_img_folder_path(mode, name, date_str), file_name))
         
+    return file_name
+
+def write_img_bytes_to_file(img_data: bytes, mode: Mode, name: str = '', date_str: str = '', file_uuid: str = '') -> str:
+    """
+    Writes image data to the image filesystem (unlike save_img_bytes_to_file, the file exists once this returns)
+    Returns the filename of the saved image
+    """
+    folder_path = get_img_folder_path(mode, name, date_str)
+    os.makedirs(folder_path, exist_ok=True)
+    
+    if not file_uuid: file_uuid = uuid.uuid1().hex
+    
+    file_name = file_uuid + '.jpg'
+    with timed('file_write'), open(os.path.join(folder_path, file_name), 'wb') as file:
+        file.write(img_data)
+        
+    return file_name
+
+def hash_img_data(img_data: bytes) -> str:
+    """
+    Returns the content hash of image data, as recorded for enrolled images (see database.Personnel.PersonnelFR_SQL.image_hashes)
+    """
+    return hashlib.sha1(img_data, usedforsecurity=False).hexdigest()
+
+def get_img_hash(img_name: str, mode: Mode, details: str) -> str:
+    """
+    Returns the content hash of an image file (see hash_img_data)
+    """
+    img_hash = hashlib.sha1(usedforsecurity=False)
+    with open(get_img_file_path(img_name, mode, details), 'rb') as img_file:
+        while chunk := img_file.read(1 << 20): img_hash.update(chunk)
+    return img_hash.hexdigest()
+
+def delete_img_files(img_names: list[str], mode: Mode, details: str) -> None:
+    """
+    Deletes image files of a folder (and their thumbnails), ignoring files that do not exist
+    """
+    if not img_names: return None
+
+    folder_path = get_img_folder_path(mode, name=details, date_str=details)
+    for img_name in img_names:
+        file_path = get_img_file_path(img_name, mode, details)
+        for path in [file_path, *get_thumbnail_paths(file_path)]:
+            if os.path.isfile(path): os.remove(path)
+    thumbnail_cache.invalidate_folder(folder_path)
+    return None
+
+def save_img_fileobj_to_file(img_file: IO[bytes], mode: Mode, name: str = '', date_str: str = '', file_uuid: str = '') -> str:
+    """
+    Streams a binary file object into the image filesystem in chunks (without loading it fully into memory)
+    Returns the filename of the saved image
+    """
+    folder_path = get_img_folder_path(mode, name, date_str)
     os.makedirs(folder_path, exist_ok=True)
     
     if not file_uuid: file_uuid = uuid.uuid1().hex
     
     file_name = file_uuid + '.jpg'
     file_path = os.path.join(folder_path, file_name)
-    with open(file_path, 'wb') as file:
-        file.write(base64.b64decode(img_data_str.encode('utf-8')))
+    try:
+        with timed('file_write'), open(file_path, 'wb') as file:
+            shutil.copyfileobj(img_file, file)
+    except Exception:
+        #Do not leave a partially written image behind (e.g. a corrupted member of a zip archive fails midway)
+        if os.path.exists(file_path): os.remove(file_path)
+        raise
+        
+    return file_name
+
+def save_img_bytes_to_file(img_data: bytes, mode: Mode, name: str = '', date_str: str = '', file_uuid: str = '') -> str:
+    """
+    Queues image data to be written to the image filesystem by img_writer (see BackgroundImgWriter), without waiting for it
+    Returns the filename the image is saved as
+    """
+    if not file_uuid: file_uuid = uuid.uuid1().hex
     
-    print(file_name)
+    file_name = file_uuid + '.jpg'
+    img_writer.submit(os.path.join(get_img_folder_path(mode, name, date_str), file_name), img_data)
         
     return file_name
 
-def fetch_img_from_file(img_name: str, mode: Mode, details:str) -> str:
-    match mode:
-        case Mode.database:
-            folder_path = os.path.join(DATABASE_IMGS_DIR, details)
-        case Mode.inference:
-            folder_path = os.path.join(INFERENCE_IMGS_DIR, details)
-        case _:
-            raise ValueError('Mode must match one of Mode Enum types!')
+def parse_img_owner(filename: str) -> str | None:
+    """
+    Returns the name of the person an image belongs to based on the naming convention in ReadME.md 
+    (e.g. 'XXyy (1).jpg' -> 'XXYY'), or None if the file is not an image
+    """
+    filename = os.path.basename(filename)
+    if filename.startswith('.') or not filename.lower().endswith(IMG_EXTENSIONS): return None
+    
+    match = IMG_OWNER_PATTERN.match(filename)
+    if not match or not match.group(1).strip(): return None
+    
+    return match.group(1).strip().upper()
+
+def iter_img_folder(folder_path: str, recursive: bool = False) -> Iterator[ImgSource]:
+    """
+    Yields (filename, opener) pairs for every file in a folder
+    """
+    for root, dirs, files in os.walk(folder_path):
+        for file in sorted(files):
+            yield file, (lambda file_path=os.path.join(root, file): open(file_path, 'rb'))
+        if not recursive: break
+
+def iter_img_zip(zip_file: zipfile.ZipFile) -> Iterator[ImgSource]:
+    """
+    Yields (filename, opener) pairs for every file in a zip archive (members are decompressed lazily when opened)
+    """
+    for info in zip_file.infolist():
+        if info.is_dir() or info.filename.startswith('__MACOSX/'): continue
+        yield os.path.basename(info.filename), (lambda info=info: zip_file.open(info))
+
+def group_img_sources(img_sources: Iterator[ImgSource]) -> dict[str, list[ImgSource]]:
+    """
+    Groups image sources per person using parse_img_owner, ignoring files that are not images
+    """
+    grouped = {}
+    for filename, opener in img_sources:
+        name = parse_img_owner(filename)
+        if name: grouped.setdefault(name, []).append((filename, opener))
         
-    file_path = os.path.join(folder_path, img_name)
+    return grouped
+
+def get_img_file_path(img_name: str, mode: Mode, details: str) -> str:
+    """
+    Returns the path of an image file (details is the name of the individual in database mode, or the date string in inference mode)
+    Raises ValueError if img_name or details would point outside of the image folder
+    """
+    for part in (img_name, details):
+        if part in ('', '.', '..') or os.path.basename(part) != part: raise ValueError('Invalid image path component {}'.format(part))
+
+    return os.path.join(get_img_folder_path(mode, name=details, date_str=details), img_name)
+
+def fetch_img_from_file(img_name: str, mode: Mode, details:str) -> str:
+    file_path = get_img_file_path(img_name, mode, details)
+    img_writer.wait_written(file_path)
     if not os.path.exists(file_path): 
         raise FileNotFoundError('Image with path {} does not exist!'.format(file_path))
         
     with open(file_path, 'rb') as img_file:
         return base64.b64encode(img_file.read()).decode('utf-8')
+
+def get_thumbnail_paths(file_path: str) -> list[str]:
+    """
+    Returns the paths the thumbnails of an image are saved at, one per size of THUMBNAIL_SIZES (whether they were generated or not)
+    """
+    folder_path, img_name = os.path.split(file_path)
+    return [os.path.join(folder_path, THUMBNAIL_DIR, str(size), img_name) for size in THUMBNAIL_SIZES]
+
+def get_thumbnail_file_path(img_name: str, mode: Mode, details: str, size: int = THUMBNAIL_SIZE) -> str:
+    """
+    Returns the path of the thumbnail of an image, generating and saving it first if it does not exist yet
+    Raises ValueError if size is not one of THUMBNAIL_SIZES
+    """
+    if size not in THUMBNAIL_SIZES: raise ValueError('Thumbnail size must be one of {}'.format(THUMBNAIL_SIZES))
+
+    file_path = get_img_file_path(img_name, mode, details)
+    thumbnail_path = os.path.join(os.path.dirname(file_path), THUMBNAIL_DIR, str(size), img_name)
+    if os.path.exists(thumbnail_path): return thumbnail_path
+
+    img_writer.wait_written(file_path)
+    if not os.path.exists(file_path): 
+        raise FileNotFoundError('Image with path {} does not exist!'.format(file_path))
+
+    with Image.open(file_path) as img:
+        img.draft('RGB', (size, size)) #let the JPEG decoder downscale while decoding
+        img = ImageOps.exif_transpose(img).convert('RGB')
+        img.thumbnail((size, size))
+
+        os.makedirs(os.path.dirname(thumbnail_path), exist_ok=True)
+        tmp_path = '{}.{}.tmp'.format(thumbnail_path, uuid.uuid4().hex) #written aside and moved into place, as concurrent requests may generate the same thumbnail
+        img.save(tmp_path, format='JPEG', quality=85)
+        os.replace(tmp_path, thumbnail_path)
+
+    return thumbnail_path
+
+def fetch_thumbnail_from_file(img_name: str, mode: Mode, details: str, size: int = THUMBNAIL_SIZE) -> str:
+    """
+    Returns a JPEG thumbnail (longest side at most size pixels) of an image as a base64 string, served from thumbnail_cache when possible
+    """
+    key = (get_img_file_path(img_name, mode, details), size)
+    data = thumbnail_cache.get(key)
+
+    if data is None:
+        with open(get_thumbnail_file_path(img_name, mode, details, size), 'rb') as thumbnail_file: data = thumbnail_file.read()
+        thumbnail_cache.put(key, data)
+
+    return base64.b64encode(data).decode('utf-8')
+
+def get_img_url(img_name: str, mode: Mode, details: str, size: int | None = None) -> str:
+    """
+    Returns the URL path the image (or its thumbnail of the given size) is served at by the image endpoint
+    """
+    url = '{}/{}/{}/{}'.format(IMG_URL_PREFIX, Mode(mode).name, quote(details), quote(img_name))
+    return url + '?size={}'.format(size) if size else url
+
+def fetch_img(img_name: str, mode: Mode, details: str, img_format: ImgFormat = ImgFormat.base64) -> str:
+    """
+    Returns an image in the requested format (see ImgFormat)
+    """
+    match img_format:
+        case ImgFormat.url:
+            return get_img_url(img_name, mode, details)
+        case ImgFormat.thumbnail:
+            return fetch_thumbnail_from_file(img_name, mode, details)
+        case ImgFormat.thumbnail_url:
+            return get_img_url(img_name, mode, details, THUMBNAIL_SIZE)
+        case _:
+            return fetch_img_from_file(img_name, mode, details)
     
 def rename_img_folder(old_name: str, new_name: str) -> None:
     old_folder_path = os.path.join(DATABASE_IMGS_DIR, old_name)
     new_folder_path = os.path.join(DATABASE_IMGS_DIR, new_name)
     
+    #The thumbnails saved in the folder are moved with it (they are named after their image, not the person)
     os.rename(old_folder_path, new_folder_path)
+    thumbnail_cache.invalidate_folder(old_folder_path)
+    thumbnail_cache.invalidate_folder(new_folder_path)
     return None
     
 def reset_img_folder(name: str, remake: bool = False) -> None:
     folder_path = os.path.join(DATABASE_IMGS_DIR, name)
     if os.path.isdir(folder_path): shutil.rmtree(folder_path)
+    thumbnail_cache.invalidate_folder(folder_path)
     
     if remake: os.mkdir(folder_path)
     return None
     
 def reset_img_db(modes: list[Mode]) -> None:
+    img_writer.flush()
+    
     if Mode.database in modes:
         shutil.rmtree(DATABASE_IMGS_DIR)
         os.mkdir(DATABASE_IMGS_DIR)
+        thumbnail_cache.invalidate_folder(DATABASE_IMGS_DIR)
         
     if Mode.inference in modes:
         shutil.rmtree(INFERENCE_IMGS_DIR)
         os.mkdir(INFERENCE_IMGS_DIR)
+        thumbnail_cache.invalidate_folder(INFERENCE_IMGS_DIR)
         
-    return None
\ No newline at end of file
+    return None
@@ -1,11 +1,29 @@
-from fastapi import FastAPI, status
+from fastapi import FastAPI, HTTPException, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from contextlib import asynccontextmanager
+import asyncio
+import logging
 
+import metrics
+from config import VECTOR_INDEX_SNAPSHOT_PATH, VECTOR_INDEX_SNAPSHOT_INTERVAL, LOG_LEVEL, OTEL_ENABLED
 from database.database import ResponseMessage
-from database.imgfs import init_img_filesystem
+from database.imgfs import init_img_filesystem, img_writer
 from routers import FRroutes
 
+logging.basicConfig(level=LOG_LEVEL, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+if OTEL_ENABLED: metrics.init_tracing()
+
+async def save_vector_index_snapshots():
+    """
+    Periodically saves a snapshot of the vector index if it has changed since the last snapshot
+    """
+    fr_manager = FRroutes.fr_manager
+    while True:
+        await asyncio.sleep(VECTOR_INDEX_SNAPSHOT_INTERVAL)
+        if fr_manager.generation != fr_manager.snapshot_generation: 
+            await asyncio.to_thread(fr_manager.save_snapshot, VECTOR_INDEX_SNAPSHOT_PATH)
+
 @asynccontextmanager
 async def lifespan(app:FastAPI):
     """
@@ -14,9 +32,20 @@ async def lifespan(app:FastAPI):
     - Anything after yield is code to be executed after app shuts down
     """
 
-    #initialize SQLite database
     init_img_filesystem()
+    #Opens the database and loads the vector index; models load and warm up in the background (see GET /ready)
+    await asyncio.to_thread(FRroutes.startup)
+    
+    snapshot_task = asyncio.create_task(save_vector_index_snapshots()) if VECTOR_INDEX_SNAPSHOT_PATH else None
     yield
+    
+    FRroutes.inference_executor.shutdown()
+    FRroutes.stream_executor.shutdown()
+    img_writer.flush()
+    if snapshot_task: 
+        snapshot_task.cancel()
+        if FRroutes.fr_manager.generation != FRroutes.fr_manager.snapshot_generation: 
+            FRroutes.fr_manager.save_snapshot(VECTOR_INDEX_SNAPSHOT_PATH)
 
 app = FastAPI(lifespan=lifespan)
 
@@ -29,7 +58,8 @@ app.add_middleware(
     allow_origins=origins,
     allow_credentials=True,
     allow_methods=['GET', 'POST', 'PATCH', 'DELETE'],
-    allow_headers=['*']
+    allow_headers=['*'],
+    expose_headers=['X-Next-Cursor']
 )
 
 app.include_router(FRroutes.router)
@@ -39,4 +69,22 @@ async def health() -> ResponseMessage:
     return ResponseMessage(
         type='info',
         message='Health ok'
-    )
\ No newline at end of file
+    )
+
+@app.get("/ready", status_code=status.HTTP_200_OK)
+async def ready() -> ResponseMessage:
+    """
+    Readiness probe: 503 until every inference and stream worker has loaded and warmed up its model (GET /health only tells that the process is up)
+    """
+    if not FRroutes.is_ready(): raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Models are loading")
+    return ResponseMessage(
+        type='info',
+        message='Ready'
+    )
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics() -> PlainTextResponse:
+    """
+    Stage latencies, faces per image, micro-batching and vector index counters in the Prometheus text format
+    """
+    return PlainTextResponse(metrics.render(), media_type='text/plain; version=0.0.4')
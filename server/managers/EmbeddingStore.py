@@ -0,0 +1,132 @@
+import os
+
+import numpy as np
+from voyager import StorageDataType
+
+EMBEDDING_DTYPES = ('float32', 'float16', 'int8')
+#Storage type of the vector index for each embedding dtype. Voyager has no 16-bit type (and its 8-bit floating point type, E4M3, 
+#is about 100x slower to build and query), so float16 vectors are indexed as float32 and int8 vectors with its 8-bit fixed point type
+VOYAGER_STORAGE_TYPES = {'float32': StorageDataType.Float32, 'float16': StorageDataType.Float32, 'int8': StorageDataType.Float8}
+
+def quantize(vectors: np.ndarray | list, dtype: str) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Quantizes embeddings to dtype ('int8' uses one scale per vector, mapping its largest absolute component to 127)
+
+    Returns the quantized vectors (shape (n, 512)) and their scales (shape (n,), all ones except for 'int8').
+    """
+    vectors = np.asarray(vectors, dtype=np.float32).reshape((-1, 512))
+    if dtype != 'int8': return vectors.astype(dtype), np.ones(len(vectors), dtype=np.float32)
+
+    scales = np.abs(vectors).max(axis=1) / 127
+    scales[scales == 0] = 1
+    return np.round(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+
+def dequantize(codes: np.ndarray, scales: np.ndarray) -> np.ndarray:
+    return codes.astype(np.float32) * scales[:, None] if codes.dtype == np.int8 else codes.astype(np.float32)
+
+def roundtrip(vectors: np.ndarray | list, dtype: str) -> np.ndarray:
+    """
+    Returns vectors as they read back once stored with dtype, as a float32 array of shape (n, 512)
+    """
+    return dequantize(*quantize(vectors, dtype))
+
+def encode_embeddings(vectors: np.ndarray | list, dtype: str) -> bytes:
+    """
+    Encodes embeddings (shape (n, 512), or a single embedding) to bytes for the database; 'int8' blobs start with the n float32 scales
+    """
+    codes, scales = quantize(vectors, dtype)
+    return scales.tobytes() + codes.tobytes() if dtype == 'int8' else codes.tobytes()
+
+def decode_embeddings(blob: bytes, dtype: str = 'float32') -> np.ndarray:
+    """
+    Decodes bytes encoded by encode_embeddings with the given dtype
+
+    Returns a float32 numpy array of shape (n, 512), which has no rows for an empty blob.
+    """
+    if dtype != 'int8': return np.frombuffer(blob, dtype=dtype).reshape((-1, 512)).astype(np.float32)
+
+    count = len(blob) // (4 + 512)
+    scales = np.frombuffer(blob, dtype=np.float32, count=count)
+    codes = np.frombuffer(blob, dtype=np.int8, offset=4 * count).reshape((-1, 512))
+    return dequantize(codes, scales)
+
+class EmbeddingStore():
+    """
+    Gallery vectors by slot of the vector index, quantized to dtype and kept in one contiguous array (grows by doubling when full)
+
+    Used when the vector index stores vectors with less precision than dtype (int8), so that the vectors as stored remain available to
+    re-score search results, to recognise unchanged vectors on updates and to rebuild the index on compaction. 
+    Saved with vector index snapshots and memory-mapped when loaded.
+    """
+
+    def __init__(self, dtype: str, capacity: int = 1024):
+        """
+        Arguments
+        dtype: one of EMBEDDING_DTYPES
+        capacity: initial number of slots allocated
+        """
+
+        self.dtype = dtype
+        self.codes = np.zeros((max(capacity, 1), 512), dtype=dtype)
+        self.scales = np.ones(max(capacity, 1), dtype=np.float32)
+        self.size = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    @property
+    def nbytes(self) -> int:
+        return self.size * (self.codes.itemsize * 512 + 4)
+
+    def set(self, slots: list[int], vectors: np.ndarray | list) -> None:
+        """
+        Stores vectors at the given slots (slots beyond the end of the store extend it)
+        """
+        if not len(slots): return None
+
+        end = max(slots) + 1
+        if end > len(self.codes):
+            capacity = max(2 * len(self.codes), end)
+            codes, scales = np.zeros((capacity, 512), dtype=self.dtype), np.ones(capacity, dtype=np.float32)
+            codes[:self.size], scales[:self.size] = self.codes[:self.size], self.scales[:self.size]
+            self.codes, self.scales = codes, scales
+
+        self.codes[slots], self.scales[slots] = quantize(vectors, self.dtype)
+        self.size = max(self.size, end)
+
+    def get(self, slots: list[int] | np.ndarray) -> np.ndarray:
+        """
+        Returns the (dequantized) vectors at the given slots as a float32 array of shape (len(slots), 512)
+        """
+        return dequantize(self.codes[slots], self.scales[slots])
+
+    def compact(self, old_slots: np.ndarray) -> None:
+        """
+        Keeps only the given slots, renumbered contiguously (see IdentityRegistry.compact)
+        """
+        self.codes, self.scales = self.codes[old_slots], self.scales[old_slots]
+        self.size = len(old_slots)
+
+    def save(self, folder_path: str, suffix: str = '') -> None:
+        """
+        Saves the store as vectors.npy and scales.npy (each followed by suffix) in folder_path
+        """
+        for name, array in (('vectors.npy', self.codes), ('scales.npy', self.scales)):
+            with open(os.path.join(folder_path, name + suffix), 'wb') as file: np.save(file, array[:self.size])
+
+    @classmethod
+    def load(cls, folder_path: str, dtype: str) -> 'EmbeddingStore | None':
+        """
+        Memory-maps a store saved by save (copy-on-write, so changes are not written back to the files)
+
+        Returns None if the files are missing or of another dtype.
+        """
+        vectors_path, scales_path = os.path.join(folder_path, 'vectors.npy'), os.path.join(folder_path, 'scales.npy')
+        if not (os.path.exists(vectors_path) and os.path.exists(scales_path)): return None
+
+        codes, scales = np.load(vectors_path, mmap_mode='c'), np.load(scales_path, mmap_mode='c')
+        if codes.dtype != np.dtype(dtype) or codes.shape[1:] != (512,) or len(codes) != len(scales): return None
+
+        store = cls(dtype, capacity=1)
+        store.codes, store.scales, store.size = codes, scales, len(codes)
+        return store
@@ -1,41 +1,281 @@
 import os
 import warnings
 import io
+import json
+import zlib
+import threading
+import logging
+import importlib
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Iterator
 
 from insightface.app import FaceAnalysis
-from voyager import Index, Space
+from insightface.utils import face_align
+from voyager import StorageDataType
 import numpy as np
 from PIL import Image, ImageOps
-import torch
+import onnxruntime
 
+from metrics import timed, faces_per_image
 from .BaseManager import BaseManager
+from .IdentityRegistry import IdentityRegistry
+from .MicroBatcher import MicroBatcher
+from .EmbeddingStore import EmbeddingStore, EMBEDDING_DTYPES, VOYAGER_STORAGE_TYPES, roundtrip
+from .SearchBackend import SearchBackend, HNSWBackend, ExactBackend, SEARCH_BACKENDS, SEARCH_BACKEND_CLASSES
+from .FaceTracker import FaceTracker, Track
+from .ResultCache import ResultCache
+from .FaceQuality import assess_face
+
+logger = logging.getLogger(__name__)
 
 class FRManager(BaseManager):
     DEFAULT_EMBEDDING_CACHE_PATH = '../temp/vectors_cache.npy'
+    MODEL_MODULES = ['detection', 'recognition'] #models of the FaceAnalysis pack that are loaded (the landmark and gender/age models are unused)
+    SNAPSHOT_VERSION = 1
+    GALLERY_MODES = ('average', 'all')
+    AGGREGATIONS = ('max', 'topk_mean')
 
     def __init__(self,                  
                  sql_personnel: tuple[list[str], list[np.ndarray]] = ([], []),
                  embedding_filepath: str = DEFAULT_EMBEDDING_CACHE_PATH, 
-                 use_average: bool = False):
+                 use_average: bool = False,
+                 decode_workers: int = 4,
+                 rec_batch_size: int = 32,
+                 compact_min_deleted: int = 1000,
+                 compact_max_deleted_ratio: float = 0.2,
+                 gallery_mode: str = 'average',
+                 aggregation: str = 'max',
+                 aggregation_k: int = 3,
+                 overfetch: int = 5,
+                 microbatch_max_size: int = 0,
+                 microbatch_max_wait: float = 0.005,
+                 max_input_side: int = 0,
+                 fast_decode: bool = True,
+                 embedding_dtype: str = 'float32',
+                 search_backend: str = 'hnsw',
+                 exact_max_size: int = 100000,
+                 hnsw_m: int = 12,
+                 hnsw_ef_construction: int = 200,
+                 hnsw_ef: int = 10,
+                 hnsw_max_elements: int = 1,
+                 model_factory: Callable[[], FaceAnalysis] | str | None = None,
+                 result_cache_size: int = 0,
+                 result_cache_ttl: float = 300.0,
+                 embedding_cache_size: int = 0,
+                 det_size: int = 640,
+                 det_threshold: float = 0.5,
+                 det_cascade_size: int = 0,
+                 det_cascade_min_face: int = 24,
+                 min_face_quality: float = 0.0,
+                 max_faces: int = 0,
+                 report_skipped_faces: bool = False):
         """ 
-        Loads FR Model and Voyager Vector Index (pre-load)
+        Loads FR Model (on first use, see self.model) and Vector Index (pre-load)
 
         Arguments
-        sql_personnel: tuple with 2 lists, first list contains a list of names to be loaded into self.name_list (as querying the vector index only gives index and not name of individual), second list contains a list of average facial embeddings to be loaded into self.vector_index; the indices of both lists corresponds and are gathered from the sqlite database
+        sql_personnel: tuple with 2 lists, first list contains a list of names to be loaded into self.registry (as querying the vector index only gives index and not name of individual), second list contains a list of average facial embeddings to be loaded into self.vector_index; the indices of both lists corresponds and are gathered from the sqlite database
         embedding_filepath: path to .npy file storing facial embeddings (deprecated)
         use_average: whether to use average embeddings (deprecated)        
+        decode_workers: number of worker threads used to decode images in parallel during enrollment
+        rec_batch_size: maximum number of aligned face crops sent to the recognition model in a single call
+        compact_min_deleted, compact_max_deleted_ratio: the vector index is compacted once at least compact_min_deleted slots, and more than compact_max_deleted_ratio of all slots, are deleted
+        gallery_mode: 'average' indexes one average embedding per individual, 'all' indexes the embedding of every enrolled image
+        aggregation: how neighbours of the same individual are combined in the 'all' gallery mode; 'max' keeps the closest one, 'topk_mean' averages the distances of the aggregation_k closest ones
+        aggregation_k: number of neighbours per individual averaged by the 'topk_mean' aggregation
+        overfetch: in the 'all' gallery mode, k * overfetch neighbours are queried so that k distinct individuals can be returned after aggregation
+        microbatch_max_size: if above 1, the recognition and vector index search of up to this many concurrent inference requests are run as one batch (see self.batcher)
+        microbatch_max_wait: seconds a batch waits for more requests after its first one arrived
+        max_input_side: images larger than this (longest side in pixels) are downscaled before inference; 0 disables downscaling
+        fast_decode: let the JPEG decoder downscale by a power of 2 while decoding (PIL draft mode) before resizing to max_input_side
+        embedding_dtype: precision of stored embeddings, one of EMBEDDING_DTYPES; 'int8' also stores the vector index with 8-bit components 
+                         (see VOYAGER_STORAGE_TYPES) and keeps the int8 vectors in self.embedding_store to re-score its search results
+        search_backend: how the vector index is searched, one of SEARCH_BACKENDS; 'hnsw' (approximate, Voyager), 'exact' (matrix multiplication 
+                        with all vectors, see SearchBackend.ExactBackend) or 'auto' ('exact' up to exact_max_size vectors, 'hnsw' above)
+        exact_max_size: largest number of vectors searched exactly by the 'auto' search backend (an HNSW index only moves back to 
+                        exact search once it holds at most half as many, see choose_search_backend)
+        hnsw_m, hnsw_ef_construction, hnsw_ef, hnsw_max_elements: parameters of the HNSW index (see SearchBackend.HNSWBackend); 
+                                                                  a snapshot built with another hnsw_m or hnsw_ef_construction is rebuilt
+        model_factory: function returning a prepared model with the FaceAnalysis API used here (det_model, models['recognition'] and get), 
+                       or its import path as 'module:function'; None loads InsightFace's FaceAnalysis (e.g. benchmarks use a fake model to run without model downloads)
+        result_cache_size, result_cache_ttl: infer keeps the results of up to this many images (0 disables the cache) for result_cache_ttl seconds, 
+                                             keyed by the image as sent (before decoding), k and self.index_version (see self.result_cache)
+        embedding_cache_size: infer keeps the faces and embeddings of up to this many images (0 disables the cache) for result_cache_ttl seconds, 
+                              so that an image sent again with another k only needs a vector index search (see self.embedding_cache)
+        det_size: side of the (square) input of the face detector, in pixels; images are resized to fit it, so faces much smaller than the image are missed at small sizes
+        det_threshold: minimum detection score of a face
+        det_cascade_size: if not 0, detection first runs at this (smaller) size, and only runs at det_size if no face is found, 
+                          or if a face found is smaller than det_cascade_min_face pixels at that size (see detect)
+        det_cascade_min_face: side in pixels, at det_cascade_size, below which faces are considered tiny (and detection is run again at det_size)
+        min_face_quality: infer only recognises faces whose quality (0 to 1, see FaceQuality.assess_face) is at least this
+        max_faces: infer recognises at most this many faces per image, those of highest quality (0 for no limit)
+        report_skipped_faces: infer also returns the faces it did not recognise (min_face_quality, max_faces), with no matches
         """  
 
-        provider: str = 'CUDAExecutionProvider' if torch.cuda.is_available() else 'CPUExecutionProvider'
-        
-        self.model = FaceAnalysis(providers=[provider])
-        self.model.prepare(ctx_id=0)
+        if gallery_mode not in self.GALLERY_MODES: raise ValueError("gallery_mode must be one of {}".format(self.GALLERY_MODES))
+        if aggregation not in self.AGGREGATIONS: raise ValueError("aggregation must be one of {}".format(self.AGGREGATIONS))
+        if embedding_dtype not in EMBEDDING_DTYPES: raise ValueError("embedding_dtype must be one of {}".format(EMBEDDING_DTYPES))
+        if search_backend not in SEARCH_BACKENDS: raise ValueError("search_backend must be one of {}".format(SEARCH_BACKENDS))
 
-        self.vector_index = Index(Space.Cosine, num_dimensions=512)
-        self.name_list = []
-        self.deleted_ids = []
-        #self.vector_index, self.name_list = self.load_vectors_from_npy(embedding_filepath, use_average)
+        self.provider: str = 'CUDAExecutionProvider' if 'CUDAExecutionProvider' in onnxruntime.get_available_providers() else 'CPUExecutionProvider'
+        if isinstance(model_factory, str):
+            module_name, _, function_name = model_factory.partition(':')
+            model_factory = getattr(importlib.import_module(module_name), function_name)
+        self.model_factory = model_factory
+        
+        self._model = None #shared model, loaded on first use by a thread without its own model
+        self._model_lock = threading.Lock()
+        self._worker_local = threading.local()
+
+        self.decode_pool = ThreadPoolExecutor(max_workers=decode_workers, thread_name_prefix='fr-decode')
+        self.rec_batch_size = rec_batch_size
+
+        self.embedding_dtype = embedding_dtype
+        self.search_backend = search_backend
+        self.exact_max_size = exact_max_size
+        self.hnsw_m = hnsw_m
+        self.hnsw_ef_construction = hnsw_ef_construction
+        self.hnsw_ef = hnsw_ef
+        self.hnsw_max_elements = hnsw_max_elements
+        self.vector_index = self.create_index()
+        self.embedding_store = self.create_embedding_store()
+        self.registry = IdentityRegistry()
+        self.compact_min_deleted = compact_min_deleted
+        self.compact_max_deleted_ratio = compact_max_deleted_ratio
+        self.gallery_mode = gallery_mode
+        self.aggregation = aggregation
+        self.aggregation_k = aggregation_k
+        self.overfetch = overfetch
+        self.index_lock = threading.RLock()
+        self.generation = 0 #gallery generation (see database.Personnel.GalleryState_SQL) that the vector index reflects
+        self.snapshot_generation = None #gallery generation of the last snapshot saved/loaded
+        self.index_version = 0 #incremented on every change to the vector index (see index_changed)
+        self.result_cache = ResultCache(result_cache_size, result_cache_ttl)
+        self.embedding_cache = ResultCache(embedding_cache_size, result_cache_ttl)
+        self.max_input_side = max_input_side
+        self.fast_decode = fast_decode
+        self.det_size = det_size
+        self.det_threshold = det_threshold
+        self.det_cascade_size = det_cascade_size
+        self.det_cascade_min_face = det_cascade_min_face
+        self.min_face_quality = min_face_quality
+        self.max_faces = max_faces
+        self.report_skipped_faces = report_skipped_faces
+        #self.vector_index, self.registry = self.load_vectors_from_npy(embedding_filepath, use_average)
         self.load_vectors_from_sql(sql_personnel[0], sql_personnel[1])
+        #Created last: the batching thread runs recognition with a model of its own, loaded and warmed up (like those of the inference workers) using the settings above
+        self.batcher = MicroBatcher(self.search_faces, microbatch_max_size, microbatch_max_wait, thread_init=self.bind_worker_model) if microbatch_max_size > 1 else None
+
+    def create_index(self, size: int = 0, current: str | None = None) -> SearchBackend:
+        """
+        Creates an empty vector index for size vectors, of the search backend chosen for that size (see choose_search_backend)
+        """
+        if self.choose_search_backend(size, current) == 'exact': return ExactBackend(capacity=max(size, 1024))
+        return HNSWBackend(storage_data_type=VOYAGER_STORAGE_TYPES[self.embedding_dtype], M=self.hnsw_m, ef_construction=self.hnsw_ef_construction, 
+                           ef=self.hnsw_ef, max_elements=max(size, self.hnsw_max_elements))
+
+    def choose_search_backend(self, size: int, current: str | None = None) -> str:
+        """
+        Returns the search backend ('hnsw' or 'exact') used for a vector index of size vectors
+
+        Arguments
+        size: number of (live) vectors in the vector index
+        current: search backend of the vector index now, if any; with search_backend='auto', an 'hnsw' index is kept until its size falls 
+                 to half of exact_max_size, so that enrolling and deleting around exact_max_size does not rebuild the index every time
+        """
+        if self.search_backend != 'auto': return self.search_backend
+        if size > self.exact_max_size: return 'hnsw'
+        if current == 'hnsw' and size > self.exact_max_size // 2: return 'hnsw'
+        return 'exact'
+
+    def switch_search_backend(self) -> None:
+        """
+        Moves the vectors of the vector index to a new index if the search backend chosen for its size changed (with search_backend='auto')
+
+        Called once the vector index and self.registry agree (at the end of every change), as only the live slots of self.registry are moved.
+        """
+        with self.index_lock:
+            if self.search_backend != 'auto': return None
+            if self.choose_search_backend(self.registry.live_count, self.vector_index.name) == self.vector_index.name: return None
+
+            live_slots = [slot for slot in range(len(self.registry)) if slot not in self.registry.deleted_ids]
+            vector_index = self.create_index(self.registry.live_count, self.vector_index.name)
+            if len(live_slots): vector_index.add_items(self.get_slot_vectors(live_slots), ids=live_slots)
+            self.vector_index = vector_index
+            self.index_changed()
+
+            logger.info("Vector index moved to the %s search backend (%d vectors)", vector_index.name, len(live_slots))
+
+            return None
+
+    def create_embedding_store(self) -> EmbeddingStore | None:
+        """
+        Creates an empty embedding store, or returns None if the vector index stores vectors as precisely as self.embedding_dtype
+        """
+        return EmbeddingStore(self.embedding_dtype) if self.uses_embedding_store else None
+
+    @property
+    def uses_embedding_store(self) -> bool:
+        """
+        Whether the vector index may store vectors with less precision than self.embedding_dtype (see create_embedding_store)
+        """
+        return self.search_backend != 'exact' and VOYAGER_STORAGE_TYPES[self.embedding_dtype] != StorageDataType.Float32
+
+    def add_slot_vectors(self, vectors: np.ndarray | list, slots: list[int]) -> None:
+        """
+        Writes vectors to the given slots of the vector index (and of self.embedding_store)
+
+        The index is given the vectors as stored with self.embedding_dtype, so that it holds the same vectors whether 
+        they were added on enrollment or loaded back from the database or a snapshot.
+        """
+        vectors = roundtrip(vectors, self.embedding_dtype)
+        if self.embedding_store is not None: self.embedding_store.set(slots, vectors)
+        self.vector_index.add_items(vectors, ids=slots)
+
+    def get_slot_vectors(self, slots: list[int]) -> np.ndarray:
+        """
+        Returns the vectors at the given slots as stored with self.embedding_dtype, of shape (len(slots), 512)
+        """
+        if self.embedding_store is not None: return self.embedding_store.get(slots)
+        return np.asarray(self.vector_index.get_vectors(slots), dtype=np.float32).reshape((-1, 512))
+
+    def create_model(self) -> FaceAnalysis:
+        """
+        Loads and prepares a FaceAnalysis model (each instance has its own ONNX runtime sessions)
+        """
+        if self.model_factory is not None: return self.model_factory()
+
+        model = FaceAnalysis(providers=[self.provider], allowed_modules=self.MODEL_MODULES)
+        model.prepare(ctx_id=0, det_thresh=self.det_threshold, det_size=(self.det_size, self.det_size))
+        return model
+
+    @property
+    def model(self) -> FaceAnalysis:
+        """
+        Model used by the calling thread: its own model if bind_worker_model was called in this thread, otherwise the shared model
+        """
+        model = getattr(self._worker_local, 'model', None)
+        if model is not None: return model
+
+        with self._model_lock:
+            if self._model is None: self._model = self.create_model()
+        return self._model
+
+    def bind_worker_model(self) -> None:
+        """
+        Gives the calling thread its own model, warmed up (used as worker_init of an InferenceExecutor so that workers run inference concurrently)
+        """
+        self._worker_local.model = self.create_model()
+        self.warm_up()
+
+    def warm_up(self) -> None:
+        """
+        Runs detection and recognition once on a blank image with the calling thread's model, 
+        so that the first request does not wait for ONNX Runtime to allocate and optimise its sessions
+        """
+        rec_model = self.model.models['recognition']
+        for det_size in {self.det_size, self.det_cascade_size} - {0}: self.run_detector(np.zeros((det_size, det_size, 3), dtype=np.uint8), det_size)
+        rec_model.get_feat([np.zeros((*rec_model.input_size, 3), dtype=np.uint8)])
 
     def to_npy(self, img: Image.Image | np.ndarray | bytes | None = None,
             img_filepath: str | None = None, org_rotation: bool = False) -> np.ndarray:
@@ -50,19 +290,43 @@ class FRManager(BaseManager):
         Returns a numpy array containing image data.
         """
 
-        if not (img or img_filepath): raise Exception("Please provide either img or img_filepath")
+        if img is None and not img_filepath: raise Exception("Please provide either img or img_filepath")
 
-        if not img and not os.path.exists(img_filepath):
+        if img is None and not os.path.exists(img_filepath):
             raise FileNotFoundError("Image filepath {} provided not found!".format(img_filepath))
         
-        if not img: img = Image.open(img_filepath).convert('RGB')
+        if img is None: img = Image.open(img_filepath)
 
-        if type(img) == bytes: img = Image.open(io.BytesIO(img)).convert('RGB')
+        if isinstance(img, bytes): img = Image.open(io.BytesIO(img))
 
-        if type(img) == Image.Image: img = np.array(ImageOps.exif_transpose(img)) if org_rotation else np.array(img)
+        if isinstance(img, Image.Image): img = np.array((ImageOps.exif_transpose(img) if org_rotation else img).convert('RGB'))
 
         return img
 
+    def decode_for_inference(self, img: Image.Image | np.ndarray | bytes | None = None, img_filepath: str | None = None) -> tuple[np.ndarray, float]:
+        """
+        Decodes an image for inference in its original rotation, downscaled so that its longest side is at most self.max_input_side
+
+        Arguments
+        img: image data either in PIL Image, Numpy array (used as is) or bytes data
+        img_filepath: path to image file
+
+        Returns the image as a numpy array (RGB) and the factor that scales coordinates in it back to the original image.
+        """
+
+        if isinstance(img, np.ndarray) or not self.max_input_side: return self.to_npy(img, img_filepath, org_rotation=True), 1.0
+        
+        if img is None: img = Image.open(img_filepath)
+        elif isinstance(img, bytes): img = Image.open(io.BytesIO(img))
+
+        original_side = max(img.size)
+        if original_side > self.max_input_side:
+            target_size = tuple(max(1, side * self.max_input_side // original_side) for side in img.size)
+            if self.fast_decode: img.draft('RGB', target_size) #no effect on formats other than JPEG
+            img = img.resize(target_size, Image.Resampling.BILINEAR, reducing_gap=None if self.fast_decode else 2.0)
+
+        return self.to_npy(img, org_rotation=True), original_side / max(img.size)
+
     def load_vectors_from_npy(self, filepath:str, use_average: bool = True) -> None:
         """
         Load embeddings from a .npy file into Voyager Vector Index (UNUSED, DEPRECATED)
@@ -80,91 +344,276 @@ class FRManager(BaseManager):
 
         if use_average: 
             for name, em_list in embedding_dict.items():
-                self.name_list.append(name)
-                self.vector_index.add_item(sum(em_list)/len(em_list))
+                self.add_slot_vectors(sum(em_list)/len(em_list), self.registry.add([name]))
         else: 
             for name, em_list in embedding_dict.items():
                 for em in em_list:
-                    self.name_list.append(name)
-                    self.vector_index.add_item(em) 
+                    self.add_slot_vectors(em, self.registry.add([name])) 
+        self.switch_search_backend()
 
-        print("Vector index created! ({})".format("average" if use_average else "complete"))
+        logger.info("Vector index created! (%s)", "average" if use_average else "complete")
 
         return None
     
     def load_vectors_from_sql(self, name_list: list[str], vector_list = list[np.ndarray], reset: bool = False) -> None:
         """
-        Load embeddings from a personnel SQL database into Voyager Vector Index
+        Load embeddings from a personnel SQL database into the vector index
 
         Arguments
-        name_list: list of names to be added into self.name_list, index should correspond with self.vector_index
-        vector_list: list of vectors to be loaded into self.vector_index (the vector database storing facial embeddings)
+        name_list: list of names to be added into self.registry, index should correspond with vector_list
+        vector_list: list of vectors to be loaded into self.vector_index (the vector database storing facial embeddings); each element is either a single embedding or an array of embeddings of that individual
+        reset: whether to clear the vector index and registry first
         """
+        with self.index_lock:
+            vector_list = [np.reshape(vectors, (-1, 512)) for vectors in vector_list]
+            slot_names = [name for name, vectors in zip(name_list, vector_list) for _ in range(len(vectors))]
+
+            if reset: 
+                self.vector_index = self.create_index(len(slot_names))
+                self.embedding_store = self.create_embedding_store()
+                self.registry = IdentityRegistry()
         
-        if reset: self.vector_index = Index(Space.Cosine, num_dimensions=512)
-        
-        if len(vector_list): 
-            self.vector_index.add_items(np.array(vector_list))
+            if len(slot_names): 
+                self.add_slot_vectors(np.vstack(vector_list), self.registry.add(slot_names))
+            self.switch_search_backend()
+            self.index_changed()
         
-        self.name_list = name_list
-        
-        #print("Initialised NAME LIST: ", name_list[0], vector_list[0])
+            return None
+
+    def gallery_vectors(self, ave_embedding: np.ndarray | list, embeddings: np.ndarray | list | None = None) -> np.ndarray:
+        """
+        Returns the vectors representing an individual in the vector index, according to self.gallery_mode
+
+        Arguments
+        ave_embedding: average of the embeddings representing the face of the individual
+        embeddings: all embeddings representing the face of the individual (falls back to ave_embedding if not given)
         
-        return None
-    
-    def add_to_vector_index(self, name: str, ave_embedding: np.ndarray | None ) -> None:
+        Returns a numpy array of shape (number of vectors, 512), which has no rows if the individual has no faces enrolled.
+        """
+        if self.gallery_mode == 'all' and embeddings is not None: return np.reshape(embeddings, (-1, 512))
+        return np.reshape(ave_embedding, (-1, 512))
+
+    def add_to_vector_index(self, name: str, ave_embedding: np.ndarray | None, embeddings: np.ndarray | None = None) -> None:
         """
         Add an embedding into vector index
 
         Arguments
-        name: name of individual in self.name_list (to be added)
+        name: name of individual in self.registry (to be added)
         ave_embedding: average of the embeddings representing the face of the named individual 
+        embeddings: all embeddings representing the face of the named individual (used in the 'all' gallery mode)
         """
-        
-        if not len(ave_embedding): return None
+        with self.index_lock:
+            #Also reuses the slots of an individual that was deleted and is added back
+            return self.update_to_vector_index(name, name, ave_embedding, embeddings)
 
-        self.vector_index.add_item(ave_embedding)
-        self.name_list.append(name)
-        
-        print("NAME LIST LENGTH: ", len(self.name_list), self.name_list)
-        print("VECTOR LIST LENGTH: ", len(self.vector_index))
+    def add_to_vector_index_multi(self, name_list: list[str], ave_embedding_list: list[np.ndarray], embeddings_list: list[np.ndarray] | None = None) -> None:
+        """
+        Add multiple embeddings into vector index in a single batched insertion
 
-        return None
-    
-    def update_to_vector_index(self, name: str, new_name: str, ave_embedding: np.ndarray) -> None:
+        Arguments
+        name_list: names of individuals in self.registry (to be added)
+        ave_embedding_list: average embeddings of the named individuals (index corresponds with name_list)
+        embeddings_list: all embeddings of the named individuals (used in the 'all' gallery mode)
+        """
+        with self.index_lock:
+            if not len(name_list): return None
+
+            if embeddings_list is None: embeddings_list = [None] * len(name_list)
+            vector_list = [self.gallery_vectors(ave_embedding, embeddings) for ave_embedding, embeddings in zip(ave_embedding_list, embeddings_list)]
+            self.load_vectors_from_sql(name_list, vector_list)
+
+            logger.debug("Name list length: %d, vector list length: %d", len(self.registry), len(self.vector_index))
+
+            return None
+
+    def update_to_vector_index(self, name: str, new_name: str, ave_embedding: np.ndarray, embeddings: np.ndarray | None = None) -> None:
         """
         Update an embedding in/remove an embedding from vector index
 
+        Only vectors that changed are written: vectors already in the index are kept, new vectors reuse slots freed by removed ones before new slots are added.
+
         Arguments
-        name: original name of individual in self.name_list
-        new_name: new name of individual to be updated in self.name_list
-        ave_embedding: average of the embeddings representing the face of the named individual 
+        name: original name of individual in self.registry
+        new_name: new name of individual to be updated in self.registry
+        ave_embedding: average of the embeddings representing the face of the named individual (empty to remove the individual)
+        embeddings: all embeddings representing the face of the named individual (used in the 'all' gallery mode)
         """
-        
-        try: idx = self.name_list.index(name)
-        except ValueError: 
-            return self.add_to_vector_index(new_name, ave_embedding)
-        
-        if len(ave_embedding) == 0:
-            if idx not in self.deleted_ids: 
-                self.vector_index.mark_deleted(idx)
-                self.deleted_ids.append(idx)
-                print("MARK DELETED: {}".format(new_name))
-        else:
-            self.vector_index.add_item(ave_embedding, idx)
-            if idx in self.deleted_ids:
-                print("DELETED index: ", idx)
-                self.deleted_ids.remove(idx)
-                print("UNMARK DELETED: {}".format(new_name))
+        with self.index_lock:
+            vectors = self.gallery_vectors(ave_embedding, embeddings)
+            
+            if new_name != name: self.registry.rename(name, new_name)
+            slots = self.registry.get_slots(new_name)
+            live_slots = [slot for slot in slots if slot not in self.registry.deleted_ids]
+
+            #Match new vectors to identical vectors already in the index (compared as stored, normalised as the index uses cosine distance)
+            if len(live_slots) and len(vectors):
+                stored = self.get_slot_vectors(live_slots)
+                similarities = self.normalise(roundtrip(vectors, self.embedding_dtype)) @ self.normalise(stored).T
+            else: 
+                similarities = np.empty((len(vectors), 0))
+            
+            unchanged_slots, new_vectors = set(), []
+            for vector, row in zip(vectors, similarities):
+                match = next((live_slots[i] for i in np.flatnonzero(row > 1 - 1e-6) if live_slots[i] not in unchanged_slots), None)
+                if match is None: new_vectors.append(vector)
+                else: unchanged_slots.add(match)
+            
+            free_slots = [slot for slot in slots if slot not in unchanged_slots]
+            reused_slots, removed_slots = free_slots[:len(new_vectors)], free_slots[len(new_vectors):]
 
+            if len(reused_slots):
+                for slot in reused_slots:
+                    if self.registry.unmark_deleted(slot): logger.debug("Unmarked deleted: %s (%d)", new_name, slot)
+                self.add_slot_vectors(new_vectors[:len(reused_slots)], reused_slots)
+            
+            if len(new_vectors) > len(reused_slots):
+                extra_vectors = new_vectors[len(reused_slots):]
+                self.add_slot_vectors(extra_vectors, self.registry.add([new_name] * len(extra_vectors)))
+
+            for slot in removed_slots:
+                if self.registry.mark_deleted(slot): 
+                    self.vector_index.mark_deleted(slot)
+                    logger.debug("Marked deleted: %s (%d)", new_name, slot)
             
-        self.name_list[idx] = new_name
+            if self.registry.should_compact(self.compact_min_deleted, self.compact_max_deleted_ratio): self.compact_vector_index()
+            self.switch_search_backend()
+            self.index_changed()
         
-        print("NAME LIST LENGTH: ", len(self.name_list), self.name_list)
-        print("VECTOR LIST LENGTH: ", len(self.vector_index))
+            logger.debug("Name list length: %d, vector list length: %d", len(self.registry), len(self.vector_index))
         
+            return None
+
+    def index_changed(self) -> None:
+        """
+        Increments self.index_version, so that results cached by infer before the vector index changed are no longer returned (called with self.index_lock held)
+        """
+        self.index_version += 1
+        self.result_cache.clear()
+
+    @staticmethod
+    def normalise(vectors: np.ndarray) -> np.ndarray:
+        return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+    def compact_vector_index(self) -> None:
+        """
+        Rebuild the vector index without the slots marked as deleted (the remaining slots are renumbered contiguously)
+        """
+        with self.index_lock:
+            deleted_count = len(self.registry.deleted_ids)
+            old_slots = self.registry.compact()
+            vectors = self.get_slot_vectors(old_slots.tolist()) if len(old_slots) else []
+
+            self.vector_index = self.create_index(len(old_slots), self.vector_index.name)
+            if self.embedding_store is not None: self.embedding_store.compact(old_slots)
+            if len(old_slots): self.vector_index.add_items(vectors, ids=list(range(len(old_slots))))
+
+            logger.info("Vector index compacted (%d deleted slots reclaimed)", deleted_count)
+
+            return None
+
+    def save_snapshot(self, snapshot_path: str) -> None:
+        """
+        Save the vector index and the names and deleted slots of self.registry to a snapshot folder, tagged with self.generation
+
+        The index (index.voy or index.npy depending on its search backend, and self.embedding_store as vectors.npy and scales.npy) is written first and the metadata (version, generation, 
+        checksum of the index file) last, all through temporary files and atomic renames, so an interrupted save is detected by 
+        load_snapshot instead of loading a mismatched index.
+
+        Arguments
+        snapshot_path: path to snapshot folder
+        """
+        os.makedirs(snapshot_path, exist_ok=True)
+        meta_path = os.path.join(snapshot_path, 'meta.json')
+
+        with self.index_lock:
+            index_path = os.path.join(snapshot_path, 'index' + self.vector_index.file_extension)
+            self.vector_index.save(index_path + '.tmp')
+            if self.embedding_store is not None: self.embedding_store.save(snapshot_path, suffix='.tmp')
+            meta = {
+                'version': self.SNAPSHOT_VERSION,
+                'generation': self.generation,
+                'gallery_mode': self.gallery_mode,
+                'embedding_dtype': self.embedding_dtype,
+                'search_backend': self.vector_index.name,
+                'name_list': self.registry.name_list,
+                'deleted_ids': sorted(self.registry.deleted_ids)
+            }
+
+        meta['index_crc32'] = self._file_crc32(index_path + '.tmp')
+        with open(meta_path + '.tmp', 'w') as meta_file: json.dump(meta, meta_file)
+
+        os.replace(index_path + '.tmp', index_path)
+        if self.embedding_store is not None:
+            for name in ('vectors.npy', 'scales.npy'): os.replace(os.path.join(snapshot_path, name + '.tmp'), os.path.join(snapshot_path, name))
+        os.replace(meta_path + '.tmp', meta_path)
+        self.snapshot_generation = meta['generation']
+
+        logger.info("Vector index snapshot saved (generation %d)", meta['generation'])
+
         return None
-    
+
+    def load_snapshot(self, snapshot_path: str) -> int | None:
+        """
+        Load the vector index and self.registry from a snapshot folder saved by save_snapshot
+
+        Arguments
+        snapshot_path: path to snapshot folder
+
+        The embedding store (and an exact search index) is memory-mapped from the snapshot rather than read into memory.
+
+        Returns the gallery generation of the snapshot, or None if there is no valid snapshot (missing, other version, gallery mode, 
+        embedding dtype, search backend or HNSW parameters, or corrupted).
+        """
+        meta_path = os.path.join(snapshot_path, 'meta.json')
+        if not os.path.exists(meta_path): return None
+
+        try:
+            with open(meta_path) as meta_file: meta = json.load(meta_file)
+        except ValueError:
+            warnings.warn("WARNING: vector index snapshot metadata {} is corrupted!".format(meta_path))
+            return None
+
+        if meta.get('version') != self.SNAPSHOT_VERSION or meta.get('gallery_mode', 'average') != self.gallery_mode: return None
+        if meta.get('embedding_dtype', 'float32') != self.embedding_dtype: return None
+
+        backend_name = meta.get('search_backend', 'hnsw')
+        if backend_name not in SEARCH_BACKEND_CLASSES or self.search_backend not in ('auto', backend_name): return None
+        backend = SEARCH_BACKEND_CLASSES[backend_name]
+        index_path = os.path.join(snapshot_path, 'index' + backend.file_extension)
+        if not os.path.exists(index_path): return None
+
+        if meta.get('index_crc32') != self._file_crc32(index_path):
+            warnings.warn("WARNING: vector index snapshot {} does not match its metadata!".format(index_path))
+            return None
+
+        embedding_store = EmbeddingStore.load(snapshot_path, self.embedding_dtype) if self.uses_embedding_store else None
+        if self.uses_embedding_store and (embedding_store is None or len(embedding_store) != len(meta['name_list'])):
+            warnings.warn("WARNING: embedding store of vector index snapshot {} is missing or does not match its metadata!".format(snapshot_path))
+            return None
+
+        vector_index = backend.load(index_path, ef=self.hnsw_ef) if backend is HNSWBackend else backend.load(index_path)
+        if backend is HNSWBackend and (vector_index.index.M, vector_index.index.ef_construction) != (self.hnsw_m, self.hnsw_ef_construction): 
+            logger.info("Vector index snapshot was built with other HNSW parameters (M=%d, ef_construction=%d)", vector_index.index.M, vector_index.index.ef_construction)
+            return None
+
+        with self.index_lock:
+            self.vector_index = vector_index
+            self.embedding_store = embedding_store
+            self.registry = IdentityRegistry.from_lists(meta['name_list'], meta['deleted_ids'])
+            self.generation = self.snapshot_generation = meta['generation']
+            self.index_changed()
+
+        logger.info("Vector index snapshot loaded (generation %d)", meta['generation'])
+
+        return meta['generation']
+
+    @staticmethod
+    def _file_crc32(filepath: str) -> int:
+        crc = 0
+        with open(filepath, 'rb') as file:
+            while chunk := file.read(1 << 20): crc = zlib.crc32(chunk, crc)
+        return crc
+
     def get_average_embeddings(self, embedding_list: list[np.ndarray] | np.ndarray) -> np.ndarray:
         """
         Gets average of the embeddings
@@ -195,31 +644,131 @@ class FRManager(BaseManager):
         """
         if not max_face: return []
 
-        img = self.to_npy(img, img_filepath)
+        with timed('image_decode'): img = self.to_npy(img, img_filepath)
 
-        faces = self.model.get(img)
-        if max_face != -1: faces = faces[:max_face]
+        embeddings = self.get_batch_embeddings(self.get_aligned_faces(img, max_face=max_face))
 
-        print("\n EMBEDDINGS EXTRACTED \n")
-        return [face.embedding for face in faces]
+        logger.debug("Embeddings extracted (%d faces)", len(embeddings))
+        return list(embeddings)
     
-    def extract_embeddings_multi(self, img_list: list[str], folder_path: str, max_face: int = 1) -> tuple[list[str], list[np.ndarray | list[np.ndarray]]]:
+    def detect_faces(self, img: np.ndarray, max_face: int = -1) -> tuple[list[dict], list[np.ndarray]]:
+        """
+        Run face detection on an image
+
+        Arguments
+        img: image data as numpy array (RGB)
+        max_face: enforce maximum number of faces; if max_face = -1, there will be no enforcement
+
+        Returns a list of faces (dictionaries with bbox, kps and det_score) ordered by detection score (highest first), and the list of their aligned face crops expected by the recognition model.
+        """
+        with timed('detection'):
+            bboxes, kpss = self.detect(img)
+            if bboxes.shape[0] == 0 or kpss is None: return [], []
+            if max_face != -1: bboxes, kpss = bboxes[:max_face], kpss[:max_face]
+
+            rec_model = self.model.models['recognition']
+            faces = [dict(bbox=bbox[:4], kps=kps, det_score=float(bbox[4])) for bbox, kps in zip(bboxes, kpss)]
+            return faces, [face_align.norm_crop(img, landmark=kps, image_size=rec_model.input_size[0]) for kps in kpss]
+
+    def run_detector(self, img: np.ndarray, det_size: int) -> tuple[np.ndarray, np.ndarray | None]:
+        """
+        Runs the face detector on an image resized to fit a det_size x det_size input
+
+        Returns the boxes with scores (shape (number of faces, 5)) of the faces with a score of at least self.det_threshold, highest score first, 
+        and their keypoints (shape (number of faces, 5, 2)), in coordinates of img.
+        """
+        bboxes, kpss = self.model.det_model.detect(img, input_size=(det_size, det_size), max_num=0, metric='default')
+        keep = bboxes[:, 4] >= self.det_threshold
+        return bboxes[keep], kpss[keep] if kpss is not None else None
+
+    def detect(self, img: np.ndarray) -> tuple[np.ndarray, np.ndarray | None]:
+        """
+        Runs face detection at self.det_size, or through the detection cascade if self.det_cascade_size is set: detection runs at 
+        self.det_cascade_size first, and that result is kept if all faces found are at least self.det_cascade_min_face pixels at that size 
+        (e.g. single portraits). Otherwise (no face found, or tiny faces found, e.g. in group photos, where more faces are likely missed) 
+        detection runs again at self.det_size.
+
+        Either way the faces are aligned for recognition from the image itself, not from the resized detector input, and only faces that were 
+        large at the smaller size are kept from it, so their keypoints are precise enough for alignment.
+
+        Returns the boxes with scores and keypoints of the faces, as run_detector.
+        """
+        if not self.det_cascade_size: return self.run_detector(img, self.det_size)
+
+        bboxes, kpss = self.run_detector(img, self.det_cascade_size)
+        face_sides = np.minimum(bboxes[:, 2] - bboxes[:, 0], bboxes[:, 3] - bboxes[:, 1]) * self.det_cascade_size / max(img.shape[:2])
+        if len(bboxes) and face_sides.min() >= self.det_cascade_min_face: return bboxes, kpss
+
+        return self.run_detector(img, self.det_size)
+
+    def get_aligned_faces(self, img: np.ndarray, max_face: int = 1) -> list[np.ndarray]:
+        """
+        Run face detection on an image and return the aligned face crops expected by the recognition model (see detect_faces)
+        """
+        return self.detect_faces(img, max_face)[1]
+
+    def get_batch_embeddings(self, aligned_faces: list[np.ndarray]) -> np.ndarray:
+        """
+        Run the recognition model over aligned face crops in batches of self.rec_batch_size
+
+        Arguments
+        aligned_faces: list of aligned face crops (see get_aligned_faces)
+
+        Returns a numpy array of shape (len(aligned_faces), 512) with one embedding per face crop.
+        """
+        if len(aligned_faces) == 0: return np.empty((0, 512), dtype=np.float32)
+
+        rec_model = self.model.models['recognition']
+        with timed('recognition'):
+            return np.vstack([rec_model.get_feat(aligned_faces[start:start + self.rec_batch_size]) 
+                              for start in range(0, len(aligned_faces), self.rec_batch_size)])
+
+    def extract_embeddings_multi(self, img_list: list[str], folder_path: str, max_face: int = 1, 
+                                 undecodable: list[str] | None = None) -> tuple[list[str], list[np.ndarray | list[np.ndarray]]]:
         """
         Extract embeddings given a list of images
 
+        Images are decoded in parallel on self.decode_pool, detection runs per image as the decoded images arrive, 
+        and all aligned face crops are then sent through the recognition model in batched calls.
+        Images that cannot be decoded (corrupted, truncated or not images) are left out like images without faces.
+
         Arguments
         img_list: list of strings where each element is the image filepath in the image database folder
         folderpath: path to image database folder
         max_face: enforce maximum number of embeddings; if max_face = -1, there will be no enforcement
+        undecodable: list the images of img_list that could not be decoded are appended to
        
         Returns a tuple containing 2 lists. The first list is the list of image filepath that has at least 1 face detected. The second contains the embedding representation of the faces in that image (index of both list corresponds).
         """
+        if not max_face: return [], []
+
+        def decode(img: str) -> np.ndarray | None:
+            try:
+                with timed('image_decode'): return self.to_npy(img_filepath=os.path.join(folder_path, img))
+            except (OSError, ValueError, Image.DecompressionBombError) as e:
+                logger.warning("Image %s could not be decoded: %s", img, e)
+                if undecodable is not None: undecodable.append(img)
+                return None
+
+        decoded_imgs = self.decode_pool.map(decode, img_list)
+
+        aligned_faces, face_counts = [], []
+        for decoded_img in decoded_imgs:
+            crops = self.get_aligned_faces(decoded_img, max_face=max_face) if decoded_img is not None else []
+            aligned_faces.extend(crops)
+            face_counts.append(len(crops))
+
+        embeddings = self.get_batch_embeddings(aligned_faces)
+
         validated_img_list = []
         embeddings_list = []
-        for img in img_list:
-            embeds = self.extract_embeddings(img_filepath=os.path.join(folder_path, img), max_face=max_face)
-            if len(embeds) == 0: continue
+        start = 0
+        for img, count in zip(img_list, face_counts):
+            if count == 0: continue
             
+            embeds = list(embeddings[start:start + count])
+            start += count
+
             validated_img_list.append(img)
             if max_face == 1: 
                 embeddings_list.append(embeds[0])
@@ -239,23 +788,189 @@ class FRManager(BaseManager):
         k: return k nearest neighbours
 
         Returns a list of dictionary with the results of the facial recognition inference (to be updated)
+
+        Only faces picked by select_faces are recognised; with self.report_skipped_faces, the other faces are returned after them with no matches.
+        Results are cached by the content of img as sent (see image_key, self.result_cache and self.embedding_cache), so an image sent 
+        again is neither decoded nor run through the models, unless the vector index changed since (for the results) or the cached entry expired.
         """
         
-        img = self.to_npy(img, img_filepath, org_rotation=True) #Use image's original rotation
+        img_key = self.image_key(img) if img is not None and (self.result_cache.max_size or self.embedding_cache.max_size) else None
+        result_key = (img_key, k, self.index_version)
+        results = self.result_cache.get(result_key) if img_key else None
+        if results is not None: return [dict(face) for face in results]
+
+        cached = self.embedding_cache.get(img_key) if img_key else None
+        if cached is not None:
+            faces, embeddings, skipped_faces = cached
+            _, targets_list, sim_score_list = self.search_embeddings([(embeddings, k)])[0]
+        else:
+            with timed('image_decode'): img, scale = self.decode_for_inference(img, img_filepath)
+            faces, aligned_faces = self.detect_faces(img)
+            faces_per_image.observe(len(faces))
+            faces, aligned_faces, skipped_faces = self.select_faces(faces, aligned_faces)
+
+            #Report coordinates in the original image if it was downscaled
+            if scale != 1.0:
+                faces, skipped_faces = ([dict(face, bbox=face['bbox'] * scale, kps=face['kps'] * scale) for face in face_list] for face_list in (faces, skipped_faces))
+
+            #Recognition and search are batched with those of concurrent requests if micro-batching is enabled
+            if len(faces) == 0: embeddings, targets_list, sim_score_list = np.empty((0, 512), dtype=np.float32), [], []
+            elif self.batcher: embeddings, targets_list, sim_score_list = self.batcher.submit((aligned_faces, k)).result()
+            else: embeddings, targets_list, sim_score_list = self.search_faces([(aligned_faces, k)])[0]
+            if img_key: self.embedding_cache.put(img_key, (faces, embeddings, skipped_faces))
+
+        results = [dict(face, bbox=face['bbox'].tolist(), embedding=embedding, targets=targets, sim_score=sim_score)
+                   for face, embedding, targets, sim_score in zip(faces, embeddings, targets_list, sim_score_list)]
+        if self.report_skipped_faces: results.extend(dict(face, bbox=face['bbox'].tolist(), embedding=None, targets=[], sim_score=[]) for face in skipped_faces)
+        if img_key: self.result_cache.put(result_key, results)
+        return [dict(face) for face in results]
+
+    def select_faces(self, faces: list[dict], aligned_faces: list[np.ndarray]) -> tuple[list[dict], list[np.ndarray], list[dict]]:
+        """
+        Picks the detected faces worth recognising: those whose quality (see FaceQuality.assess_face) is at least self.min_face_quality, 
+        and at most self.max_faces of them, highest quality first (all faces if neither is set)
 
-        faces = self.model.get(img)
-        embeddings_list = [face.embedding for face in faces]
-        
-        if len(embeddings_list) == 0: return []
+        Returns the faces picked (in detection order, with their quality added) and their aligned face crops, and the faces skipped.
+        """
+        if not self.min_face_quality and not self.max_faces: return faces, aligned_faces, []
+
+        with timed('face_quality'):
+            faces = [dict(face, quality=assess_face(face, aligned_face)['quality']) for face, aligned_face in zip(faces, aligned_faces)]
+            ranked = sorted((idx for idx, face in enumerate(faces) if face['quality'] >= self.min_face_quality), key=lambda idx: -faces[idx]['quality'])
+            picked = sorted(ranked[:self.max_faces] if self.max_faces else ranked)
 
-        neighbours, distances = self.vector_index.query(embeddings_list, k=min(k, len(self.vector_index)))
+        skipped = set(range(len(faces))) - set(picked)
+        return [faces[idx] for idx in picked], [aligned_faces[idx] for idx in picked], [faces[idx] for idx in sorted(skipped)]
+
+    @staticmethod
+    def image_key(img: Image.Image | np.ndarray | bytes) -> str:
+        """
+        Returns the key of an image in self.result_cache and self.embedding_cache: a hash of its encoded bytes, 
+        or of the shape and pixels of an already decoded image (so the same picture encoded differently is cached separately)
+        """
+        if isinstance(img, bytes): return hashlib.sha1(img, usedforsecurity=False).hexdigest() #about twice as fast as blake2b where the CPU has SHA instructions
+
+        img = np.asarray(img)
+        img_hash = hashlib.sha1(str(img.shape).encode(), usedforsecurity=False)
+        img_hash.update(np.ascontiguousarray(img).data)
+        return img_hash.hexdigest()
+
+    def infer_stream(self, frames: Iterable[tuple[float, np.ndarray]], k: int = 1, tracker: FaceTracker | None = None) -> Iterator[Track]:
+        """
+        Conducts inference on the frames of a video, following each face across frames (see FaceTracker) so that recognition and 
+        the vector index search only run for a face when it first appears or is seen noticeably better than before
+
+        Arguments
+        frames: timestamps (seconds) and frames (RGB numpy arrays) of the video, e.g. from VideoSource.iter_video_frames
+        k: return k nearest neighbours
+        tracker: FaceTracker with the tracking parameters to use (a FaceTracker with default parameters if None)
+
+        Yields each track once it ends (or at the end of the video), holding the frame, face, names and distances of its best recognition.
+        """
+        if tracker is None: tracker = FaceTracker()
+
+        for timestamp, frame in frames:
+            faces, aligned_faces = self.detect_faces(frame)
+            to_recognise, ended = tracker.update(faces, aligned_faces, timestamp)
+
+            if to_recognise:
+                embeddings, targets_list, sim_score_list = self.search_faces([([aligned_faces[face_idx] for _, face_idx in to_recognise], k)])[0]
+                for (track, face_idx), embedding, targets, sim_score in zip(to_recognise, embeddings, targets_list, sim_score_list):
+                    track.set_recognition(dict(faces[face_idx], bbox=faces[face_idx]['bbox'].tolist()), frame, embedding, targets, sim_score)
+
+            yield from ended
+        yield from tracker.flush()
+
+    def search_faces(self, jobs: list[tuple[list[np.ndarray], int]]) -> list[tuple[np.ndarray, list[list[str]], list[list[float]]]]:
+        """
+        Runs recognition over the aligned faces of several images as one batch, and searches the vector index for all of them with a single query
+
+        Arguments
+        jobs: list of (aligned face crops of an image, k), where k is the number of nearest neighbours to return for each face of that image
+
+        Returns, for each job, a tuple with the embeddings of its faces, and the names and distances of the k nearest neighbours of each face.
+        """
+        embeddings = self.get_batch_embeddings([face for aligned_faces, _ in jobs for face in aligned_faces])
+
+        embedding_jobs, start = [], 0
+        for aligned_faces, k in jobs:
+            embedding_jobs.append((embeddings[start:start + len(aligned_faces)], k))
+            start += len(aligned_faces)
+
+        return self.search_embeddings(embedding_jobs)
+
+    def search_embeddings(self, jobs: list[tuple[np.ndarray, int]]) -> list[tuple[np.ndarray, list[list[str]], list[list[float]]]]:
+        """
+        Searches the vector index for the embeddings of several images with a single query
+
+        Arguments
+        jobs: list of (embeddings of the faces of an image, k), where k is the number of nearest neighbours to return for each face of that image
+
+        Returns, for each job, a tuple with the embeddings of its faces, and the names and distances of the k nearest neighbours of each face.
+        """
+        embeddings = np.vstack([np.reshape(job_embeddings, (-1, 512)) for job_embeddings, _ in jobs]) if jobs else np.empty((0, 512), dtype=np.float32)
+
+        max_k = max((k for _, k in jobs), default=1)
+        fetch_k = max_k * self.overfetch if self.gallery_mode == 'all' else max_k
+        with self.index_lock:
+            fetch_k = min(fetch_k, self.registry.live_count)
+            if len(embeddings) == 0 or fetch_k == 0: 
+                neighbours, distances = np.empty((len(embeddings), 0), dtype=np.uint64), np.empty((len(embeddings), 0), dtype=np.float32)
+            else:
+                with timed('vector_query'):
+                    neighbours, distances = self.vector_index.query(embeddings, k=fetch_k)
+                    if self.vector_index.lossy: neighbours, distances = self.rescore_neighbours(embeddings, neighbours)
+
+            results, start = [], 0
+            for job_embeddings, k in jobs:
+                end = start + len(job_embeddings)
+                matches = [self.aggregate_neighbours(neighbours[idx], distances[idx], k) for idx in range(start, end)]
+                results.append((embeddings[start:end], [targets for targets, _ in matches], [sim_score for _, sim_score in matches]))
+                start = end
+
+        return results
+
+    def rescore_neighbours(self, embeddings: np.ndarray, neighbours: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Recomputes the cosine distances of neighbours found in a vector index with 8-bit components from self.embedding_store 
+        (whose int8 vectors have one scale per vector, so are much more precise), and reorders the neighbours of each query by them
+
+        Arguments
+        embeddings: query embeddings, of shape (number of queries, 512)
+        neighbours: ids of the neighbours of each query in the vector index, of shape (number of queries, k)
+
+        Returns the reordered neighbours and their distances.
+        """
+        stored = self.normalise(self.embedding_store.get(neighbours.reshape(-1))).reshape((*neighbours.shape, 512))
+        distances = 1 - np.einsum('qkd,qd->qk', stored, self.normalise(np.asarray(embeddings, dtype=np.float32)))
+        order = np.argsort(distances, axis=1, kind='stable')
+        return np.take_along_axis(neighbours, order, axis=1), np.take_along_axis(distances, order, axis=1).astype(np.float32)
+
+    def aggregate_neighbours(self, neighbours: np.ndarray, distances: np.ndarray, k: int) -> tuple[list[str], list[float]]:
+        """
+        Combines the neighbours of one query into a ranking of individuals
+
+        In the 'all' gallery mode several neighbours can belong to the same individual; they are combined per self.aggregation 
+        ('max': closest neighbour, 'topk_mean': mean distance of the self.aggregation_k closest neighbours, where neighbours that 
+        were not fetched count as the furthest distance fetched).
+
+        Arguments
+        neighbours: ids of the neighbours in the vector index, closest first
+        distances: cosine distances of the neighbours
+        k: number of individuals to return
+
+        Returns a tuple of the names of the k closest individuals and their (aggregated) distances.
+        """
+        names = self.registry.get_names(neighbours).tolist()
+        distances = [float(distance) for distance in distances.tolist()]
+        if self.gallery_mode == 'average': return names[:k], distances[:k]
+
+        per_identity = {}
+        for name, distance in zip(names, distances): per_identity.setdefault(name, []).append(distance)
         
-        print(len(neighbours), len(distances), len(self.name_list))
-        print(len(self.vector_index), self.name_list)
-        print(type(distances[0][0]))
-
-        return [dict(face, 
-                     bbox=face['bbox'].tolist(), 
-                     targets=[self.name_list[neighbour_idx] for neighbour_idx in neighbours[idx]], 
-                     sim_score=[float(distance) for distance in distances[idx].tolist()]
-                     ) for idx, face in enumerate(faces)]
\ No newline at end of file
+        top_m = 1 if self.aggregation == 'max' else self.aggregation_k
+        furthest = distances[-1] if distances else 0.0
+        scores = {name: sum((identity_distances + [furthest] * top_m)[:top_m]) / top_m for name, identity_distances in per_identity.items()}
+
+        ranking = sorted(scores.items(), key=lambda item: item[1])[:k]
+        return [name for name, _ in ranking], [score for _, score in ranking]
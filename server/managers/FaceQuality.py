@@ -0,0 +1,53 @@
+import cv2
+import numpy as np
+
+SIZE_REFERENCE = 64 #faces whose box is at least this many pixels (shorter side) get the full size score
+BLUR_REFERENCE = 100.0 #variance of the Laplacian of the centre of an aligned face crop at or above which the face counts as sharp
+MAX_YAW = 0.4 #offset of the nose from the middle of the eyes (relative to the distance between the eyes) at which the pose score reaches 0
+MAX_PITCH = 0.4 #offset of the nose from halfway between the eyes and the mouth (relative to that distance) at which the pose score reaches 0
+
+def size_score(bbox: np.ndarray | list[float]) -> float:
+    x1, y1, x2, y2 = bbox[:4]
+    return float(np.clip(min(x2 - x1, y2 - y1) / SIZE_REFERENCE, 0, 1))
+
+def pose_score(kps: np.ndarray) -> float:
+    """
+    Scores how frontal a face is from its keypoints (eyes, nose, mouth corners): 1 when the nose is centred between the eyes and halfway down
+    to the mouth, falling to 0 as the face turns (yaw) or tilts (pitch) away; rotation in the image plane (roll) does not count, as alignment undoes it
+    """
+    left_eye, right_eye, nose, left_mouth, right_mouth = np.asarray(kps, dtype=np.float32)
+    eye_distance = float(np.linalg.norm(right_eye - left_eye))
+    if eye_distance < 1e-6: return 0.0
+
+    x_axis = (right_eye - left_eye) / eye_distance
+    y_axis = np.array([-x_axis[1], x_axis[0]])
+    eye_centre = (left_eye + right_eye) / 2
+    mouth_height = float(((left_mouth + right_mouth) / 2 - eye_centre) @ y_axis)
+    if mouth_height <= 0: return 0.0
+
+    yaw = abs(float((nose - eye_centre) @ x_axis)) / eye_distance
+    pitch = abs(float((nose - eye_centre) @ y_axis) / mouth_height - 0.5)
+    return float(np.clip(1 - yaw / MAX_YAW, 0, 1) * np.clip(1 - pitch / MAX_PITCH, 0, 1))
+
+def blur_score(aligned_face: np.ndarray) -> float:
+    """
+    Scores how sharp an aligned face crop is, by the variance of the Laplacian of its centre (eyes, nose and mouth, without the background)
+    """
+    height, width = aligned_face.shape[:2]
+    centre = aligned_face[height // 4:height * 3 // 4, width // 4:width * 3 // 4]
+    variance = float(cv2.Laplacian(cv2.cvtColor(centre, cv2.COLOR_RGB2GRAY), cv2.CV_32F).var())
+    return float(np.clip(variance / BLUR_REFERENCE, 0, 1))
+
+def assess_face(face: dict, aligned_face: np.ndarray) -> dict[str, float]:
+    """
+    Scores how well a detected face can be recognised
+
+    Arguments
+    face: detected face (dictionary with bbox, kps and det_score, see FRManager.detect_faces)
+    aligned_face: aligned face crop of the face
+
+    Returns the size, det_score, pose and blur scores (each from 0 to 1), and their product as quality.
+    """
+    scores = {'size': size_score(face['bbox']), 'det_score': float(np.clip(face['det_score'], 0, 1)), 'pose': pose_score(face['kps']), 'blur': blur_score(aligned_face)}
+    scores['quality'] = float(np.prod(list(scores.values())))
+    return scores
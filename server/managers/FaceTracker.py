@@ -0,0 +1,120 @@
+import numpy as np
+
+from .FaceQuality import assess_face
+
+def box_iou(boxes: np.ndarray, other_boxes: np.ndarray) -> np.ndarray:
+    """
+    Returns the intersection over union of every box (x1, y1, x2, y2) in boxes with every box in other_boxes, of shape (len(boxes), len(other_boxes))
+    """
+    boxes, other_boxes = np.reshape(boxes, (-1, 4))[:, None], np.reshape(other_boxes, (-1, 4))[None]
+    width = np.clip(np.minimum(boxes[..., 2], other_boxes[..., 2]) - np.maximum(boxes[..., 0], other_boxes[..., 0]), 0, None)
+    height = np.clip(np.minimum(boxes[..., 3], other_boxes[..., 3]) - np.maximum(boxes[..., 1], other_boxes[..., 1]), 0, None)
+    intersection = width * height
+    area = (boxes[..., 2] - boxes[..., 0]) * (boxes[..., 3] - boxes[..., 1])
+    other_area = (other_boxes[..., 2] - other_boxes[..., 0]) * (other_boxes[..., 3] - other_boxes[..., 1])
+    return intersection / np.maximum(area + other_area - intersection, 1e-6)
+
+class Track():
+    """
+    A face followed across the frames of a video, with the result of its best recognition
+    """
+
+    def __init__(self, track_id: int, face: dict, timestamp: float):
+        self.id = track_id
+        self.bbox = np.asarray(face['bbox'], dtype=np.float32) #in the latest frame it was seen in
+        self.first_seen = self.last_seen = timestamp #seconds since the start of the video
+        self.frames = 1 #frames the face was detected in
+        self.missed = 0 #consecutive frames the face was not detected in
+        self.recognitions = 0
+
+        #Best recognition so far (see set_recognition)
+        self.quality = -1.0
+        self.face = face
+        self.frame = None
+        self.embedding = None
+        self.names = []
+        self.sim_scores = []
+
+    def set_recognition(self, face: dict, frame: np.ndarray, embedding: np.ndarray, names: list[str], sim_scores: list[float]) -> None:
+        """
+        Records a recognition of the track's face (face has the quality added by FaceTracker.update)
+        """
+        self.quality = face['quality']
+        self.face, self.frame, self.embedding, self.names, self.sim_scores = face, frame, embedding, names, sim_scores
+        self.recognitions += 1
+
+class FaceTracker():
+    """
+    Follows faces across frames by matching each detected face to the track of the previous frames whose box overlaps it most (IoU),
+    so that recognition only needs to run when a face first appears or is seen noticeably better than before
+    """
+
+    def __init__(self, iou_threshold: float = 0.3, max_missed: int = 5, quality_gain: float = 1.25):
+        """
+        Arguments
+        iou_threshold: minimum IoU of a face with the last box of a track to continue that track
+        max_missed: a track ends once its face has not been detected in this many consecutive frames
+        quality_gain: a face of an existing track is recognised again if its quality (see FaceQuality.assess_face) is this many times that of the track's best recognition
+        """
+
+        self.iou_threshold = iou_threshold
+        self.max_missed = max_missed
+        self.quality_gain = quality_gain
+        self.tracks: list[Track] = []
+        self.next_id = 0
+
+    def update(self, faces: list[dict], aligned_faces: list[np.ndarray], timestamp: float) -> tuple[list[tuple[Track, int]], list[Track]]:
+        """
+        Matches the faces detected in a frame to tracks, starting a track for every unmatched face
+
+        Arguments
+        faces: faces detected in the frame (see FRManager.detect_faces); their quality (see FaceQuality.assess_face) is added to them as 'quality'
+        aligned_faces: aligned face crops of the faces
+        timestamp: seconds since the start of the video
+
+        Returns the (track, index of face) pairs that should be recognised (new tracks, and tracks whose face improved),
+        and the tracks that ended.
+        """
+        for face, aligned_face in zip(faces, aligned_faces): face['quality'] = assess_face(face, aligned_face)['quality']
+
+        matched_faces, matched_tracks = {}, set()
+        if self.tracks and faces:
+            ious = box_iou(np.array([face['bbox'] for face in faces]), np.array([track.bbox for track in self.tracks]))
+            #Greedy matching, highest IoU first
+            for face_idx, track_idx in zip(*np.unravel_index(np.argsort(-ious, axis=None), ious.shape)):
+                if ious[face_idx, track_idx] < self.iou_threshold: break
+                if face_idx in matched_faces or track_idx in matched_tracks: continue
+                matched_faces[face_idx] = self.tracks[track_idx]
+                matched_tracks.add(track_idx)
+
+        to_recognise = []
+        for face_idx, face in enumerate(faces):
+            track = matched_faces.get(face_idx)
+            if track is None:
+                track = Track(self.next_id, face, timestamp)
+                self.next_id += 1
+                self.tracks.append(track)
+                to_recognise.append((track, face_idx))
+                continue
+
+            track.bbox = np.asarray(face['bbox'], dtype=np.float32)
+            track.last_seen = timestamp
+            track.frames += 1
+            track.missed = 0
+            if face['quality'] > track.quality * self.quality_gain: to_recognise.append((track, face_idx))
+
+        ended = []
+        for track_idx, track in enumerate(self.tracks):
+            if track_idx in matched_tracks or track.last_seen == timestamp: continue
+            track.missed += 1
+            if track.missed >= self.max_missed: ended.append(track)
+        if ended: self.tracks = [track for track in self.tracks if track.missed < self.max_missed]
+
+        return to_recognise, ended
+
+    def flush(self) -> list[Track]:
+        """
+        Ends and returns all tracks (at the end of a video)
+        """
+        tracks, self.tracks = self.tracks, []
+        return tracks
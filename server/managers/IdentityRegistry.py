@@ -0,0 +1,131 @@
+import numpy as np
+
+class IdentityRegistry():
+    """
+    Maps the integer ids (slots) of the vector index to the names of individuals and back
+
+    Slot -> name is stored in a numpy object array so the neighbours returned by a vector index query can be mapped to names in one vectorised lookup.
+    Name -> slots is a dictionary and deleted slots are kept in a set, so every lookup, update and deletion is O(1) regardless of the size of the gallery.
+    An individual has one slot per vector in the index (one in the "average" gallery mode, one per enrolled image in the "all" gallery mode).
+    Deleted slots stay assigned to their individual (to be reused when vectors are added back) until the registry is compacted.
+    """
+
+    def __init__(self, capacity: int = 1024):
+        """
+        Arguments
+        capacity: initial number of slots allocated (grows by doubling when full)
+        """
+
+        self.labels = np.empty(max(capacity, 1), dtype=object)
+        self.size = 0
+        self.slots_of = {}
+        self.deleted_ids = set()
+
+    @classmethod
+    def from_lists(cls, name_list: list[str], deleted_ids: list[int] = []) -> 'IdentityRegistry':
+        """
+        Creates a registry from a list of names (index of list is the slot) and a list of deleted slots
+        """
+
+        registry = cls(capacity=len(name_list))
+        registry.labels[:len(name_list)] = name_list
+        registry.size = len(name_list)
+        registry.deleted_ids = set(deleted_ids)
+
+        for slot, name in enumerate(name_list): registry.slots_of.setdefault(name, []).append(slot)
+
+        return registry
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.slots_of
+
+    @property
+    def live_count(self) -> int:
+        return self.size - len(self.deleted_ids)
+
+    @property
+    def name_list(self) -> list[str]:
+        return self.labels[:self.size].tolist()
+
+    def get_slots(self, name: str) -> list[int]:
+        """
+        Returns all slots of an individual (including deleted slots)
+        """
+
+        return self.slots_of.get(name, [])
+
+    def get_names(self, slots: np.ndarray | list[int]) -> np.ndarray:
+        """
+        Returns the names of the given slots (same shape as slots)
+        """
+
+        return self.labels[np.asarray(slots, dtype=np.int64)]
+
+    def add(self, names: list[str]) -> list[int]:
+        """
+        Appends names to new slots and returns those slots (which must be used as ids when adding their vectors to the vector index)
+        """
+
+        if self.size + len(names) > len(self.labels):
+            labels = np.empty(max(2 * len(self.labels), self.size + len(names)), dtype=object)
+            labels[:self.size] = self.labels[:self.size]
+            self.labels = labels
+
+        slots = list(range(self.size, self.size + len(names)))
+        self.labels[self.size:self.size + len(names)] = names
+        for name, slot in zip(names, slots): self.slots_of.setdefault(name, []).append(slot)
+        self.size += len(names)
+
+        return slots
+
+    def rename(self, name: str, new_name: str) -> None:
+        slots = self.slots_of.pop(name, [])
+        self.slots_of.setdefault(new_name, []).extend(slots)
+        self.labels[slots] = new_name
+
+    def mark_deleted(self, slot: int) -> bool:
+        """
+        Returns False if the slot was already deleted
+        """
+
+        if slot in self.deleted_ids: return False
+        self.deleted_ids.add(slot)
+        return True
+
+    def unmark_deleted(self, slot: int) -> bool:
+        """
+        Returns False if the slot was not deleted
+        """
+
+        if slot not in self.deleted_ids: return False
+        self.deleted_ids.remove(slot)
+        return True
+
+    def should_compact(self, min_deleted: int, max_deleted_ratio: float) -> bool:
+        """
+        Whether enough deleted slots have piled up to be worth reclaiming
+        """
+
+        return len(self.deleted_ids) >= min_deleted and len(self.deleted_ids) > max_deleted_ratio * self.size
+
+    def compact(self) -> np.ndarray:
+        """
+        Drops deleted slots, renumbering the remaining slots contiguously (in the same order)
+
+        Returns the old slots of the remaining names, i.e. old_slots[new_slot] = old_slot, for moving their vectors in the vector index.
+        """
+
+        old_slots = np.array([slot for slot in range(self.size) if slot not in self.deleted_ids], dtype=np.int64)
+        labels = self.labels[old_slots]
+
+        self.labels = np.empty(max(len(labels), 1), dtype=object)
+        self.labels[:len(labels)] = labels
+        self.size = len(labels)
+        self.slots_of = {}
+        for slot, name in enumerate(labels): self.slots_of.setdefault(name, []).append(slot)
+        self.deleted_ids = set()
+
+        return old_slots
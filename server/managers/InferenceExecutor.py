@@ -0,0 +1,107 @@
+import asyncio
+import logging
+import queue
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable
+
+logger = logging.getLogger(__name__)
+
+class InferenceQueueFull(Exception):
+    """
+    Raised when a job is submitted while the queue of the InferenceExecutor is full
+    """
+    pass
+
+class InferenceExecutor():
+    """
+    Runs blocking model jobs (detection, recognition, enrollment) on a fixed pool of worker threads, so they do not block the asyncio event loop
+
+    Jobs wait in a bounded queue; submitting a job while the queue is full raises InferenceQueueFull instead of letting requests pile up.
+    Each worker thread calls worker_init once when it starts (e.g. to load its own model session, see FRManager.bind_worker_model);
+    self.ready is set once every worker has done so.
+    """
+
+    def __init__(self, num_workers: int = 2, queue_size: int = 16, worker_init: Callable[[], Any] | None = None, name: str = 'fr-inference'):
+        """
+        Arguments
+        num_workers: number of worker threads
+        queue_size: maximum number of jobs waiting for a worker
+        worker_init: function called in each worker thread before it starts taking jobs
+        name: prefix of the names of the worker threads
+        """
+
+        self.num_workers = num_workers
+        self.jobs = queue.Queue(maxsize=queue_size)
+        self.worker_init = worker_init
+        self.name = name
+        self.workers = []
+        self.ready_count = 0 #workers whose worker_init has returned
+        self.ready = threading.Event()
+        self.ready_lock = threading.Lock()
+
+    def start(self) -> None:
+        for i in range(self.num_workers):
+            worker = threading.Thread(target=self._work, name='{}-{}'.format(self.name, i), daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+    def shutdown(self) -> None:
+        """
+        Stops the workers once the jobs already queued are done
+        """
+
+        for _ in self.workers: self.jobs.put(None)
+        for worker in self.workers: worker.join()
+        self.workers = []
+
+    def _work(self) -> None:
+        try:
+            if self.worker_init: self.worker_init()
+        except Exception:
+            #The worker still takes jobs (FRManager falls back to its shared model), but the executor is never reported ready
+            logger.exception("Inference worker failed to initialise")
+        else:
+            with self.ready_lock:
+                self.ready_count += 1
+                if self.ready_count == self.num_workers: self.ready.set()
+
+        while (job := self.jobs.get()) is not None:
+            future, fn, args, kwargs = job
+            if not future.set_running_or_notify_cancel(): continue #timed out while queued
+
+            try: future.set_result(fn(*args, **kwargs))
+            except BaseException as e: future.set_exception(e)
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        """
+        Queues fn(*args, **kwargs) and returns a Future of its result; raises InferenceQueueFull if the queue is full
+        """
+
+        future = Future()
+        try: self.jobs.put_nowait((future, fn, args, kwargs))
+        except queue.Full: raise InferenceQueueFull("Inference queue is full ({} jobs waiting)".format(self.jobs.maxsize))
+
+        return future
+
+    async def run(self, fn: Callable, *args, timeout: float | None = None, timeout_queued_only: bool = False, **kwargs) -> Any:
+        """
+        Runs fn(*args, **kwargs) on a worker and awaits its result
+
+        Raises InferenceQueueFull if the queue is full, and asyncio.TimeoutError if the result is not ready within timeout seconds
+        (a job still waiting in the queue is then dropped; a job already running is left to finish).
+
+        timeout_queued_only: only time out jobs still waiting in the queue, and await a job already running until it is done 
+        (for jobs that write, so that a timeout is never reported for a job whose changes are then committed)
+        """
+
+        future = self.submit(fn, *args, **kwargs)
+        result = asyncio.wrap_future(future)
+        try: 
+            return await asyncio.wait_for(asyncio.shield(result), timeout)
+        except asyncio.TimeoutError:
+            if future.cancel() or not timeout_queued_only: raise
+            return await result
+        except asyncio.CancelledError:
+            future.cancel() #e.g. the client disconnected; dropped if still queued
+            raise
@@ -0,0 +1,87 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable
+
+from metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+class MicroBatcher():
+    """
+    Collects items submitted from several threads into batches and processes each batch with a single call of batch_fn
+
+    A batch is closed once it holds max_batch_size items, or max_wait seconds after its first item arrived, whichever comes first.
+    batch_fn receives the list of items and must return a list of results in the same order.
+    Batches are processed on a thread of its own, which calls thread_init once when it starts (as worker_init of an InferenceExecutor);
+    self.ready is set once it has done so.
+    """
+
+    def __init__(self, batch_fn: Callable[[list[Any]], list[Any]], max_batch_size: int = 8, max_wait: float = 0.005, 
+                 thread_init: Callable[[], Any] | None = None):
+        """
+        Arguments
+        batch_fn: function processing a list of items into a list of results
+        max_batch_size: maximum number of items per batch
+        max_wait: maximum seconds to wait for more items after the first item of a batch arrived
+        thread_init: function called in the batching thread before it starts taking items
+        """
+
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.thread_init = thread_init
+        self.items = queue.Queue()
+        self.ready = threading.Event()
+
+        self.batch_size_histogram = Histogram(buckets=(1, 2, 4, 8, 16, 32, 64))
+        self.wait_time_histogram = Histogram(buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25))
+
+        threading.Thread(target=self._run, name='fr-microbatch', daemon=True).start()
+
+    def submit(self, item: Any) -> Future:
+        """
+        Queues an item and returns a Future of its result
+        """
+
+        future = Future()
+        self.items.put((time.monotonic(), item, future))
+        return future
+
+    def stats(self) -> dict:
+        return {
+            'max_batch_size': self.max_batch_size,
+            'max_wait': self.max_wait,
+            'batch_size': self.batch_size_histogram.snapshot(),
+            'wait_time': self.wait_time_histogram.snapshot()
+        }
+
+    def _run(self) -> None:
+        try:
+            if self.thread_init: self.thread_init()
+        except Exception:
+            logger.exception("Micro-batching thread failed to initialise")
+        else:
+            self.ready.set()
+
+        while True:
+            batch = [self.items.get()]
+            deadline = batch[0][0] + self.max_wait
+
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0: break
+                try: batch.append(self.items.get(timeout=remaining))
+                except queue.Empty: break
+
+            start = time.monotonic()
+            for enqueued, _, _ in batch: self.wait_time_histogram.observe(start - enqueued)
+            self.batch_size_histogram.observe(len(batch))
+
+            try:
+                results = self.batch_fn([item for _, item, _ in batch])
+                for (_, _, future), result in zip(batch, results): future.set_result(result)
+            except BaseException as e:
+                for _, _, future in batch: future.set_exception(e)
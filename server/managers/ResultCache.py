@@ -0,0 +1,69 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable
+
+class ResultCache():
+    """
+    Thread-safe cache evicting the least recently used entry once it holds max_size entries, and entries older than ttl seconds
+
+    A max_size of 0 disables the cache (get always misses and put does nothing).
+    """
+
+    def __init__(self, max_size: int = 256, ttl: float = 300.0):
+        """
+        Arguments
+        max_size: maximum number of entries kept
+        ttl: seconds an entry stays valid after it was stored (0 keeps entries until they are evicted by size)
+        """
+
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict() #key -> (time stored, value), least recently used first
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, key: Hashable) -> Any | None:
+        """
+        Returns the value stored for key, or None if it is not cached or has expired
+        """
+        if not self.max_size: return None
+
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and self.ttl and time.monotonic() - entry[0] > self.ttl:
+                del self.entries[key]
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        if not self.max_size: return
+
+        with self.lock:
+            self.entries[key] = (time.monotonic(), value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size: self.entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self.lock: self.entries.clear()
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+                'size': len(self.entries),
+                'hits': self.hits,
+                'misses': self.misses
+            }
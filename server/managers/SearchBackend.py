@@ -0,0 +1,175 @@
+import numpy as np
+from voyager import Index, Space, StorageDataType
+
+SEARCH_BACKENDS = ('hnsw', 'exact', 'auto')
+
+class SearchBackend():
+    """
+    Vector index of FRManager: vectors stored by integer id (slot), searched by cosine distance
+
+    Implementations follow the part of the voyager.Index API used by FRManager, so that either can be used behind self.vector_index.
+    """
+    name: str = ''
+    lossy: bool = False #whether stored vectors are less precise than float32 (see FRManager.rescore_neighbours)
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    def add_items(self, vectors: np.ndarray, ids: list[int]) -> None:
+        """
+        Stores vectors (shape (n, 512)) at the given ids, replacing (and undeleting) vectors already stored at them
+        """
+        raise NotImplementedError
+
+    def get_vectors(self, ids: list[int]) -> np.ndarray:
+        """
+        Returns the (normalised) vectors stored at the given ids
+        """
+        raise NotImplementedError
+
+    def mark_deleted(self, id: int) -> None:
+        """
+        Excludes the vector stored at id from queries
+        """
+        raise NotImplementedError
+
+    def query(self, vectors: np.ndarray, k: int = 1) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Finds the k nearest neighbours of each vector (shape (n, 512), or a single vector)
+
+        Returns the ids of the neighbours, closest first, and their cosine distances (shape (n, k), or (k,) for a single vector).
+        """
+        raise NotImplementedError
+
+    def save(self, filepath: str) -> None:
+        raise NotImplementedError
+
+class HNSWBackend(SearchBackend):
+    """
+    Approximate search over a Voyager HNSW index
+    """
+    name = 'hnsw'
+    file_extension = '.voy'
+
+    def __init__(self, index: Index | None = None, storage_data_type: StorageDataType = StorageDataType.Float32, 
+                 M: int = 12, ef_construction: int = 200, ef: int = 10, max_elements: int = 1):
+        """
+        Arguments
+        index: existing Voyager index to use (a new empty index is created if None)
+        storage_data_type: precision of the vectors stored in a new index
+        M: number of links per vector in a new index (more links improve recall at the cost of memory and build time)
+        ef_construction: number of candidates searched when inserting a vector into a new index (higher improves the quality of the graph but slows insertions)
+        ef: number of candidates searched per query (at least k are searched; higher improves recall but slows queries)
+        max_elements: number of vectors a new index is allocated for (it grows when full, which copies the index)
+        """
+
+        if index is None: 
+            index = Index(Space.Cosine, num_dimensions=512, M=M, ef_construction=ef_construction, 
+                          max_elements=max(max_elements, 1), storage_data_type=storage_data_type)
+        self.index = index
+        self.index.ef = ef
+        self.lossy = self.index.storage_data_type != StorageDataType.Float32
+
+    @classmethod
+    def load(cls, filepath: str, ef: int = 10) -> 'HNSWBackend':
+        return cls(Index.load(filepath), ef=ef)
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def add_items(self, vectors: np.ndarray, ids: list[int]) -> None:
+        self.index.add_items(vectors, ids=ids)
+
+    def get_vectors(self, ids: list[int]) -> np.ndarray:
+        return self.index.get_vectors(ids)
+
+    def mark_deleted(self, id: int) -> None:
+        self.index.mark_deleted(id)
+
+    def query(self, vectors: np.ndarray, k: int = 1) -> tuple[np.ndarray, np.ndarray]:
+        return self.index.query(vectors, k=k)
+
+    def save(self, filepath: str) -> None:
+        self.index.save(filepath)
+
+class ExactBackend(SearchBackend):
+    """
+    Exact search by a single matrix multiplication of the queries with all stored vectors (normalised float32, one row per id)
+
+    Faster than HNSW for small and medium galleries and has perfect recall. Deleted ids are stored as rows of NaN, which are never returned.
+    """
+    name = 'exact'
+    file_extension = '.npy'
+
+    def __init__(self, capacity: int = 1024):
+        """
+        Arguments
+        capacity: initial number of ids allocated (grows by doubling when full)
+        """
+
+        self.vectors = np.full((max(capacity, 1), 512), np.nan, dtype=np.float32)
+        self.size = 0
+        self.live_count = 0
+
+    @classmethod
+    def load(cls, filepath: str) -> 'ExactBackend':
+        """
+        Memory-maps vectors saved by save (copy-on-write, so changes are not written back to the file)
+        """
+        backend = cls(capacity=1)
+        backend.vectors = np.load(filepath, mmap_mode='c')
+        backend.size = len(backend.vectors)
+        backend.live_count = int(np.count_nonzero(~np.isnan(backend.vectors[:, 0])))
+        return backend
+
+    def __len__(self) -> int:
+        return self.live_count
+
+    def add_items(self, vectors: np.ndarray, ids: list[int]) -> None:
+        if not len(ids): return None
+
+        end = max(ids) + 1
+        if end > len(self.vectors):
+            vectors_grown = np.full((max(2 * len(self.vectors), end), 512), np.nan, dtype=np.float32)
+            vectors_grown[:self.size] = self.vectors[:self.size]
+            self.vectors = vectors_grown
+
+        vectors = np.asarray(vectors, dtype=np.float32).reshape((-1, 512))
+        self.live_count -= int(np.count_nonzero(~np.isnan(self.vectors[ids, 0])))
+        self.vectors[ids] = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        self.live_count += len(ids)
+        self.size = max(self.size, end)
+
+    def get_vectors(self, ids: list[int]) -> np.ndarray:
+        return np.array(self.vectors[ids])
+
+    def mark_deleted(self, id: int) -> None:
+        if np.isnan(self.vectors[id, 0]): return None
+        self.vectors[id] = np.nan
+        self.live_count -= 1
+
+    def query(self, vectors: np.ndarray, k: int = 1) -> tuple[np.ndarray, np.ndarray]:
+        single = np.ndim(vectors) == 1
+        queries = np.asarray(vectors, dtype=np.float32).reshape((-1, 512))
+        queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        k = min(k, self.live_count)
+        if k == 0:
+            neighbours, distances = np.empty((len(queries), 0), dtype=np.uint64), np.empty((len(queries), 0), dtype=np.float32)
+            return (neighbours[0], distances[0]) if single else (neighbours, distances)
+
+        similarities = queries @ self.vectors[:self.size].T
+        similarities[np.isnan(similarities)] = -np.inf #deleted ids
+
+        if k < self.size: candidates = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+        else: candidates = np.broadcast_to(np.arange(self.size), (len(queries), self.size))[:, :k]
+        candidate_similarities = np.take_along_axis(similarities, candidates, axis=1)
+        order = np.argsort(-candidate_similarities, axis=1, kind='stable')
+
+        neighbours = np.take_along_axis(candidates, order, axis=1).astype(np.uint64)
+        distances = (1 - np.take_along_axis(candidate_similarities, order, axis=1)).astype(np.float32)
+        return (neighbours[0], distances[0]) if single else (neighbours, distances)
+
+    def save(self, filepath: str) -> None:
+        with open(filepath, 'wb') as file: np.save(file, self.vectors[:self.size])
+
+SEARCH_BACKEND_CLASSES = {backend.name: backend for backend in (HNSWBackend, ExactBackend)}
@@ -0,0 +1,81 @@
+import os
+import time
+from typing import Iterator
+from urllib.parse import urlsplit
+
+import cv2
+import numpy as np
+
+def resolve_video_source(source: str, source_dir: str = '', url_allowlist: list[str] | None = None) -> str:
+    """
+    Checks that a video source sent by a client may be opened: a URL starting with one of url_allowlist, or a video file in source_dir
+
+    Arguments
+    source: URL of a stream, or path of a video file relative to source_dir
+    source_dir: directory of the video files that may be opened ('' allows no files)
+    url_allowlist: URL prefixes of the streams that may be opened; the scheme, host and port must be the same, and the path must start with the prefix's path
+
+    Returns the URL, or the absolute path of the video file.
+    Raises ValueError if the source may not be opened.
+    """
+    if '://' in source:
+        url = urlsplit(source)
+        for prefix in map(urlsplit, url_allowlist or []):
+            prefix_path = prefix.path.rstrip('/')
+            if (url.scheme, url.netloc.lower()) == (prefix.scheme, prefix.netloc.lower()) and (url.path == prefix_path or url.path.startswith(prefix_path + '/')): return source
+        raise ValueError("Stream URL {} is not allowed".format(source))
+
+    if not source_dir: raise ValueError("Video files cannot be processed, only allowed stream URLs")
+    root = os.path.realpath(source_dir)
+    file_path = os.path.realpath(os.path.join(root, source))
+    if os.path.commonpath([root, file_path]) != root or not os.path.isfile(file_path): raise ValueError("Video file {} not found".format(source))
+    return file_path
+
+def iter_video_frames(source: str, sample_fps: float = 5.0, max_seconds: float | None = None, loop: bool = False,
+                      timeout: float | None = None, io_timeout: float = 10.0) -> Iterator[tuple[float, np.ndarray]]:
+    """
+    Reads frames of a video file or stream (anything OpenCV can open, e.g. an RTSP or MJPEG URL), sampled at sample_fps
+
+    Frames that are not sampled are skipped without being decoded. Timestamps are the position in the video for files,
+    and the time since the stream was opened for streams (which do not report a frame rate).
+
+    Arguments
+    source: path of a video file, or URL of a stream
+    sample_fps: frames per second of video returned (0 returns every frame)
+    max_seconds: stop after this many seconds of video (None reads until the end, which a live stream never reaches)
+    loop: start a video file again from the beginning when it ends (e.g. to stand in for a stream)
+    timeout: stop after this many seconds of processing (None for no limit), however much video was read by then
+    io_timeout: seconds opening the source, or reading a frame, may block for (with the FFmpeg backend, used for files and streams)
+
+    Yields the timestamp (seconds) and the frame (RGB numpy array) of each sampled frame.
+    Raises ValueError if the source cannot be opened.
+    """
+    capture = cv2.VideoCapture(source, cv2.CAP_ANY, [cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, int(io_timeout * 1000), cv2.CAP_PROP_READ_TIMEOUT_MSEC, int(io_timeout * 1000)])
+    if not capture.isOpened(): raise ValueError("Cannot open video source {}".format(source))
+
+    fps = capture.get(cv2.CAP_PROP_FPS)
+    if not fps or fps > 1000: fps = 0.0 #streams report no (or a bogus) frame rate
+    start_time = time.monotonic()
+    frame_idx, next_sample, offset = 0, 0.0, 0.0
+
+    try:
+        while True:
+            timestamp = offset + frame_idx / fps if fps else time.monotonic() - start_time
+            if max_seconds is not None and timestamp > max_seconds: return
+            if timeout is not None and time.monotonic() - start_time > timeout: return
+
+            if not capture.grab():
+                if not loop or frame_idx == 0: return
+                capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                offset, frame_idx = timestamp, 0
+                continue
+            frame_idx += 1
+
+            if timestamp + 1e-6 < next_sample: continue
+            retrieved, frame = capture.retrieve()
+            if not retrieved: continue
+            next_sample = timestamp + 1 / sample_fps if sample_fps else timestamp
+
+            yield timestamp, cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    finally:
+        capture.release()
@@ -0,0 +1,118 @@
+"""
+Latency timers and counters of the server, exposed in the Prometheus text format by GET /metrics
+
+Stages of request handling are timed with timed(stage), which also records an OpenTelemetry span once init_tracing has been called
+(spans are exported by whatever OpenTelemetry SDK is configured for the process, e.g. with opentelemetry-instrument).
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Callable, Iterator
+
+logger = logging.getLogger(__name__)
+
+class Histogram():
+    """
+    Thread-safe histogram with fixed bucket upper bounds (counts are cumulative, as in Prometheus histograms)
+    """
+
+    def __init__(self, buckets: tuple[float, ...]):
+        self.buckets = tuple(sorted(buckets))
+        self.bucket_counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        with self.lock:
+            self.count += 1
+            self.sum += value
+            for i, bound in enumerate(self.buckets):
+                if value <= bound: self.bucket_counts[i] += 1
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {
+                'buckets': {str(bound): count for bound, count in zip(self.buckets, self.bucket_counts)},
+                'count': self.count,
+                'sum': self.sum
+            }
+
+STAGES = ('base64_decode', 'file_write', 'image_decode', 'detection', 'face_quality', 'recognition', 'vector_query', 'db_commit')
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+stage_seconds = {stage: Histogram(STAGE_BUCKETS) for stage in STAGES}
+faces_per_image = Histogram((0, 1, 2, 4, 8, 16, 32, 64))
+
+#Metrics registered by other modules: name -> (help text, histogram or function returning the current value of a gauge)
+histograms: dict[str, tuple[str, Histogram]] = {'fr_faces_per_image': ('Faces detected per image sent for recognition', faces_per_image)}
+gauges: dict[str, tuple[str, Callable[[], float]]] = {}
+counters: dict[str, tuple[str, Callable[[], float]]] = {}
+
+tracer = None
+
+def init_tracing() -> bool:
+    """
+    Records a span for every timed stage (requires the opentelemetry-api package)
+
+    Returns whether tracing was enabled.
+    """
+    global tracer
+    try:
+        from opentelemetry import trace
+    except ImportError:
+        logger.warning("OpenTelemetry tracing is enabled but the opentelemetry-api package is not installed")
+        return False
+
+    tracer = trace.get_tracer('face-it')
+    return True
+
+@contextmanager
+def timed(stage: str) -> Iterator[None]:
+    """
+    Times the enclosed code as one of STAGES (and records it as an OpenTelemetry span if tracing is enabled)
+    """
+    start = time.perf_counter()
+    with tracer.start_as_current_span('fr.{}'.format(stage)) if tracer else nullcontext():
+        try: yield
+        finally: stage_seconds[stage].observe(time.perf_counter() - start)
+
+def register_gauge(name: str, help_text: str, fn: Callable[[], float]) -> None:
+    gauges[name] = (help_text, fn)
+
+def register_counter(name: str, help_text: str, fn: Callable[[], float]) -> None:
+    counters[name] = (help_text, fn)
+
+def register_histogram(name: str, help_text: str, histogram: Histogram) -> None:
+    histograms[name] = (help_text, histogram)
+
+def _format_histogram(name: str, histogram: Histogram, labels: str = '') -> list[str]:
+    snapshot = histogram.snapshot()
+    separator = ',' if labels else ''
+    lines = ['{}_bucket{{{}{}le="{}"}} {}'.format(name, labels, separator, bound, count) for bound, count in snapshot['buckets'].items()]
+    lines.append('{}_bucket{{{}{}le="+Inf"}} {}'.format(name, labels, separator, snapshot['count']))
+    lines.append('{}_sum{} {}'.format(name, '{{{}}}'.format(labels) if labels else '', snapshot['sum']))
+    lines.append('{}_count{} {}'.format(name, '{{{}}}'.format(labels) if labels else '', snapshot['count']))
+    return lines
+
+def render() -> str:
+    """
+    Returns all metrics in the Prometheus text exposition format
+    """
+    lines = ['# HELP fr_stage_duration_seconds Duration of each stage of handling requests', '# TYPE fr_stage_duration_seconds histogram']
+    for stage, histogram in stage_seconds.items(): lines.extend(_format_histogram('fr_stage_duration_seconds', histogram, 'stage="{}"'.format(stage)))
+
+    for name, (help_text, histogram) in histograms.items():
+        lines.extend(['# HELP {} {}'.format(name, help_text), '# TYPE {} histogram'.format(name)])
+        lines.extend(_format_histogram(name, histogram))
+
+    for metric_type, registry in (('gauge', gauges), ('counter', counters)):
+        for name, (help_text, fn) in registry.items():
+            try: value = float(fn())
+            except Exception:
+                logger.exception("Failed to read %s %s", metric_type, name)
+                continue
+            lines.extend(['# HELP {} {}'.format(name, help_text), '# TYPE {} {}'.format(name, metric_type), '{} {}'.format(name, value)])
+
+    return '\n'.join(lines) + '\n'
@@ -1,11 +1,25 @@
-from fastapi import APIRouter, Depends, Query, Body, Response, HTTPException, status
-from sqlmodel import Session, SQLModel
-from typing import Annotated
+from fastapi import APIRouter, Depends, Query, Body, File, Form, Path, UploadFile, Request, Response, HTTPException, status
+from fastapi.responses import FileResponse, StreamingResponse
+from sqlmodel import Session
+from typing import IO, Annotated, Any, Callable, Iterator
+from email.utils import formatdate, parsedate_to_datetime
+import asyncio
+import functools
+import os
+import re
+import tempfile
+import zipfile
+
+import metrics
+from config import VECTOR_INDEX_SNAPSHOT_PATH, FR_MANAGER_OPTIONS, INFERENCE_WORKERS, INFERENCE_QUEUE_SIZE, INFERENCE_TIMEOUT, STREAM_SOURCE_DIR, STREAM_URL_ALLOWLIST, STREAM_MAX_SECONDS, STREAM_WORKERS, STREAM_QUEUE_SIZE
 
 from managers.FRManager import FRManager
-from database.database import get_session, ResponseMessage, MessageType, engine
-from database.Personnel import PersonnelFR_Update, PersonnelFR_Read, get_all_PersonFR, get_all_PersonFR_embed, get_one_PersonFR, add_PersonFR, update_PersonFR, delete_PersonFR, delete_all_PersonFR
-from database.Detection import Detection_Create, Detection_Read, get_detections, add_detections, delete_detections, delete_all_detections
+from managers.InferenceExecutor import InferenceExecutor, InferenceQueueFull
+from managers.VideoSource import resolve_video_source
+from database.database import get_session, init_database, ResponseMessage, MessageType, engine
+from database.Personnel import PersonnelFR_Update, PersonnelFR_Read, PersonnelFR_Summary, PersonnelFR_BulkRead, init_PersonFR_search, search_PersonFR, bulk_add_PersonFR, load_PersonFR_vector_index, get_all_PersonFR, get_one_PersonFR, add_PersonFR, update_PersonFR, delete_PersonFR, delete_all_PersonFR
+from database.imgfs import Mode, ImgFormat, THUMBNAIL_SIZES, img_writer, get_img_file_path, get_thumbnail_file_path, iter_img_zip, group_img_sources
+from database.Detection import Detection_Create, Detection_Stream, Detection_Read, get_detection_cursor, get_detections, add_detections, add_stream_detections, delete_detections, delete_all_detections
 
 router = APIRouter(
     prefix="/FR",
@@ -13,58 +27,265 @@ router = APIRouter(
     responses={404: {"description": "Not found"}}
 )
 
-with Session(engine) as session:
-    SQLModel.metadata.create_all(engine)
-    name_list, vector_list = get_all_PersonFR_embed(session)  
-    print(len(name_list), len(vector_list))
-    fr_manager = FRManager(sql_personnel=[name_list, vector_list])
+fr_manager: FRManager | None = None #created by startup
+#Model jobs run on worker threads (each with its own model) instead of the event loop; created by startup and stopped in main.lifespan
+inference_executor: InferenceExecutor | None = None
+#Stream jobs run for minutes, so they get workers of their own rather than holding up the inference workers
+stream_executor: InferenceExecutor | None = None
+
+def startup() -> None:
+    """
+    Opens the database and loads the vector index, then starts the inference and stream workers, which load and warm up their models in the background (see is_ready)
+    Called by main.lifespan, so that importing the app does not touch the database or load models.
+    """
+    global fr_manager, inference_executor, stream_executor
+
+    with Session(engine) as session:
+        init_database()
+        init_PersonFR_search(session)
+        fr_manager = FRManager(**FR_MANAGER_OPTIONS)
+        load_PersonFR_vector_index(session, fr_manager, VECTOR_INDEX_SNAPSHOT_PATH)
+
+    inference_executor = InferenceExecutor(INFERENCE_WORKERS, INFERENCE_QUEUE_SIZE, worker_init=fr_manager.bind_worker_model)
+    inference_executor.start()
+    stream_executor = InferenceExecutor(STREAM_WORKERS, STREAM_QUEUE_SIZE, worker_init=fr_manager.bind_worker_model, name='fr-stream')
+    stream_executor.start()
+
+    metrics.register_gauge('fr_vector_index_live_vectors', 'Vectors searched by detection', lambda: fr_manager.registry.live_count)
+    metrics.register_gauge('fr_vector_index_deleted_slots', 'Deleted slots in the vector index waiting to be reclaimed by compaction', lambda: len(fr_manager.registry.deleted_ids))
+    metrics.register_gauge('fr_vector_index_slots', 'Slots in the vector index (live and deleted)', lambda: len(fr_manager.registry))
+    metrics.register_gauge('fr_inference_queue_size', 'Jobs waiting for an inference worker', lambda: inference_executor.jobs.qsize())
+    metrics.register_gauge('fr_inference_workers_ready', 'Inference workers that loaded and warmed up their model', lambda: inference_executor.ready_count)
+    metrics.register_gauge('fr_stream_queue_size', 'Stream jobs waiting for a stream worker', lambda: stream_executor.jobs.qsize())
+    for cache_name, cache in (('result', fr_manager.result_cache), ('embedding', fr_manager.embedding_cache)):
+        metrics.register_counter('fr_{}_cache_hits_total'.format(cache_name), 'Detections answered from the {} cache'.format(cache_name), lambda cache=cache: cache.hits)
+        metrics.register_counter('fr_{}_cache_misses_total'.format(cache_name), 'Detections not found in the {} cache'.format(cache_name), lambda cache=cache: cache.misses)
+    if fr_manager.batcher:
+        metrics.register_histogram('fr_microbatch_size', 'Detections searched per micro-batch', fr_manager.batcher.batch_size_histogram)
+        metrics.register_histogram('fr_microbatch_wait_seconds', 'Time detections waited in the micro-batch queue', fr_manager.batcher.wait_time_histogram)
+
+def is_ready() -> bool:
+    """
+    Whether the vector index is loaded and every inference and stream worker (and the micro-batching thread, if enabled) has loaded and warmed up its model
+    """
+    if inference_executor is None or stream_executor is None: return False
+    return inference_executor.ready.is_set() and stream_executor.ready.is_set() and (fr_manager.batcher is None or fr_manager.batcher.ready.is_set())
+
+async def run_inference(fn: Callable, *args, timeout: float | None = INFERENCE_TIMEOUT, write: bool = False, 
+                        executor: InferenceExecutor | None = None, **kwargs) -> Any:
+    """
+    Runs a job that uses the model on inference_executor, responding with 429 if too many jobs are waiting and 504 if it times out
+
+    write: the job changes records, so it only times out while queued; once running it is awaited until done 
+    (otherwise the client could get a 504 for changes that are then committed)
+    executor: runs the job on this executor instead of inference_executor (e.g. stream_executor)
+    """
+    try: 
+        return await (executor or inference_executor).run(fn, *args, timeout=timeout, timeout_queued_only=write, **kwargs)
+    except InferenceQueueFull as e: 
+        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=str(e), headers={'Retry-After': '1'})
+    except asyncio.TimeoutError: 
+        raise HTTPException(status_code=status.HTTP_504_GATEWAY_TIMEOUT, detail="Inference did not complete within {} seconds".format(timeout))
+
+def in_session(fn: Callable) -> Callable:
+    """
+    Wraps a job taking a Session as its first argument so that it opens its own Session on the worker thread running it
+    (the Session of a request is closed when the request ends, which may be while its job is still running if it timed out)
+    """
+    @functools.wraps(fn)
+    def job(*args, **kwargs):
+        with Session(engine) as session: return fn(session, *args, **kwargs)
+    return job
+
+#Raw image bodies are kept in memory up to this size, then spooled to a temporary file
+SPOOL_MAX_MEMORY = 1024 * 1024
+RAW_IMG_OPENAPI = {'requestBody': {'required': True, 'content': {'image/jpeg': {'schema': {'type': 'string', 'format': 'binary'}}, 
+                                                                 'image/png': {'schema': {'type': 'string', 'format': 'binary'}}}}}
+
+async def spool_img_body(request: Request) -> IO[bytes]:
+    """
+    Streams a raw image request body (Content-Type image/* or application/octet-stream) in chunks into a spooled temporary file
+    """
+    content_type = request.headers.get('content-type', '')
+    if not content_type.startswith(('image/', 'application/octet-stream')): 
+        raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail="Content-Type must be an image type, got '{}'".format(content_type))
+
+    img_file = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY)
+    async for chunk in request.stream(): img_file.write(chunk)
+
+    if img_file.tell() == 0: 
+        img_file.close()
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Request body is empty")
+
+    img_file.seek(0)
+    return img_file
+
+#Image files are never modified in place (new uploads get new filenames), so clients may reuse them for a day before revalidating
+IMG_CACHE_CONTROL = 'private, max-age=86400'
+IMG_CHUNK_SIZE = 64 * 1024
+BYTE_RANGE_PATTERN = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+def parse_byte_range(range_header: str, file_size: int) -> tuple[int, int] | None:
+    """
+    Parses a single byte range of a Range header into (start, end) (inclusive)
+
+    Returns None if the range cannot be satisfied, and (0, file_size - 1) for the whole file if the header is malformed or has several ranges (which are not supported).
+    """
+    match = BYTE_RANGE_PATTERN.match(range_header.strip())
+    if not match or match.group(1) == match.group(2) == '': return 0, file_size - 1
+
+    if match.group(1) == '': #suffix range, i.e. the last n bytes
+        length = int(match.group(2))
+        if length == 0: return None
+        return max(file_size - length, 0), file_size - 1
+
+    start = int(match.group(1))
+    end = min(int(match.group(2)), file_size - 1) if match.group(2) else file_size - 1
+    if start > end: return None
+    return start, end
+
+def iter_file_range(file_path: str, start: int, end: int) -> Iterator[bytes]:
+    with open(file_path, 'rb') as file:
+        file.seek(start)
+        remaining = end - start + 1
+        while remaining > 0 and (chunk := file.read(min(IMG_CHUNK_SIZE, remaining))):
+            remaining -= len(chunk)
+            yield chunk
+
+def img_file_response(request: Request, file_path: str) -> Response:
+    """
+    Streams an image file, answering conditional requests (If-None-Match / If-Modified-Since) with 304 and Range requests with 206
+    """
+    stat_result = os.stat(file_path)
+    etag = '"{:x}-{:x}"'.format(stat_result.st_mtime_ns, stat_result.st_size)
+    last_modified = formatdate(stat_result.st_mtime, usegmt=True)
+    headers = {'ETag': etag, 'Last-Modified': last_modified, 'Cache-Control': IMG_CACHE_CONTROL, 'Accept-Ranges': 'bytes'}
+
+    if_none_match = request.headers.get('if-none-match')
+    if_modified_since = request.headers.get('if-modified-since')
+    if if_none_match:
+        not_modified = if_none_match.strip() == '*' or etag in [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]
+    elif if_modified_since:
+        try: not_modified = int(stat_result.st_mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError): not_modified = False
+    else: 
+        not_modified = False
+    if not_modified: return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    range_header = request.headers.get('range')
+    if range_header and request.headers.get('if-range', etag) in (etag, last_modified):
+        byte_range = parse_byte_range(range_header, stat_result.st_size)
+        if byte_range is None: 
+            return Response(status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE, headers={'Content-Range': 'bytes */{}'.format(stat_result.st_size)})
+        
+        start, end = byte_range
+        if (start, end) != (0, stat_result.st_size - 1):
+            headers.update({'Content-Range': 'bytes {}-{}/{}'.format(start, end, stat_result.st_size), 'Content-Length': str(end - start + 1)})
+            return StreamingResponse(iter_file_range(file_path, start, end), status_code=status.HTTP_206_PARTIAL_CONTENT, media_type='image/jpeg', headers=headers)
+
+    return FileResponse(file_path, media_type='image/jpeg', headers=headers, stat_result=stat_result)
 
 @router.get("/")
-async def test_db():
+def test_db():
     return "HELLO THERE"
 
 @router.get("/person/", response_model=PersonnelFR_Read | list[PersonnelFR_Read] | ResponseMessage, status_code=status.HTTP_200_OK)
-async def get_person_router(
+def get_person_router(
     *, 
     session: Session = Depends(get_session), 
     name: Annotated[str | None, Query(title="Name of individual")] = None,
     offset: Annotated[int | None, Query(title="Offset")] = None,
     limit: Annotated[int | None, Query(title="Limit")] = None,
-    exact_match: Annotated[bool | None, Query(title="Specifiy for exact match")] = False
+    exact_match: Annotated[bool | None, Query(title="Specifiy for exact match")] = False,
+    img_format: Annotated[ImgFormat, Query(title="Return images as base64, URLs, base64 thumbnails or thumbnail URLs")] = ImgFormat.base64
     ) -> list[PersonnelFR_Read] | ResponseMessage:
 
     if not exact_match:
-        return get_all_PersonFR(session, name, offset, limit)
+        return get_all_PersonFR(session, name, offset, limit, img_format)
 
-    res = get_one_PersonFR(session, name)
+    res = get_one_PersonFR(session, name, img_format)
 
     if type(res) == ResponseMessage and res.type == MessageType.error: raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=res.message)
 
     return [res]
 
+@router.get("/person/search/", response_model=list[PersonnelFR_Summary], status_code=status.HTTP_200_OK)
+def search_person_router(
+    *,
+    session: Session = Depends(get_session),
+    name: Annotated[str | None, Query(title="Part of the name of individual")] = None,
+    after: Annotated[str | None, Query(title="Name of the last individual of the previous page")] = None,
+    limit: Annotated[int, Query(title="Limit", ge=1, le=1000)] = 50
+) -> list[PersonnelFR_Summary]:
+    
+    return search_PersonFR(session, name, after, limit)
+
 @router.post("/person/",  response_model=PersonnelFR_Read | ResponseMessage, status_code=status.HTTP_201_CREATED)
 async def post_person_router (
     *, 
-    session: Session = Depends(get_session),
     person: Annotated[PersonnelFR_Update, Body(title="Details of individual")]
 ) -> PersonnelFR_Read | ResponseMessage: 
    
-    res = add_PersonFR(session, person, fr_manager)
+    res = await run_inference(in_session(add_PersonFR), person, fr_manager, write=True)
 
     if type(res) == ResponseMessage and res.type == MessageType.error: raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=res.message)
     
     return res
 
+@router.post("/person/upload/",  response_model=PersonnelFR_Read | ResponseMessage, status_code=status.HTTP_201_CREATED)
+async def post_person_upload_router(
+    *,
+    name: Annotated[str, Form(title="Name of individual")],
+    images: Annotated[list[UploadFile], File(title="Reference images of individual")]
+) -> PersonnelFR_Read | ResponseMessage:
+    
+    res = await run_inference(in_session(add_PersonFR), PersonnelFR_Update(name=name), fr_manager, img_files=[image.file for image in images], write=True)
+
+    if type(res) == ResponseMessage and res.type == MessageType.error: raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=res.message)
+    
+    return res
+
+@router.post("/person/raw/",  response_model=PersonnelFR_Read | ResponseMessage, status_code=status.HTTP_201_CREATED, openapi_extra=RAW_IMG_OPENAPI)
+async def post_person_raw_router(
+    *,
+    name: Annotated[str, Query(title="Name of individual")],
+    request: Request
+) -> PersonnelFR_Read | ResponseMessage:
+    
+    #img_file is not closed here as the job may outlive a request timed out while it was queued; it is deleted once no longer referenced
+    res = await run_inference(in_session(add_PersonFR), PersonnelFR_Update(name=name), fr_manager, img_files=[await spool_img_body(request)], write=True)
+
+    if type(res) == ResponseMessage and res.type == MessageType.error: raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=res.message)
+    
+    return res
+
+@router.post("/person/bulk/", response_model=PersonnelFR_BulkRead, status_code=status.HTTP_201_CREATED)
+async def post_person_bulk_router(
+    *,
+    files: Annotated[list[UploadFile], File(title="Images and/or zip archives of images, named after the individual (e.g. 'XXyy (1).jpg')")],
+    chunk_size: Annotated[int, Query(title="Number of individuals written per transaction", ge=1)] = 256
+) -> PersonnelFR_BulkRead:
+    
+    img_sources = []
+    for file in files:
+        if not (file.filename or '').lower().endswith('.zip'):
+            img_sources.append((file.filename or '', lambda file=file: file.file))
+            continue
+        
+        try: img_sources.extend(iter_img_zip(zipfile.ZipFile(file.file)))
+        except zipfile.BadZipFile: raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="{} is not a valid zip archive".format(file.filename))
+
+    return await run_inference(in_session(bulk_add_PersonFR), group_img_sources(img_sources), fr_manager, chunk_size, timeout=None, write=True)
+
 @router.patch("/person/", response_model=PersonnelFR_Read | ResponseMessage, status_code=status.HTTP_200_OK)
 async def patch_person_router(
     *,
-    session: Session = Depends(get_session),
     name: Annotated[str, Query(title="Current Name of individual")],
     person: Annotated[PersonnelFR_Update, Body(title="Personal data to update")],
     response: Response
 ) -> PersonnelFR_Read | ResponseMessage:
     
-    res = update_PersonFR(session, name, person, fr_manager)
+    res = await run_inference(in_session(update_PersonFR), name, person, fr_manager, write=True)
 
     if type(res) == ResponseMessage:
         if res.type == MessageType.error: raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=res.message)
@@ -76,7 +297,7 @@ async def patch_person_router(
     return res[1]
 
 @router.delete("/person/", response_model= ResponseMessage, status_code=status.HTTP_200_OK)
-async def delete_person_router(
+def delete_person_router(
     *, 
     session: Session = Depends(get_session),
     name: Annotated[str | None, Query(title="Name of individual")] = None
@@ -91,29 +312,89 @@ async def delete_person_router(
     return res
 
 @router.get("/detection/", response_model=list[Detection_Read], status_code=status.HTTP_200_OK)
-async def get_detections_router(
+def get_detections_router(
     *,
     session: Session = Depends(get_session),
     id: Annotated[str | None, Query(title="ID of detection")] = None, #not implemented yet
     dateRange: Annotated[str | None, Query(title="Date range of detection", pattern="^\d{8}-\d{8}$")] = None,
     offset: Annotated[int | None, Query(title="Offset")] = None,
-    limit: Annotated[int | None, Query(title="Limit")] = None
+    limit: Annotated[int | None, Query(title="Limit")] = None,
+    img_format: Annotated[ImgFormat, Query(title="Return images as base64, URLs, base64 thumbnails or thumbnail URLs")] = ImgFormat.base64,
+    after: Annotated[str | None, Query(title="Cursor of the last detection of the previous page ('<date_time>_<id>', see the X-Next-Cursor header)")] = None,
+    descending: Annotated[bool, Query(title="Newest detections first")] = False,
+    response: Response
 ) -> list[Detection_Read]:
     
-    return get_detections(session, id, dateRange, offset, limit) 
+    try: detections = get_detections(session, id, dateRange, offset, limit, img_format, after, descending)
+    except ValueError: raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor {}".format(after))
+
+    if limit and len(detections) == limit: response.headers['X-Next-Cursor'] = get_detection_cursor(detections[-1])
+    return detections
 
 @router.post("/detection/", response_model=Detection_Read | None, status_code=status.HTTP_201_CREATED)
 async def post_detections_router(
     *, 
-    session: Session = Depends(get_session),
     image: Annotated[Detection_Create, Body(title='Image Data as base64 string')],
     top_n: Annotated[int, Query(title="Returns top N matches per face")] = 10
 ) -> Detection_Read | None:
     
-    return add_detections(session, fr_manager, image_data=image.image_data, top_n=top_n)
+    return await run_inference(in_session(add_detections), fr_manager, image_data=image.image_data, top_n=top_n)
+
+@router.post("/detection/upload/", response_model=Detection_Read | None, status_code=status.HTTP_201_CREATED)
+async def post_detections_upload_router(
+    *, 
+    image: Annotated[UploadFile, File(title='Image file')],
+    top_n: Annotated[int, Query(title="Returns top N matches per face")] = 10
+) -> Detection_Read | None:
+    
+    return await run_inference(in_session(add_detections), fr_manager, top_n=top_n, image_file=image.file)
+
+@router.post("/detection/raw/", response_model=Detection_Read | None, status_code=status.HTTP_201_CREATED, openapi_extra=RAW_IMG_OPENAPI)
+async def post_detections_raw_router(
+    *, 
+    request: Request,
+    top_n: Annotated[int, Query(title="Returns top N matches per face")] = 10
+) -> Detection_Read | None:
+    
+    return await run_inference(in_session(add_detections), fr_manager, top_n=top_n, image_file=await spool_img_body(request))
+
+@router.post("/detection/stream/", response_model=list[Detection_Read], status_code=status.HTTP_201_CREATED)
+async def post_stream_detections_router(
+    *, 
+    stream: Annotated[Detection_Stream, Body(title='Video file or stream to process')],
+    top_n: Annotated[int, Query(title="Returns top N matches per face")] = 10,
+    img_format: Annotated[ImgFormat, Query(title="Return images as base64, URLs, base64 thumbnails or thumbnail URLs")] = ImgFormat.url
+) -> list[Detection_Read]:
+    """
+    Detects and tracks faces in a video file in FR_STREAM_SOURCE_DIR or an allowed stream URL (sampled at sample_fps), returning one detection per tracked face
+
+    Processing stops after max_seconds of video, or after FR_STREAM_MAX_SECONDS of processing. Streams run on FR_STREAM_WORKERS workers of their own, 
+    and only time out (504) while waiting for one.
+    """
+    if not 0 < stream.max_seconds <= STREAM_MAX_SECONDS: 
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="max_seconds must be more than 0 and at most {}".format(STREAM_MAX_SECONDS))
+    try: 
+        stream.source = resolve_video_source(stream.source, STREAM_SOURCE_DIR, STREAM_URL_ALLOWLIST)
+        #The job stops reading frames after STREAM_MAX_SECONDS, and then only finishes the recognitions and database writes in progress
+        return await run_inference(in_session(add_stream_detections), fr_manager, stream, top_n, img_format, STREAM_MAX_SECONDS, write=True, executor=stream_executor)
+    except ValueError as e: raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+@router.get("/detection/batching/", status_code=status.HTTP_200_OK)
+def get_detection_batching_router() -> dict | None:
+    """
+    Histograms of the batch sizes and queue wait times (seconds) of detection micro-batching, or null if it is disabled
+    """
+    return fr_manager.batcher.stats() if fr_manager.batcher else None
+
+@router.get("/detection/cache/", status_code=status.HTTP_200_OK)
+def get_detection_cache_router() -> dict:
+    """
+    Sizes, hits and misses of the detection result and embedding caches
+    """
+    return {'index_version': fr_manager.index_version, 'result': fr_manager.result_cache.stats(), 'embedding': fr_manager.embedding_cache.stats()}
 
 @router.delete("/detection/", response_model=ResponseMessage, status_code=status.HTTP_200_OK)
-async def delete_detections_router(
+def delete_detections_router(
     *, 
     session: Session = Depends(get_session),
     id: Annotated[str | None, Query(title='ID of detection')] = None,
@@ -124,4 +405,23 @@ async def delete_detections_router(
     res = delete_detections(session, id)
     if res.type == MessageType.error: raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=res.message)
 
-    return res
\ No newline at end of file
+    return res
+
+@router.get("/image/{mode}/{details}/{img_name}", response_class=FileResponse, status_code=status.HTTP_200_OK)
+async def get_image_router(
+    *,
+    request: Request,
+    mode: Annotated[str, Path(title="'database' or 'inference'", pattern="^(database|inference)$")],
+    details: Annotated[str, Path(title="Name of individual (database) or date of detection as YYYYMMDD (inference)")],
+    img_name: Annotated[str, Path(title="Filename of image")],
+    size: Annotated[int | None, Query(title="Serve a thumbnail with this longest side instead (one of {})".format(THUMBNAIL_SIZES))] = None
+) -> Response:
+    
+    try: 
+        file_path = get_img_file_path(img_name, Mode[mode], details)
+        await asyncio.to_thread(img_writer.wait_written, file_path, INFERENCE_TIMEOUT) #detection images are saved in the background
+        if size and os.path.isfile(file_path): file_path = await asyncio.to_thread(get_thumbnail_file_path, img_name, Mode[mode], details, size)
+    except ValueError as e: raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    if not os.path.isfile(file_path): raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Image {} does not exist!'.format(img_name))
+
+    return img_file_response(request, file_path)
@@ -0,0 +1,109 @@
+"""
+Shared fixtures of the server tests, which run offline with the fake face model (benchmarks.fake_model) instead of InsightFace
+
+Run from the server directory:
+    python -m pytest tests
+"""
+import base64
+import importlib
+import os
+import sys
+import time
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVER_DIR)
+
+#Read by config on import, so set before any server module is imported
+os.environ.setdefault('FR_MODEL_FACTORY', 'benchmarks.fake_model:FakeFaceAnalysis')
+os.environ.setdefault('FR_LOG_LEVEL', 'WARNING')
+os.environ.setdefault('FR_INFERENCE_WORKERS', '1')
+
+import numpy as np
+import pytest
+from sqlmodel import Session, SQLModel
+
+from benchmarks.fake_model import FakeFaceAnalysis, make_face_image
+from managers.FRManager import FRManager
+from database.database import create_sqlite_engine
+from database.imgfs import init_img_filesystem
+from database import Personnel
+
+importlib.import_module('database.Detection') #registers its tables in SQLModel.metadata, as importing Personnel does
+
+def encode(img: bytes) -> str:
+    return base64.b64encode(img).decode('utf-8')
+
+def face_image_b64(identity: int, **kwargs) -> str:
+    """
+    Returns a base64 image whose face the fake model recognises as identity (see fake_model.make_face_image)
+    """
+    return encode(make_face_image(identity, **kwargs))
+
+def best_matches(fr_manager: FRManager, identity: int, k: int = 1) -> list[str]:
+    """
+    Returns the names of the k individuals closest to the face of identity in the vector index of fr_manager
+    """
+    embeddings = np.array(fr_manager.extract_embeddings(make_face_image(identity)))
+    _, names, _ = fr_manager.search_embeddings([(embeddings, k)])[0]
+    return names[0]
+
+@pytest.fixture(autouse=True)
+def fake_model(monkeypatch):
+    """
+    Restores the settings of the fake model (class attributes shared by every instance) after each test
+    """
+    for attribute in ('faces_per_image', 'blob_faces', 'detection_delay', 'recognition_delay'):
+        monkeypatch.setattr(FakeFaceAnalysis, attribute, getattr(FakeFaceAnalysis, attribute))
+    return FakeFaceAnalysis
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """
+    Runs the test in an empty working directory, where the server keeps its database, images and snapshots
+    """
+    monkeypatch.chdir(tmp_path)
+    init_img_filesystem()
+    return tmp_path
+
+@pytest.fixture
+def fr_manager():
+    return FRManager(model_factory=FakeFaceAnalysis, search_backend='exact')
+
+@pytest.fixture
+def engine(workdir):
+    engine = create_sqlite_engine('sqlite:///{}'.format(workdir / 'test.db'))
+    SQLModel.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+@pytest.fixture
+def session(engine):
+    with Session(engine) as session:
+        Personnel.init_PersonFR_search(session)
+        yield session
+
+@pytest.fixture
+def enroll(session, fr_manager):
+    """
+    Returns a function adding a person to the database and fr_manager, with an image of each of the given identities
+    """
+    def enroll(name: str, *identities: int):
+        return Personnel.add_PersonFR(session, Personnel.PersonnelFR_Update(name=name, images=[face_image_b64(identity) for identity in identities]), fr_manager)
+    return enroll
+
+@pytest.fixture
+def client(engine, monkeypatch):
+    """
+    Test client of the app, started (database opened and vector index loaded) in the test's working directory and ready
+    """
+    import main
+    from fastapi.testclient import TestClient
+    from database import database
+    from routers import FRroutes
+
+    #The app's engine is created on import with the database path made absolute, so the app is given the test's database instead
+    monkeypatch.setattr(database, 'engine', engine)
+    monkeypatch.setattr(FRroutes, 'engine', engine)
+    with TestClient(main.app) as client:
+        while client.get('/ready').status_code != 200: time.sleep(0.01)
+        yield client
@@ -0,0 +1,33 @@
+import json
+
+from config import FR_MANAGER_OPTIONS
+from benchmarks import suite
+
+def write_results(path, results: dict[str, float]) -> str:
+    path.write_text(json.dumps({'meta': {}, 'results': results}))
+    return str(path)
+
+def test_compare_reports_regressions_by_direction(tmp_path, capsys):
+    baseline = write_results(tmp_path / 'baseline.json', {'app.detect_p50_ms': 10, 'index.hnsw.1000.batch_queries_per_s': 1000,
+                                                          'index.hnsw.1000.top1_accuracy': 0.9, 'app.faces': 4, 'app.removed_ms': 1})
+    results = write_results(tmp_path / 'results.json', {'app.detect_p50_ms': 12, 'index.hnsw.1000.batch_queries_per_s': 1050,
+                                                         'index.hnsw.1000.top1_accuracy': 0.7, 'app.faces': 8, 'app.added_ms': 1})
+
+    assert suite.compare(baseline, results, tolerance=0.1) == 2
+
+    lines = capsys.readouterr().out.splitlines()
+    assert [line.split()[0] for line in lines if line.endswith('REGRESSION')] == ['app.detect_p50_ms', 'index.hnsw.1000.top1_accuracy']
+    assert lines[-1] == '2 of 4 metrics regressed by more than 10%'
+    assert suite.compare(baseline, results, tolerance=0.5) == 0
+
+def test_index_section_reports_both_backends(capsys):
+    results = suite.bench_index([300], queries=20, batch_size=8, fr_manager_options=FR_MANAGER_OPTIONS)
+
+    for backend in ('exact', 'hnsw'):
+        assert {'build_s', 'query_p50_ms', 'query_p99_ms', 'batch_queries_per_s', 'top1_accuracy'} <= {key.rsplit('.', 1)[1] for key in results if key.startswith('index.{}.300.'.format(backend))}
+    assert results['index.exact.300.top1_accuracy'] == 1.0
+
+def test_startup_section_times_both_paths(tmp_path):
+    results = suite.bench_startup([50], str(tmp_path), dict(FR_MANAGER_OPTIONS, search_backend='hnsw'))
+
+    assert set(results) == {'startup.50.from_database_s', 'startup.50.snapshot_save_s', 'startup.50.from_snapshot_s'}
@@ -0,0 +1,41 @@
+import io
+import zipfile
+import numpy as np
+
+from benchmarks.fake_model import make_face_image
+from database.imgfs import iter_img_zip, group_img_sources, DATABASE_IMGS_DIR
+from database.Personnel import bulk_add_PersonFR, get_one_PersonFR
+
+def make_zip(files: dict[str, bytes]) -> bytes:
+    zip_data = io.BytesIO()
+    with zipfile.ZipFile(zip_data, 'w') as zip_file:
+        for filename, data in files.items(): zip_file.writestr(filename, data)
+    return zip_data.getvalue()
+
+def test_bulk_import_skips_undecodable_images(session, fr_manager, workdir):
+    zip_data = make_zip({
+        'A.jpg': make_face_image(1),
+        'A (1).jpg': make_face_image(2),
+        'B.jpg': make_face_image(3),
+        'G.jpg': b'not an image',
+        'C.jpg': make_face_image(4)
+    })
+
+    with zipfile.ZipFile(io.BytesIO(zip_data)) as zip_file:
+        summary = bulk_add_PersonFR(session, group_img_sources(iter_img_zip(zip_file)), fr_manager, chunk_size=2)
+
+    assert sorted(summary.added) == ['A', 'B', 'C']
+    assert summary.skipped == ['G', 'G.jpg']
+    assert len(get_one_PersonFR(session, 'A').images) == 2
+    assert not (workdir / DATABASE_IMGS_DIR / 'G').exists()
+    _, names, _ = fr_manager.search_embeddings([(np.array(fr_manager.extract_embeddings(make_face_image(3))), 1)])[0]
+    assert names == [['B']]
+
+def test_bulk_route_skips_undecodable_images(client):
+    zip_data = make_zip({'A.jpg': make_face_image(1), 'G.jpg': b'not an image', 'B.jpg': make_face_image(2)})
+
+    res = client.post('/FR/person/bulk/', files=[('files', ('gallery.zip', zip_data, 'application/zip'))])
+
+    assert res.status_code == 201
+    assert res.json() == {'added': ['A', 'B'], 'updated': [], 'skipped': ['G', 'G.jpg']}
+    assert [person['name'] for person in client.get('/FR/person/').json()] == ['A', 'B']
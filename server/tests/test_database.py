@@ -0,0 +1,40 @@
+import logging
+
+from sqlalchemy import text
+
+from database import database
+from database.database import create_sqlite_engine, check_database_settings
+
+def read_pragmas(engine) -> dict[str, str]:
+    with engine.connect() as connection:
+        return {pragma: str(connection.execute(text('PRAGMA {}'.format(pragma))).scalar()) for pragma in ('journal_mode', 'synchronous', 'mmap_size', 'cache_size', 'busy_timeout')}
+
+def test_pragmas_are_applied_to_every_connection(tmp_path):
+    engine = create_sqlite_engine('sqlite:///{}'.format(tmp_path / 'test.db'), journal_mode='WAL', synchronous='NORMAL',
+                                  mmap_size=1 << 20, cache_size=-4000, busy_timeout=1000, pool_size=2)
+
+    with engine.connect():
+        assert read_pragmas(engine) == {'journal_mode': 'wal', 'synchronous': '1', 'mmap_size': str(1 << 20), 'cache_size': '-4000', 'busy_timeout': '1000'}
+    engine.dispose()
+
+def test_wal_lets_a_write_commit_during_a_read(tmp_path):
+    engine = create_sqlite_engine('sqlite:///{}'.format(tmp_path / 'test.db'), busy_timeout=100)
+    with engine.begin() as connection: connection.execute(text('CREATE TABLE t (x INTEGER)'))
+
+    with engine.connect() as reader, engine.connect() as writer:
+        reader.execute(text('BEGIN'))
+        assert reader.execute(text('SELECT COUNT(*) FROM t')).scalar() == 0
+        writer.execute(text('INSERT INTO t VALUES (1)'))
+        writer.commit() #would wait for the reader (and fail with "database is locked") with a rollback journal
+        assert reader.execute(text('SELECT COUNT(*) FROM t')).scalar() == 0
+    engine.dispose()
+
+def test_settings_not_applied_are_reported(tmp_path, monkeypatch, caplog):
+    engine = create_sqlite_engine('sqlite:///{}'.format(tmp_path / 'test.db'), journal_mode='DELETE')
+    monkeypatch.setattr(database, 'engine', engine)
+
+    with caplog.at_level(logging.WARNING, logger='database.database'): settings = check_database_settings()
+
+    assert settings['journal_mode'] == 'delete'
+    assert 'SQLite journal_mode is delete instead of the configured wal' in caplog.text
+    engine.dispose()
@@ -0,0 +1,28 @@
+import numpy as np
+import pytest
+
+from benchmarks.fake_model import FakeFaceAnalysis, make_face_image
+from managers.FRManager import FRManager
+
+def test_images_are_not_downscaled_by_default(fr_manager):
+    img, scale = fr_manager.decode_for_inference(make_face_image(1, width=2000, height=1000))
+
+    assert img.shape == (1000, 2000, 3) and scale == 1.0
+
+@pytest.mark.parametrize('fast_decode', [True, False])
+def test_large_images_are_downscaled(fast_decode):
+    fr_manager = FRManager(model_factory=FakeFaceAnalysis, search_backend='exact', max_input_side=500, fast_decode=fast_decode)
+
+    img, scale = fr_manager.decode_for_inference(make_face_image(1, width=2000, height=1000))
+
+    assert img.shape == (250, 500, 3) and scale == 4.0
+    np.testing.assert_allclose(img.mean(axis=(0, 1)), fr_manager.to_npy(make_face_image(1)).mean(axis=(0, 1)), atol=2)
+
+def test_boxes_are_reported_in_original_coordinates(fr_manager):
+    downscaling = FRManager(model_factory=FakeFaceAnalysis, search_backend='exact', max_input_side=500)
+    img = make_face_image(1, width=2000, height=1000)
+
+    expected = fr_manager.infer(img=img)[0]['bbox']
+    bbox = downscaling.infer(img=img)[0]['bbox']
+
+    np.testing.assert_allclose(bbox, expected, rtol=0.02, atol=8)
@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+from benchmarks.fake_model import FakeFaceAnalysis, make_scene_image
+from managers.FRManager import FRManager
+
+PORTRAIT = make_scene_image([(1, (200, 100, 600, 500))], 800, 800)
+GROUP = make_scene_image([(idx, (40 + 100 * idx, 700, 80 + 100 * idx, 740)) for idx in range(10)], 2000, 1500)
+MIXED = make_scene_image([(1, (100, 100, 900, 900)), (2, (1500, 1200, 1600, 1300))], 2000, 1500)
+EMPTY = make_scene_image([], 800, 800)
+
+@pytest.fixture
+def detector_sizes(fake_model, monkeypatch) -> list[int]:
+    """
+    Detector input sizes run by FRManager.run_detector, with the fake model finding faces as coloured rectangles
+    """
+    monkeypatch.setattr(fake_model, 'blob_faces', True)
+    sizes = []
+    run_detector = FRManager.run_detector
+    monkeypatch.setattr(FRManager, 'run_detector', lambda self, img, det_size: sizes.append(det_size) or run_detector(self, img, det_size))
+    return sizes
+
+def cascade_fr_manager(det_cascade_size: int = 320) -> FRManager:
+    return FRManager(model_factory=FakeFaceAnalysis, search_backend='exact', det_size=1024, det_cascade_size=det_cascade_size, det_cascade_min_face=24)
+
+@pytest.mark.parametrize('img, expected_sizes, faces', [(PORTRAIT, [320], 1), (GROUP, [320, 1024], 10), (MIXED, [320, 1024], 2), (EMPTY, [320, 1024], 0)])
+def test_cascade_runs_the_full_size_only_when_needed(detector_sizes, img, expected_sizes, faces):
+    bboxes, _ = cascade_fr_manager().detect(img)
+
+    assert detector_sizes == expected_sizes and len(bboxes) == faces
+
+def test_cascade_finds_the_faces_of_full_size_detection(detector_sizes):
+    for img in (PORTRAIT, GROUP, MIXED):
+        cascade_faces, _ = cascade_fr_manager().detect_faces(img)
+        faces, _ = cascade_fr_manager(det_cascade_size=0).detect_faces(img)
+
+        assert len(cascade_faces) == len(faces)
+        for cascade_face, face in zip(cascade_faces, faces): np.testing.assert_allclose(cascade_face['bbox'], face['bbox'], atol=4)
+
+def test_small_detector_size_misses_group_faces(detector_sizes):
+    assert len(cascade_fr_manager(det_cascade_size=0).detect(GROUP)[0]) == 10
+    assert len(FRManager(model_factory=FakeFaceAnalysis, search_backend='exact', det_size=320).detect(GROUP)[0]) == 0
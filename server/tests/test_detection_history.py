@@ -0,0 +1,52 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from conftest import face_image_b64
+from database.imgfs import ImgFormat
+from database.Detection import Detection_SQL, get_detections, get_detection_cursor
+
+@pytest.fixture
+def detections(session) -> list[str]:
+    """
+    Ids of 7 detections in order of date_time then id, several of them sharing a date_time
+    """
+    start = datetime(2024, 1, 1, 12)
+    rows = [Detection_SQL(id='{:02d}'.format(idx), date_time=start + timedelta(seconds=idx // 3), image='{:02d}.jpg'.format(idx)) for idx in range(7)]
+    session.add_all(rows)
+    session.commit()
+    return [row.id for row in rows]
+
+def read_pages(session, limit: int, descending: bool = False) -> list[list[str]]:
+    pages, after = [], None
+    while True:
+        page = get_detections(session, limit=limit, img_format=ImgFormat.url, after=after, descending=descending)
+        if not page: return pages
+        pages.append([detection.id for detection in page])
+        after = get_detection_cursor(page[-1])
+
+@pytest.mark.parametrize('descending', [False, True])
+def test_cursor_pages_cover_every_detection_once(session, detections, descending):
+    pages = read_pages(session, limit=3, descending=descending)
+
+    assert [len(page) for page in pages] == [3, 3, 1]
+    assert sum(pages, []) == (detections[::-1] if descending else detections)
+
+def test_cursor_pages_match_offset_pages(session, detections):
+    offset_pages = [[detection.id for detection in get_detections(session, offset=offset, limit=2, img_format=ImgFormat.url)] for offset in range(0, 7, 2)]
+
+    assert read_pages(session, limit=2) == offset_pages
+
+def test_invalid_cursor_is_refused(session, detections):
+    with pytest.raises(ValueError): get_detections(session, after='not a cursor')
+
+def test_next_cursor_header(client):
+    for _ in range(3): client.post('/FR/detection/', json={'image_data': face_image_b64(1)})
+
+    res = client.get('/FR/detection/', params={'limit': 2, 'img_format': 'url'})
+    assert res.headers['x-next-cursor'] == '{}_{}'.format(res.json()[1]['date_time'], res.json()[1]['id'])
+
+    res = client.get('/FR/detection/', params={'limit': 2, 'img_format': 'url', 'after': res.headers['x-next-cursor']})
+    assert len(res.json()) == 1 and 'x-next-cursor' not in res.headers
+
+    assert client.get('/FR/detection/', params={'after': 'not a cursor'}).status_code == 400
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from conftest import best_matches, face_image_b64
+from benchmarks.fake_model import FakeFaceAnalysis
+from managers.FRManager import FRManager
+from managers.EmbeddingStore import EmbeddingStore, encode_embeddings, decode_embeddings
+from database.Personnel import PersonnelFR_SQL, PersonnelFR_Update, add_PersonFR, load_PersonFR_vector_index
+
+def random_embeddings(count: int) -> np.ndarray:
+    return np.random.default_rng(0).standard_normal((count, 512)).astype(np.float32)
+
+@pytest.mark.parametrize('dtype, nbytes, atol', [('float32', 2048, 0), ('float16', 1024, 1e-2), ('int8', 516, 3e-2)])
+def test_embeddings_round_trip(dtype, nbytes, atol):
+    embeddings = random_embeddings(3)
+
+    blob = encode_embeddings(embeddings, dtype)
+
+    assert len(blob) == 3 * nbytes
+    np.testing.assert_allclose(decode_embeddings(blob, dtype), embeddings, atol=atol * np.abs(embeddings).max())
+    assert decode_embeddings(b'', dtype).shape == (0, 512)
+
+def test_store_grows_compacts_and_reloads(tmp_path):
+    embeddings = random_embeddings(5)
+    store = EmbeddingStore('int8', capacity=2)
+
+    store.set([0, 1, 2, 3, 4], embeddings)
+    store.compact(np.array([1, 3]))
+    store.save(str(tmp_path))
+    loaded = EmbeddingStore.load(str(tmp_path), 'int8')
+
+    assert len(loaded) == 2
+    np.testing.assert_allclose(loaded.get([0, 1]), store.get([0, 1]))
+    np.testing.assert_allclose(loaded.get([0, 1]), embeddings[[1, 3]], atol=0.03 * np.abs(embeddings).max())
+    assert EmbeddingStore.load(str(tmp_path), 'float16') is None
+
+@pytest.mark.parametrize('search_backend', ['exact', 'hnsw'])
+def test_float32_rows_are_searched_with_int8_vectors(search_backend, session, enroll):
+    fr_manager = FRManager(model_factory=FakeFaceAnalysis, search_backend=search_backend, embedding_dtype='int8')
+    for idx, name in enumerate(['A', 'B', 'C']): enroll(name, idx)
+    load_PersonFR_vector_index(session, fr_manager)
+
+    assert session.get(PersonnelFR_SQL, 'A').embedding_dtype == 'float32'
+    assert [best_matches(fr_manager, idx)[0] for idx in range(3)] == ['A', 'B', 'C']
+    assert fr_manager.uses_embedding_store == (search_backend == 'hnsw') #re-scores the matches of the 8-bit HNSW index
+
+def test_int8_rows_are_written_as_int8(session):
+    fr_manager = FRManager(model_factory=FakeFaceAnalysis, search_backend='hnsw', embedding_dtype='int8')
+    add_PersonFR(session, PersonnelFR_Update(name='A', images=[face_image_b64(0), face_image_b64(1)]), fr_manager)
+
+    person = session.get(PersonnelFR_SQL, 'A')
+    assert person.embedding_dtype == 'int8' and len(person.embeddings) == 2 * 516
+    assert best_matches(fr_manager, 1) == ['A']
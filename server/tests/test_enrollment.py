@@ -0,0 +1,54 @@
+import numpy as np
+from PIL import Image
+
+from benchmarks.fake_model import make_face_image
+from managers.FRManager import FRManager
+
+def write_images(folder, identities: list[int | None]) -> list[str]:
+    """
+    Writes an image per identity (a black image, with no face, for None) and returns their filenames
+    """
+    img_list = []
+    for idx, identity in enumerate(identities):
+        img_name = '{}.jpg'.format(idx)
+        if identity is None: Image.new('RGB', (64, 64)).save(folder / img_name)
+        else: (folder / img_name).write_bytes(make_face_image(identity))
+        img_list.append(img_name)
+    return img_list
+
+def test_extract_embeddings_multi_matches_single_image_extraction(tmp_path, fr_manager):
+    img_list = write_images(tmp_path, [1, 2, 3])
+
+    validated, embeddings = fr_manager.extract_embeddings_multi(img_list, str(tmp_path))
+
+    assert validated == img_list
+    for img, embedding in zip(img_list, embeddings):
+        np.testing.assert_allclose(embedding, fr_manager.extract_embeddings(img_filepath=str(tmp_path / img))[0], rtol=1e-5)
+
+def test_extract_embeddings_multi_drops_images_without_faces(tmp_path, fr_manager):
+    img_list = write_images(tmp_path, [1, None, 2, None])
+
+    validated, embeddings = fr_manager.extract_embeddings_multi(img_list, str(tmp_path))
+
+    assert validated == [img_list[0], img_list[2]]
+    assert len(embeddings) == 2
+
+def test_extract_embeddings_multi_batches_recognition(tmp_path, fake_model):
+    img_list = write_images(tmp_path, list(range(7)))
+    batch_sizes = []
+    fr_manager = FRManager(model_factory=fake_model, search_backend='exact', rec_batch_size=3)
+    get_feat = fr_manager.model.models['recognition'].get_feat
+    fr_manager.model.models['recognition'].get_feat = lambda imgs: batch_sizes.append(len(imgs)) or get_feat(imgs)
+
+    validated, embeddings = fr_manager.extract_embeddings_multi(img_list, str(tmp_path))
+
+    assert batch_sizes == [3, 3, 1]
+    assert validated == img_list and len(embeddings) == 7
+
+def test_extract_embeddings_multi_returns_every_face_without_max_face(tmp_path, fr_manager, fake_model):
+    fake_model.faces_per_image = 2
+    img_list = write_images(tmp_path, [1, 2])
+
+    _, embeddings = fr_manager.extract_embeddings_multi(img_list, str(tmp_path), max_face=-1)
+
+    assert [len(faces) for faces in embeddings] == [2, 2]
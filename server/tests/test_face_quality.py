@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from benchmarks.fake_model import FakeFaceAnalysis, KPS_TEMPLATE, make_scene_image
+from managers.FaceQuality import assess_face, pose_score
+from managers.FaceTracker import FaceTracker
+from managers.FRManager import FRManager
+
+SHARP = (np.indices((112, 112)).sum(axis=0) % 2 * 255).astype(np.uint8)[..., None].repeat(3, axis=2) #checkerboard
+BLURRED = np.full((112, 112, 3), 128, dtype=np.uint8)
+
+def make_face(x: float, side: float = 100, det_score: float = 0.9, yaw: float = 0.0) -> dict:
+    kps = KPS_TEMPLATE * side + (x, 0)
+    kps[2, 0] += yaw * 0.4 * side #nose moved towards an eye, as a head turns
+    return dict(bbox=np.array([x, 0, x + side, side], dtype=np.float32), kps=kps, det_score=det_score)
+
+def test_quality_combines_size_detection_pose_and_blur():
+    assert assess_face(make_face(0), SHARP) == pytest.approx({'size': 1, 'det_score': 0.9, 'pose': 1, 'blur': 1, 'quality': 0.9})
+    assert assess_face(make_face(0, side=32), SHARP)['size'] == 0.5
+    assert assess_face(make_face(0), BLURRED)['quality'] == 0
+    assert pose_score(make_face(0, yaw=0.5)['kps']) < pose_score(make_face(0, yaw=0.1)['kps']) < 1
+
+def test_infer_recognises_the_best_faces(fake_model, monkeypatch):
+    monkeypatch.setattr(fake_model, 'blob_faces', True)
+    fr_manager = FRManager(model_factory=FakeFaceAnalysis, search_backend='exact', min_face_quality=0.1, max_faces=1, report_skipped_faces=True)
+    img = make_scene_image([(1, (0, 0, 100, 100)), (2, (200, 0, 300, 100)), (3, (400, 0, 500, 100))], 640, 480, sharp=[False, True, True])
+    fr_manager.add_to_vector_index_multi(['A', 'B', 'C'], [fr_manager.extract_embeddings(make_scene_image([(idx, (0, 0, 100, 100))], 640, 480))[0] for idx in (1, 2, 3)])
+
+    results = fr_manager.infer(img=img, k=1)
+
+    assert [(face['bbox'][0], face['targets']) for face in results] == [(400, ['C']), (0, []), (200, [])] #the recognised face, then those skipped
+    assert results[0]['quality'] > results[2]['quality'] >= 0.1 > results[1]['quality']
+
+def test_tracker_recognises_a_face_again_when_it_is_seen_better():
+    tracker = FaceTracker(quality_gain=1.25)
+    blurred_face, sharp_face = make_face(0), make_face(2)
+
+    (track, _), = tracker.update([blurred_face], [BLURRED], 0.0)[0]
+    track.set_recognition(blurred_face, None, None, ['A'], [0.5])
+    assert tracker.update([make_face(1)], [BLURRED], 0.1)[0] == []
+
+    assert tracker.update([sharp_face], [SHARP], 0.2)[0] == [(track, 0)]
+    track.set_recognition(sharp_face, None, None, ['A'], [0.1])
+    assert track.quality == pytest.approx(0.9) and track.recognitions == 2
+    assert tracker.update([make_face(3, det_score=1.0)], [SHARP], 0.3)[0] == [] #not 1.25 times better
+
+def test_stream_keeps_the_best_recognition_of_each_face(fake_model, monkeypatch):
+    monkeypatch.setattr(fake_model, 'blob_faces', True)
+    fr_manager = FRManager(model_factory=FakeFaceAnalysis, search_backend='exact')
+    fr_manager.add_to_vector_index_multi(['A'], [fr_manager.extract_embeddings(make_scene_image([(1, (0, 0, 100, 100))], 640, 480))[0]])
+    frames = [(idx / 5, make_scene_image([(1, (100 + idx, 100, 200 + idx, 200))], 640, 480, sharp=[idx == 2])) for idx in range(4)]
+
+    [track] = fr_manager.infer_stream(frames, k=1)
+
+    assert track.recognitions == 2 and track.names == ['A'] and track.frame is frames[2][1]
@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+from conftest import best_matches
+from benchmarks.fake_model import FakeFaceAnalysis
+from managers.FRManager import FRManager
+from managers.IdentityRegistry import IdentityRegistry
+from database.Personnel import load_PersonFR_vector_index
+
+@pytest.fixture
+def fr_manager():
+    return FRManager(model_factory=FakeFaceAnalysis, search_backend='exact', gallery_mode='all')
+
+@pytest.mark.parametrize('aggregation, expected', [
+    ('max', (['A', 'B'], [0.1, 0.2])),
+    ('topk_mean', (['A', 'B'], [0.3, 0.35]))
+])
+def test_neighbours_are_aggregated_per_identity(aggregation, expected):
+    fr_manager = FRManager(model_factory=FakeFaceAnalysis, search_backend='exact', gallery_mode='all', aggregation=aggregation, aggregation_k=2)
+    fr_manager.registry = IdentityRegistry.from_lists(['A', 'A', 'B'])
+
+    names, distances = fr_manager.aggregate_neighbours(np.array([0, 2, 1]), np.array([0.1, 0.2, 0.5]), k=2)
+
+    assert names == expected[0]
+    np.testing.assert_allclose(distances, expected[1])
+
+def test_every_photo_of_a_person_is_indexed(session, fr_manager, enroll):
+    enroll('A', 0, 1)
+    enroll('B', 2)
+
+    assert fr_manager.registry.get_slots('A') == [0, 1]
+    assert best_matches(fr_manager, 0) == ['A'] and best_matches(fr_manager, 1) == ['A']
+    assert best_matches(fr_manager, 1, k=5) == ['A', 'B']
+
+def test_all_embeddings_are_loaded_from_database(session, fr_manager, enroll):
+    enroll('A', 0, 1)
+
+    loaded = FRManager(model_factory=FakeFaceAnalysis, search_backend='exact', gallery_mode='all')
+    load_PersonFR_vector_index(session, loaded)
+
+    assert len(loaded.vector_index) == 2
+    assert best_matches(loaded, 1) == ['A']
@@ -0,0 +1,40 @@
+import argparse
+
+from conftest import best_matches
+from benchmarks.fake_model import FakeFaceAnalysis
+from managers.FRManager import FRManager
+from database.Personnel import load_PersonFR_vector_index
+import tune_index
+
+def hnsw_fr_manager(m: int = 12, ef_construction: int = 200) -> FRManager:
+    return FRManager(model_factory=FakeFaceAnalysis, search_backend='hnsw', hnsw_m=m, hnsw_ef_construction=ef_construction, hnsw_ef=64, hnsw_max_elements=100)
+
+def test_index_is_built_with_configured_parameters():
+    fr_manager = hnsw_fr_manager(m=16, ef_construction=100)
+
+    index = fr_manager.vector_index.index
+    assert (index.M, index.ef_construction, index.ef) == (16, 100, 64)
+
+def test_snapshot_with_other_parameters_is_rebuilt(tmp_path, session, enroll):
+    fr_manager = hnsw_fr_manager()
+    enroll('A', 0)
+    load_PersonFR_vector_index(session, fr_manager)
+    fr_manager.save_snapshot(str(tmp_path / 'snapshot'))
+
+    assert hnsw_fr_manager().load_snapshot(str(tmp_path / 'snapshot')) is not None
+    assert hnsw_fr_manager(m=16).load_snapshot(str(tmp_path / 'snapshot')) is None
+
+    rebuilt = hnsw_fr_manager(m=16)
+    load_PersonFR_vector_index(session, rebuilt, str(tmp_path / 'snapshot'))
+    assert rebuilt.vector_index.index.M == 16
+    assert best_matches(rebuilt, 0) == ['A']
+
+def test_tuning_reports_every_combination(capsys):
+    gallery, gallery_labels, queries, query_labels = tune_index.make_synthetic_gallery(200)
+    args = argparse.Namespace(m=[8, 16], ef_construction=[100], ef=[10, 64], k=5)
+
+    tune_index.tune(gallery, gallery_labels, queries[:50], query_labels[:50], args)
+
+    rows = capsys.readouterr().out.splitlines()
+    assert [row.split('|')[0].strip() for row in rows] == ['exact'] + ['hnsw M={} ef_construction=100 ef={}'.format(m, ef) for m in (8, 16) for ef in (10, 64)]
+    assert 'recall@5 1.0000' in rows[0]
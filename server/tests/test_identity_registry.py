@@ -0,0 +1,58 @@
+import numpy as np
+
+from conftest import best_matches
+from benchmarks.fake_model import FakeFaceAnalysis, make_face_image
+from managers.FRManager import FRManager
+from managers.IdentityRegistry import IdentityRegistry
+
+def test_registry_maps_slots_and_names():
+    registry = IdentityRegistry(capacity=2)
+
+    assert registry.add(['A', 'B', 'A']) == [0, 1, 2]
+    assert registry.get_slots('A') == [0, 2]
+    assert registry.get_names(np.array([[2, 1]])).tolist() == [['A', 'B']]
+
+    registry.rename('A', 'C')
+    assert 'A' not in registry and registry.get_slots('C') == [0, 2]
+    assert registry.name_list == ['C', 'B', 'C']
+
+def test_registry_deleted_slots_and_compaction():
+    registry = IdentityRegistry.from_lists(['A', 'B', 'C', 'D'], [1])
+
+    assert registry.live_count == 3
+    assert not registry.mark_deleted(1)
+    assert registry.mark_deleted(3)
+    assert registry.unmark_deleted(1) and not registry.unmark_deleted(1)
+
+    assert registry.compact().tolist() == [0, 1, 2]
+    assert registry.name_list == ['A', 'B', 'C'] and registry.deleted_ids == set()
+
+def load_identities(fr_manager: FRManager, names: list[str]) -> list[np.ndarray]:
+    """
+    Loads an individual per name into the vector index of fr_manager, whose face is identity idx for the idx-th name
+    """
+    vectors = [np.array(fr_manager.extract_embeddings(make_face_image(idx))) for idx in range(len(names))]
+    fr_manager.load_vectors_from_sql(names, vectors, reset=True)
+    return vectors
+
+def test_deleted_individual_reuses_its_slot_when_added_back(fr_manager):
+    vectors = load_identities(fr_manager, ['A', 'B'])
+
+    fr_manager.update_to_vector_index('A', 'A', [])
+    assert fr_manager.registry.deleted_ids == {0}
+    assert best_matches(fr_manager, 0) == ['B']
+
+    fr_manager.add_to_vector_index('A', vectors[0][0])
+    assert fr_manager.registry.deleted_ids == set() and len(fr_manager.registry) == 2
+    assert best_matches(fr_manager, 0) == ['A']
+
+def test_vector_index_is_compacted_once_enough_slots_are_deleted():
+    fr_manager = FRManager(model_factory=FakeFaceAnalysis, search_backend='exact', compact_min_deleted=2, compact_max_deleted_ratio=0.3)
+    load_identities(fr_manager, ['A', 'B', 'C', 'D'])
+
+    fr_manager.update_to_vector_index('A', 'A', [])
+    assert len(fr_manager.registry) == 4
+    fr_manager.update_to_vector_index('C', 'C', [])
+
+    assert fr_manager.registry.name_list == ['B', 'D'] and len(fr_manager.vector_index) == 2
+    assert best_matches(fr_manager, 1) == ['B'] and best_matches(fr_manager, 3) == ['D']
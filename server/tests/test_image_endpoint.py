@@ -0,0 +1,56 @@
+import os
+
+import pytest
+
+from conftest import face_image_b64
+from database.imgfs import DATABASE_IMGS_DIR, THUMBNAIL_DIR, thumbnail_cache
+
+@pytest.fixture
+def img_url(client):
+    """
+    URL of the image of a person enrolled with one image
+    """
+    client.post('/FR/person/', json={'name': 'A', 'images': [face_image_b64(1)]})
+    return client.get('/FR/person/', params={'img_format': 'url'}).json()[0]['images'][0]
+
+def test_image_is_revalidated_with_etag(client, img_url):
+    res = client.get(img_url)
+    assert res.status_code == 200 and res.headers['content-type'] == 'image/jpeg'
+
+    assert client.get(img_url, headers={'If-None-Match': res.headers['etag']}).status_code == 304
+    assert client.get(img_url, headers={'If-Modified-Since': res.headers['last-modified']}).status_code == 304
+
+def test_image_range_requests(client, img_url):
+    size = len(client.get(img_url).content)
+
+    res = client.get(img_url, headers={'Range': 'bytes=0-9'})
+    assert res.status_code == 206 and len(res.content) == 10
+    assert res.headers['content-range'] == 'bytes 0-9/{}'.format(size)
+
+    assert client.get(img_url, headers={'Range': 'bytes={}-'.format(size)}).status_code == 416
+
+def test_image_paths_outside_image_folder_are_refused(client):
+    assert client.get('/FR/image/database/A/missing.jpg').status_code == 404
+    assert client.get('/FR/image/database/../A.jpg').status_code == 404
+    assert client.get('/FR/image/database/%2E%2E/A.jpg').status_code == 400
+
+def test_thumbnails_of_replaced_images_are_deleted(client, img_url, workdir):
+    assert client.get(img_url, params={'size': 64}).status_code == 200
+    img_name = img_url.rsplit('/', 1)[1]
+    thumbnail_path = workdir / DATABASE_IMGS_DIR / 'A' / THUMBNAIL_DIR / '64' / img_name
+    assert thumbnail_path.exists()
+
+    client.patch('/FR/person/', params={'name': 'A'}, json={'name': 'A', 'images': [face_image_b64(2)]})
+
+    assert not thumbnail_path.exists()
+    assert client.get(img_url, params={'size': 64}).status_code == 404
+
+def test_thumbnails_follow_renamed_person(client, img_url, workdir):
+    thumbnail = client.get('/FR/person/', params={'img_format': 'thumbnail'}).json()[0]['images'][0]
+    img_name = img_url.rsplit('/', 1)[1]
+
+    client.patch('/FR/person/', params={'name': 'A'}, json={'name': 'B'})
+
+    assert not any(key[0].startswith(os.path.join(DATABASE_IMGS_DIR, 'A', '')) for key in thumbnail_cache.entries)
+    assert (workdir / DATABASE_IMGS_DIR / 'B' / THUMBNAIL_DIR / '160' / img_name).exists()
+    assert client.get('/FR/person/', params={'img_format': 'thumbnail'}).json()[0]['images'][0] == thumbnail
@@ -0,0 +1,66 @@
+import os
+
+import numpy as np
+import pytest
+
+from conftest import best_matches, face_image_b64
+from database.Personnel import PersonnelFR_SQL, PersonnelFR_Update, update_PersonFR
+from database.imgfs import DATABASE_IMGS_DIR
+from managers.EmbeddingStore import decode_embeddings
+
+@pytest.fixture
+def extracted(fr_manager, monkeypatch) -> list[str]:
+    """
+    Filenames of the images run through the model by fr_manager.extract_embeddings_multi
+    """
+    extracted = []
+    extract_embeddings_multi = fr_manager.extract_embeddings_multi
+    def counting_extract(img_list, *args, **kwargs):
+        extracted.extend(img_list)
+        return extract_embeddings_multi(img_list, *args, **kwargs)
+    monkeypatch.setattr(fr_manager, 'extract_embeddings_multi', counting_extract)
+    return extracted
+
+def enrolled(session, enroll, name: str, *identities: int) -> PersonnelFR_SQL:
+    enroll(name, *identities)
+    session.expire_all() #add_PersonFR replaces the filenames of the person it returns with base64 images, which are not to be written back
+    return session.get(PersonnelFR_SQL, name)
+
+def update(session, fr_manager, name: str, new_name: str, *identities: int):
+    return update_PersonFR(session, name, PersonnelFR_Update(name=new_name, images=[face_image_b64(identity) for identity in identities]), fr_manager)
+
+def test_only_new_images_are_extracted(session, fr_manager, enroll, extracted):
+    person = enrolled(session, enroll, 'A', 1, 2, 3)
+    old_images, old_embeddings = list(person.images), decode_embeddings(person.embeddings, person.embedding_dtype)
+    extracted.clear()
+
+    update(session, fr_manager, 'A', 'A', 1, 2, 4)
+
+    person = session.get(PersonnelFR_SQL, 'A')
+    assert len(extracted) == 1 and person.images[:2] == old_images[:2] and person.images[2] == extracted[0]
+    np.testing.assert_array_equal(decode_embeddings(person.embeddings, person.embedding_dtype)[:2], old_embeddings[:2])
+    assert sorted(os.listdir(os.path.join(DATABASE_IMGS_DIR, 'A'))) == sorted(person.images)
+    assert best_matches(fr_manager, 4) == ['A']
+
+def test_rename_moves_images_without_extracting(session, fr_manager, enroll, extracted):
+    images = list(enrolled(session, enroll, 'A', 1, 2).images)
+    extracted.clear()
+
+    update(session, fr_manager, 'A', 'B', 1, 2)
+
+    assert extracted == [] and session.get(PersonnelFR_SQL, 'A') is None
+    assert session.get(PersonnelFR_SQL, 'B').images == images
+    assert sorted(os.listdir(os.path.join(DATABASE_IMGS_DIR, 'B'))) == sorted(images)
+    assert best_matches(fr_manager, 1) == ['B']
+
+def test_rows_without_hashes_are_hashed_from_their_files(session, fr_manager, enroll, extracted):
+    person = enrolled(session, enroll, 'A', 1, 2)
+    person.image_hashes = None
+    session.add(person)
+    session.commit()
+    extracted.clear()
+
+    update(session, fr_manager, 'A', 'A', 2)
+
+    person = session.get(PersonnelFR_SQL, 'A')
+    assert extracted == [] and len(person.images) == len(person.image_hashes) == 1
@@ -0,0 +1,68 @@
+import asyncio
+import threading
+
+import pytest
+
+from conftest import face_image_b64
+from managers.InferenceExecutor import InferenceExecutor, InferenceQueueFull
+
+@pytest.fixture
+def executor():
+    executor = InferenceExecutor(num_workers=1, queue_size=1)
+    executor.start()
+    yield executor
+    executor.shutdown()
+
+def blocking_job(started: threading.Event, release: threading.Event, result: str = 'done') -> str:
+    started.set()
+    release.wait(5)
+    return result
+
+def test_running_job_times_out_but_finishes(executor):
+    started, release = threading.Event(), threading.Event()
+
+    async def run():
+        with pytest.raises(asyncio.TimeoutError): await executor.run(blocking_job, started, release, timeout=0.05)
+    asyncio.run(run())
+
+    assert started.is_set()
+    release.set()
+
+def test_running_write_job_is_awaited_past_timeout(executor):
+    started, release = threading.Event(), threading.Event()
+    threading.Timer(0.2, release.set).start()
+
+    assert asyncio.run(executor.run(blocking_job, started, release, timeout=0.05, timeout_queued_only=True)) == 'done'
+
+def test_queued_job_is_dropped_on_timeout(executor):
+    started, release = threading.Event(), threading.Event()
+    queued_started = threading.Event()
+    executor.submit(blocking_job, started, release)
+    started.wait(5)
+
+    async def run():
+        with pytest.raises(asyncio.TimeoutError):
+            await executor.run(blocking_job, queued_started, threading.Event(), timeout=0.05, timeout_queued_only=True)
+    asyncio.run(run())
+    release.set()
+    executor.shutdown()
+
+    assert not queued_started.is_set()
+
+def test_full_queue_is_refused(executor):
+    started, release = threading.Event(), threading.Event()
+    executor.submit(blocking_job, started, release)
+    started.wait(5)
+    executor.submit(blocking_job, threading.Event(), release)
+
+    with pytest.raises(InferenceQueueFull): executor.submit(blocking_job, threading.Event(), release)
+    release.set()
+
+def test_person_routes_open_their_own_session(client):
+    res = client.post('/FR/person/', json={'name': 'A', 'images': [face_image_b64(1)]})
+    assert res.status_code == 201
+
+    res = client.patch('/FR/person/', params={'name': 'A'}, json={'name': 'B', 'new_images': [face_image_b64(2)]})
+    assert res.status_code == 200 and res.json()['name'] == 'B'
+
+    assert [person['name'] for person in client.get('/FR/person/').json()] == ['B']
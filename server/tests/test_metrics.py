@@ -0,0 +1,53 @@
+import re
+
+import pytest
+
+from conftest import face_image_b64
+import metrics
+
+def metric_value(text: str, name: str) -> float:
+    return float(re.search(r'^{} (\S+)$'.format(re.escape(name)), text, re.MULTILINE).group(1))
+
+def test_histogram_buckets_are_cumulative():
+    histogram = metrics.Histogram((1, 0.1))
+
+    for value in (0.05, 0.5, 5): histogram.observe(value)
+
+    assert histogram.snapshot() == {'buckets': {'0.1': 1, '1': 2}, 'count': 3, 'sum': pytest.approx(5.55)}
+
+def test_timed_records_failed_stages_too():
+    count = metrics.stage_seconds['db_commit'].count
+
+    with pytest.raises(RuntimeError), metrics.timed('db_commit'): raise RuntimeError
+
+    assert metrics.stage_seconds['db_commit'].count == count + 1
+
+def test_render_skips_failing_gauges(monkeypatch):
+    monkeypatch.setattr(metrics, 'gauges', {'fr_ok': ('Readable', lambda: 3), 'fr_broken': ('Unreadable', lambda: 1 / 0)})
+
+    text = metrics.render()
+
+    assert metric_value(text, 'fr_ok') == 3 and 'fr_broken' not in text
+
+def test_detection_is_timed_by_stage(client):
+    client.post('/FR/person/', json={'name': 'A', 'images': [face_image_b64(1)]})
+    before = client.get('/metrics').text
+
+    assert client.post('/FR/detection/', params={'top_n': 1}, json={'image_data': face_image_b64(1, width=800)}).status_code == 201
+    after = client.get('/metrics')
+
+    assert after.headers['content-type'].startswith('text/plain')
+    for stage in ('base64_decode', 'detection', 'recognition', 'vector_query', 'db_commit'):
+        name = 'fr_stage_duration_seconds_count{{stage="{}"}}'.format(stage)
+        assert metric_value(after.text, name) == metric_value(before, name) + 1
+    assert metric_value(after.text, 'fr_vector_index_live_vectors') == 1
+
+def test_deleted_people_are_not_counted_as_live_vectors(client):
+    for name, identity in (('A', 1), ('B', 2)): client.post('/FR/person/', json={'name': name, 'images': [face_image_b64(identity)]})
+
+    assert client.delete('/FR/person/', params={'name': 'A'}).status_code == 200
+    text = client.get('/metrics').text
+
+    assert metric_value(text, 'fr_vector_index_live_vectors') == 1
+    assert metric_value(text, 'fr_vector_index_deleted_slots') == 1
+    assert metric_value(text, 'fr_vector_index_slots') == 2
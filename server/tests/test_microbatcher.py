@@ -0,0 +1,46 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from conftest import best_matches
+from benchmarks.fake_model import FakeFaceAnalysis, make_face_image
+from managers.FRManager import FRManager
+from managers.MicroBatcher import MicroBatcher
+
+def test_concurrent_items_are_batched():
+    batch_sizes = []
+    batcher = MicroBatcher(lambda items: batch_sizes.append(len(items)) or [item * 2 for item in items], max_batch_size=4, max_wait=0.2)
+
+    futures = [batcher.submit(item) for item in range(6)]
+
+    assert [future.result(5) for future in futures] == [0, 2, 4, 6, 8, 10]
+    assert batch_sizes == [4, 2]
+
+def test_batch_failure_is_raised_for_every_item():
+    batcher = MicroBatcher(lambda items: 1 / 0, max_batch_size=2, max_wait=0.2)
+
+    futures = [batcher.submit(item) for item in range(2)]
+
+    assert all(isinstance(future.exception(5), ZeroDivisionError) for future in futures)
+
+def test_batching_thread_warms_up_its_own_model(fake_model):
+    created = []
+    def model_factory():
+        created.append(threading.current_thread().name)
+        return FakeFaceAnalysis()
+
+    fr_manager = FRManager(model_factory=model_factory, search_backend='exact', microbatch_max_size=4)
+
+    assert fr_manager.batcher.ready.wait(5)
+    assert created == ['fr-microbatch'] and fr_manager._model is None
+
+def test_batched_inference_matches_unbatched(fake_model):
+    fr_manager = FRManager(model_factory=FakeFaceAnalysis, search_backend='exact', microbatch_max_size=4, microbatch_max_wait=0.05)
+    fr_manager.load_vectors_from_sql(['A', 'B'], [np.array(fr_manager.extract_embeddings(make_face_image(idx))) for idx in range(2)])
+
+    with ThreadPoolExecutor(4) as pool:
+        results = list(pool.map(lambda idx: fr_manager.infer(img=make_face_image(idx % 2), k=1), range(4)))
+
+    assert [result[0]['targets'] for result in results] == [['A'], ['B'], ['A'], ['B']]
+    assert best_matches(fr_manager, 1) == ['B']
@@ -0,0 +1,55 @@
+import pytest
+from sqlmodel import text
+
+from conftest import face_image_b64
+from database.Personnel import PersonnelFR_SQL, init_PersonFR_search, search_PersonFR
+
+NAMES = ['Alice Tan', 'Bob "The Builder" Lim', 'Alicia Keys', 'Malik', 'Li']
+
+@pytest.fixture
+def personnel(session) -> list[str]:
+    session.add_all(PersonnelFR_SQL(name=name, images=[]) for name in NAMES)
+    session.commit()
+    return NAMES
+
+def search(session, name: str | None = None, **kwargs) -> list[str]:
+    return [person.name for person in search_PersonFR(session, name, **kwargs)]
+
+@pytest.mark.parametrize('query, expected', [
+    ('ali', ['Alice Tan', 'Alicia Keys', 'Malik']),
+    ('ALICE', ['Alice Tan']),
+    ('"The', ['Bob "The Builder" Lim']),
+    ('Li', ['Alice Tan', 'Alicia Keys', 'Bob "The Builder" Lim', 'Li', 'Malik']),
+    ('zzz', [])
+])
+def test_search_matches_substrings(session, personnel, query, expected):
+    assert search(session, query) == expected
+
+def test_search_pages_by_name(session, personnel):
+    assert search(session, limit=2) == ['Alice Tan', 'Alicia Keys']
+    assert search(session, after='Alicia Keys', limit=2) == ['Bob "The Builder" Lim', 'Li']
+
+def test_index_follows_renames_and_deletions(session, personnel):
+    person = session.get(PersonnelFR_SQL, 'Malik')
+    session.delete(person)
+    session.exec(text("UPDATE personnelfr_sql SET name = 'Alina' WHERE name = 'Alice Tan'"))
+    session.commit()
+
+    assert search(session, 'ali') == ['Alicia Keys', 'Alina']
+
+def test_index_is_rebuilt_when_out_of_sync(session, personnel):
+    session.exec(text("INSERT INTO personnel_fts(personnel_fts) VALUES ('delete-all')"))
+    session.commit()
+    assert search(session, 'ali') == []
+
+    init_PersonFR_search(session)
+
+    assert search(session, 'ali') == ['Alice Tan', 'Alicia Keys', 'Malik']
+
+def test_search_route_returns_summaries(client):
+    client.post('/FR/person/', json={'name': 'Alice', 'images': [face_image_b64(1), face_image_b64(2)]})
+
+    [summary] = client.get('/FR/person/search/', params={'name': 'lic'}).json()
+
+    assert summary['name'] == 'Alice' and summary['image_count'] == 2
+    assert client.get(summary['thumbnail']).status_code == 200
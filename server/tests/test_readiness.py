@@ -0,0 +1,27 @@
+import threading
+
+from fastapi.testclient import TestClient
+
+from benchmarks.fake_model import FakeFaceAnalysis
+from database import database
+from routers import FRroutes
+import main
+
+def test_ready_waits_for_worker_models(engine, monkeypatch):
+    models_loading = threading.Event()
+    def slow_model() -> FakeFaceAnalysis:
+        models_loading.wait(5)
+        return FakeFaceAnalysis()
+
+    monkeypatch.setattr(database, 'engine', engine)
+    monkeypatch.setattr(FRroutes, 'engine', engine)
+    monkeypatch.setattr(FRroutes, 'FR_MANAGER_OPTIONS', dict(FRroutes.FR_MANAGER_OPTIONS, model_factory=slow_model))
+    with TestClient(main.app) as client:
+        assert client.get('/health').status_code == 200
+        assert client.get('/ready').status_code == 503
+
+        models_loading.set()
+        FRroutes.inference_executor.ready.wait(5)
+        FRroutes.stream_executor.ready.wait(5)
+
+        assert client.get('/ready').status_code == 200
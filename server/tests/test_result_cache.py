@@ -0,0 +1,62 @@
+from conftest import face_image_b64
+from benchmarks.fake_model import FakeFaceAnalysis, make_face_image
+from managers.FRManager import FRManager
+from managers.ResultCache import ResultCache
+
+def cached_fr_manager(**people: int) -> FRManager:
+    """
+    Returns an FRManager with the result and embedding caches enabled, and an image of the given identity indexed for each person
+    """
+    fr_manager = FRManager(model_factory=FakeFaceAnalysis, search_backend='exact', result_cache_size=8, embedding_cache_size=8)
+    for name, identity in people.items(): fr_manager.add_to_vector_index_multi([name], fr_manager.extract_embeddings(make_face_image(identity)))
+    return fr_manager
+
+def test_cache_evicts_least_recently_used_and_expired(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr('managers.ResultCache.time.monotonic', lambda: now[0])
+    cache = ResultCache(max_size=2, ttl=10)
+
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1
+    cache.put('c', 3)
+    assert (cache.get('a'), cache.get('b'), cache.get('c')) == (1, None, 3)
+
+    now[0] = 11
+    assert cache.get('a') is None and len(cache) == 1
+    assert ResultCache(max_size=0).get('a') is None
+
+def test_images_sent_again_are_not_decoded(monkeypatch):
+    fr_manager = cached_fr_manager(A=1, B=2)
+    decoded = []
+    decode_for_inference = fr_manager.decode_for_inference
+    monkeypatch.setattr(fr_manager, 'decode_for_inference', lambda *args: decoded.append(1) or decode_for_inference(*args))
+    img = make_face_image(1)
+
+    first = fr_manager.infer(img=img, k=1)
+    assert fr_manager.infer(img=img, k=1) == first #result cache
+    assert [face['targets'] for face in fr_manager.infer(img=img, k=2)] == [['A', 'B']] #embedding cache, searched again
+    assert len(decoded) == 1
+
+    assert fr_manager.infer(img=make_face_image(1, img_format='PNG'), k=1)[0]['targets'] == ['A'] #other bytes, decoded again
+    assert len(decoded) == 2
+
+def test_results_are_dropped_when_the_gallery_changes():
+    fr_manager = cached_fr_manager(B=2)
+    img = make_face_image(1)
+    assert fr_manager.infer(img=img, k=1)[0]['targets'] == ['B']
+
+    fr_manager.add_to_vector_index_multi(['A'], fr_manager.extract_embeddings(img))
+
+    assert fr_manager.infer(img=img, k=1)[0]['targets'] == ['A']
+    assert fr_manager.result_cache.hits == 0 and fr_manager.embedding_cache.hits == 1
+
+def test_cache_route_reports_hits(client):
+    client.post('/FR/person/', json={'name': 'A', 'images': [face_image_b64(1)]})
+    img = face_image_b64(1, width=800)
+
+    for _ in range(3): client.post('/FR/detection/', params={'top_n': 1}, json={'image_data': img})
+
+    stats = client.get('/FR/detection/cache/').json()
+    assert stats['result']['hits'] == 2 and stats['result']['misses'] == 1
+    assert len(client.get('/FR/detection/').json()) == 3 #every request is still recorded
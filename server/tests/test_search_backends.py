@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+
+from benchmarks.fake_model import FakeFaceAnalysis
+from managers.FRManager import FRManager
+from managers.SearchBackend import ExactBackend, HNSWBackend
+
+def random_vectors(count: int, seed: int = 0) -> np.ndarray:
+    return np.random.default_rng(seed).standard_normal((count, 512)).astype(np.float32)
+
+@pytest.mark.parametrize('backend_class', [ExactBackend, HNSWBackend])
+def test_backends_return_the_nearest_vectors(backend_class):
+    vectors = random_vectors(50)
+    backend = backend_class()
+    backend.add_items(vectors, ids=list(range(50)))
+    backend.mark_deleted(3)
+
+    neighbours, distances = backend.query(vectors[[3, 7]], k=2)
+
+    assert 3 not in neighbours[0].tolist() and neighbours[1][0] == 7
+    assert distances[1][0] == pytest.approx(0, abs=1e-5)
+
+def test_exact_backend_matches_brute_force():
+    vectors, queries = random_vectors(200), random_vectors(5, seed=1)
+    backend = ExactBackend(capacity=16)
+    backend.add_items(vectors, ids=list(range(200)))
+
+    neighbours, distances = backend.query(queries, k=10)
+
+    normalised = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    similarities = (queries / np.linalg.norm(queries, axis=1, keepdims=True)) @ normalised.T
+    np.testing.assert_array_equal(neighbours, np.argsort(-similarities, axis=1)[:, :10])
+    np.testing.assert_allclose(distances, 1 - np.sort(similarities, axis=1)[:, ::-1][:, :10], atol=1e-5)
+
+def test_exact_backend_saves_and_memory_maps(tmp_path):
+    vectors = random_vectors(4)
+    backend = ExactBackend()
+    backend.add_items(vectors, ids=[0, 1, 2, 3])
+    backend.mark_deleted(1)
+    backend.save(str(tmp_path / 'index.npy'))
+
+    loaded = ExactBackend.load(str(tmp_path / 'index.npy'))
+
+    assert len(backend) == len(loaded) == 3
+    np.testing.assert_array_equal(loaded.query(vectors[2], k=3)[0], backend.query(vectors[2], k=3)[0])
+
+def test_auto_backend_switches_with_gallery_size():
+    fr_manager = FRManager(model_factory=FakeFaceAnalysis, search_backend='auto', exact_max_size=3)
+    vectors = random_vectors(5)
+
+    fr_manager.add_to_vector_index_multi(['A', 'B'], list(vectors[:2]))
+    assert fr_manager.vector_index.name == 'exact'
+
+    fr_manager.add_to_vector_index_multi(['C', 'D', 'E'], list(vectors[2:]))
+    assert fr_manager.vector_index.name == 'hnsw'
+    _, names, _ = fr_manager.search_embeddings([(vectors[[4]], 1)])[0]
+    assert names == [['E']]
+
+    fr_manager.load_vectors_from_sql(['A'], [vectors[0]], reset=True)
+    assert fr_manager.vector_index.name == 'exact'
+
+def test_auto_backend_keeps_vectors_deleted_and_added_back_across_the_threshold():
+    fr_manager = FRManager(model_factory=FakeFaceAnalysis, search_backend='auto', exact_max_size=4)
+    vectors = random_vectors(5)
+    names = ['A', 'B', 'C', 'D', 'E']
+    fr_manager.add_to_vector_index_multi(names, list(vectors))
+    assert fr_manager.vector_index.name == 'hnsw'
+
+    for name in ['E', 'D']: fr_manager.update_to_vector_index(name, name, np.empty((0, 512)))
+    assert fr_manager.vector_index.name == 'hnsw' #3 vectors, above half of exact_max_size
+
+    fr_manager.update_to_vector_index('C', 'C', np.empty((0, 512)))
+    assert fr_manager.vector_index.name == 'exact'
+
+    for name, vector in zip(names[2:], vectors[2:]): fr_manager.add_to_vector_index(name, vector)
+    assert fr_manager.vector_index.name == 'hnsw'
+    _, found, _ = fr_manager.search_embeddings([(vectors, 1)])[0]
+    assert found == [[name] for name in names]
@@ -0,0 +1,61 @@
+import json
+
+import pytest
+
+from conftest import best_matches
+from benchmarks.fake_model import FakeFaceAnalysis
+from managers.FRManager import FRManager
+from database.Personnel import load_PersonFR_vector_index, delete_PersonFR, get_gallery_generation
+
+def new_fr_manager() -> FRManager:
+    return FRManager(model_factory=FakeFaceAnalysis, search_backend='exact')
+
+def test_snapshot_round_trip(tmp_path, session, fr_manager, enroll):
+    for idx, name in enumerate(['A', 'B', 'C']): enroll(name, idx)
+    fr_manager.save_snapshot(str(tmp_path / 'snapshot'))
+
+    loaded = new_fr_manager()
+
+    assert loaded.load_snapshot(str(tmp_path / 'snapshot')) == get_gallery_generation(session)
+    assert loaded.registry.name_list == ['A', 'B', 'C']
+    assert [best_matches(loaded, idx)[0] for idx in range(3)] == ['A', 'B', 'C']
+
+def test_snapshot_catches_up_on_changes_after_it_was_saved(tmp_path, session, fr_manager, enroll):
+    enroll('A', 0)
+    enroll('B', 1)
+    fr_manager.save_snapshot(str(tmp_path / 'snapshot'))
+    enroll('C', 2)
+    delete_PersonFR(session, 'A', fr_manager)
+
+    loaded = new_fr_manager()
+    load_PersonFR_vector_index(session, loaded, str(tmp_path / 'snapshot'))
+
+    assert loaded.generation == get_gallery_generation(session)
+    assert loaded.registry.live_count == 2
+    assert best_matches(loaded, 2) == ['C']
+    assert 'A' not in best_matches(loaded, 0, k=2)
+
+def test_corrupted_snapshot_is_rebuilt_from_database(tmp_path, session, fr_manager, enroll):
+    enroll('A', 0)
+    fr_manager.save_snapshot(str(tmp_path / 'snapshot'))
+    (tmp_path / 'snapshot' / 'index.npy').write_bytes(b'corrupted')
+
+    loaded = new_fr_manager()
+    with pytest.warns(UserWarning, match='does not match its metadata'):
+        assert loaded.load_snapshot(str(tmp_path / 'snapshot')) is None
+
+    with pytest.warns(UserWarning): load_PersonFR_vector_index(session, loaded, str(tmp_path / 'snapshot'))
+    assert best_matches(loaded, 0) == ['A']
+
+def test_snapshot_from_the_future_is_ignored(tmp_path, session, fr_manager, enroll):
+    enroll('A', 0)
+    fr_manager.save_snapshot(str(tmp_path / 'snapshot'))
+    meta_path = tmp_path / 'snapshot' / 'meta.json'
+    meta = json.loads(meta_path.read_text())
+    meta_path.write_text(json.dumps(dict(meta, generation=meta['generation'] + 10)))
+
+    loaded = new_fr_manager()
+    load_PersonFR_vector_index(session, loaded, str(tmp_path / 'snapshot'))
+
+    assert loaded.generation == get_gallery_generation(session)
+    assert best_matches(loaded, 0) == ['A']
@@ -0,0 +1,46 @@
+import base64
+import io
+import os
+
+import pytest
+from PIL import Image
+
+from benchmarks.fake_model import make_face_image
+from database.imgfs import DerivedImageCache, Mode, THUMBNAIL_DIR, write_img_bytes_to_file, fetch_thumbnail_from_file, get_thumbnail_file_path, get_img_file_path, thumbnail_cache
+
+def test_cache_is_bounded_by_bytes_and_evicts_least_recently_used():
+    cache = DerivedImageCache(max_bytes=10)
+    cache.put(('a', 64), b'1234')
+    cache.put(('b', 64), b'1234')
+    assert cache.get(('a', 64)) == b'1234'
+
+    cache.put(('c', 64), b'1234')
+
+    assert cache.get(('b', 64)) is None and cache.size == 8
+    cache.put(('d', 64), b'x' * 11)
+    assert cache.get(('d', 64)) is None
+
+def test_cache_invalidates_a_folder():
+    cache = DerivedImageCache(max_bytes=100)
+    for path in ('db/A/1.jpg', 'db/A/.thumbs/2.jpg', 'db/AB/1.jpg'): cache.put((path, 64), b'1234')
+
+    cache.invalidate_folder('db/A')
+
+    assert list(cache.entries) == [('db/AB/1.jpg', 64)] and cache.size == 4
+
+def test_thumbnail_is_saved_once_and_cached(workdir):
+    img_name = write_img_bytes_to_file(make_face_image(1), Mode.database, name='A')
+    thumbnail_path = get_thumbnail_file_path(img_name, Mode.database, 'A', 64)
+    assert thumbnail_path == os.path.join(os.path.dirname(get_img_file_path(img_name, Mode.database, 'A')), THUMBNAIL_DIR, '64', img_name)
+    modified = os.stat(thumbnail_path).st_mtime_ns
+
+    thumbnail = fetch_thumbnail_from_file(img_name, Mode.database, 'A', 64)
+
+    assert max(Image.open(io.BytesIO(base64.b64decode(thumbnail))).size) <= 64
+    assert os.stat(get_thumbnail_file_path(img_name, Mode.database, 'A', 64)).st_mtime_ns == modified
+    assert thumbnail_cache.get((get_img_file_path(img_name, Mode.database, 'A'), 64)) is not None
+
+def test_unsupported_thumbnail_size_is_refused(workdir):
+    img_name = write_img_bytes_to_file(make_face_image(1), Mode.database, name='A')
+
+    with pytest.raises(ValueError): get_thumbnail_file_path(img_name, Mode.database, 'A', 100)
@@ -0,0 +1,25 @@
+from benchmarks.fake_model import make_face_image
+
+def test_person_upload_and_raw_routes(client):
+    res = client.post('/FR/person/upload/', data={'name': 'A'}, files=[('images', ('A.jpg', make_face_image(1), 'image/jpeg')), ('images', ('A (1).jpg', make_face_image(2), 'image/jpeg'))])
+    assert res.status_code == 201 and len(res.json()['images']) == 2
+
+    res = client.post('/FR/person/raw/', params={'name': 'B'}, content=make_face_image(3), headers={'Content-Type': 'image/jpeg'})
+    assert res.status_code == 201 and len(res.json()['images']) == 1
+
+    assert client.post('/FR/person/raw/', params={'name': 'B'}, content=make_face_image(3), headers={'Content-Type': 'image/jpeg'}).status_code == 400
+
+def test_detection_upload_and_raw_routes(client):
+    client.post('/FR/person/raw/', params={'name': 'A'}, content=make_face_image(1), headers={'Content-Type': 'image/jpeg'})
+
+    res = client.post('/FR/detection/upload/', params={'top_n': 1}, files={'image': ('photo.jpg', make_face_image(1), 'image/jpeg')})
+    assert res.status_code == 201 and res.json()['bboxes'][0]['names'] == ['A']
+
+    res = client.post('/FR/detection/raw/', params={'top_n': 1}, content=make_face_image(1, img_format='PNG'), headers={'Content-Type': 'image/png'})
+    assert res.status_code == 201 and res.json()['bboxes'][0]['names'] == ['A']
+
+    assert len(client.get('/FR/detection/').json()) == 2
+
+def test_raw_routes_refuse_other_content_types_and_empty_bodies(client):
+    assert client.post('/FR/detection/raw/', content=b'{}', headers={'Content-Type': 'application/json'}).status_code == 415
+    assert client.post('/FR/detection/raw/', content=b'', headers={'Content-Type': 'image/jpeg'}).status_code == 400
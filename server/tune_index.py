@@ -0,0 +1,129 @@
+"""
+Offline tool for tuning and rebuilding the HNSW vector index
+
+For each combination of the HNSW parameters given, builds an index from the embeddings in the database and reports build time,
+memory, query throughput and latency, recall@k against exact search, and how often the top match is the individual a query belongs to.
+Queries are the embeddings of enrolled images (searched against the average embeddings in the 'average' gallery mode, like faces
+at detection time). With --rebuild, the vector index is rebuilt with the configured parameters (FR_HNSW_*) and saved as the snapshot.
+
+Run from the server directory while the server is stopped (the server saves its own snapshots):
+    python tune_index.py [--m 12 16 32] [--ef-construction 200] [--ef 10 32 64 128] [--k 10] [--queries 1000] [--synthetic 0]
+    python tune_index.py --rebuild
+"""
+import argparse
+import logging
+import time
+
+import numpy as np
+from sqlmodel import Session
+
+from config import VECTOR_INDEX_SNAPSHOT_PATH, FR_MANAGER_OPTIONS, LOG_LEVEL
+from managers.FRManager import FRManager
+from managers.SearchBackend import SearchBackend, HNSWBackend, ExactBackend
+from database.database import engine, init_database
+from database.Personnel import get_all_PersonFR_embed, get_gallery_generation
+
+def load_gallery(session: Session, gallery_mode: str) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Returns the gallery vectors and the individual of each, and the embeddings of enrolled images and the individual of each
+    """
+    names, vector_list = get_all_PersonFR_embed(session, all_embeddings=gallery_mode == 'all')
+    gallery_labels = np.repeat(np.arange(len(names)), [len(np.reshape(vectors, (-1, 512))) for vectors in vector_list])
+    gallery = np.vstack([np.reshape(vectors, (-1, 512)) for vectors in vector_list]) if names else np.empty((0, 512), dtype=np.float32)
+
+    name_index = {name: idx for idx, name in enumerate(names)}
+    query_names, query_vector_list = get_all_PersonFR_embed(session, all_embeddings=True)
+    query_labels = np.repeat([name_index[name] for name in query_names], [len(vectors) for vectors in query_vector_list])
+    queries = np.vstack(query_vector_list) if query_names else np.empty((0, 512), dtype=np.float32)
+
+    return gallery, gallery_labels, queries, query_labels
+
+def make_synthetic_gallery(identities: int, seed: int = 0) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Returns a synthetic gallery (one embedding per identity) and one query per identity (the same identity with noise)
+    """
+    rng = np.random.default_rng(seed)
+    gallery = rng.standard_normal((identities, 512)).astype(np.float32)
+    queries = gallery + 0.8 * rng.standard_normal((identities, 512)).astype(np.float32)
+    return gallery, np.arange(identities), queries, np.arange(identities)
+
+def measure(backend: SearchBackend, queries: np.ndarray, k: int) -> tuple[np.ndarray, float, float]:
+    """
+    Returns the neighbours of all queries (searched as one batch), the batch throughput in queries/s and the median latency of single queries in ms
+    """
+    start = time.perf_counter()
+    neighbours, _ = backend.query(queries, k=k)
+    qps = len(queries) / (time.perf_counter() - start)
+
+    times = []
+    for query in queries[:200]:
+        start = time.perf_counter()
+        backend.query(query, k=k)
+        times.append((time.perf_counter() - start) * 1e3)
+
+    return neighbours.astype(np.int64), qps, float(np.median(times))
+
+def recall(neighbours: np.ndarray, exact_neighbours: np.ndarray) -> float:
+    return float(np.mean([len(set(row) & set(exact_row)) / len(exact_row) for row, exact_row in zip(neighbours.tolist(), exact_neighbours.tolist())]))
+
+def tune(gallery: np.ndarray, gallery_labels: np.ndarray, queries: np.ndarray, query_labels: np.ndarray, args: argparse.Namespace) -> None:
+    k = min(args.k, len(gallery))
+    exact = ExactBackend(capacity=len(gallery))
+    exact.add_items(gallery, ids=list(range(len(gallery))))
+    exact_neighbours, qps, latency = measure(exact, queries, k)
+
+    row = '{:<36} | build {:8.2f} s | memory {:8.1f} MB | {:9.0f} queries/s | p50 {:7.3f} ms | recall@{} {:.4f} | top-1 {:.4f}'
+    print(row.format('exact', 0, gallery.nbytes / 1e6, qps, latency, k, 1.0, np.mean(gallery_labels[exact_neighbours[:, 0]] == query_labels)))
+
+    for m in args.m:
+        for ef_construction in args.ef_construction:
+            backend = HNSWBackend(M=m, ef_construction=ef_construction, max_elements=len(gallery))
+            start = time.perf_counter()
+            backend.add_items(gallery, ids=list(range(len(gallery))))
+            build_s = time.perf_counter() - start
+            memory_mb = len(backend.index.as_bytes()) / 1e6
+
+            for ef in args.ef:
+                backend.index.ef = ef
+                neighbours, qps, latency = measure(backend, queries, k)
+                print(row.format('hnsw M={} ef_construction={} ef={}'.format(m, ef_construction, ef), build_s, memory_mb, qps, latency, k,
+                                 recall(neighbours, exact_neighbours), np.mean(gallery_labels[neighbours[:, 0]] == query_labels)))
+
+def rebuild(session: Session) -> None:
+    fr_manager = FRManager(**FR_MANAGER_OPTIONS)
+    start = time.perf_counter()
+    fr_manager.load_vectors_from_sql(*get_all_PersonFR_embed(session, all_embeddings=fr_manager.gallery_mode == 'all'), reset=True)
+    fr_manager.generation = get_gallery_generation(session)
+    print("Vector index rebuilt ({} vectors, {} search backend) in {:.1f} s".format(len(fr_manager.vector_index), fr_manager.vector_index.name, time.perf_counter() - start))
+
+    if VECTOR_INDEX_SNAPSHOT_PATH: fr_manager.save_snapshot(VECTOR_INDEX_SNAPSHOT_PATH)
+    else: print("WARNING: vector index snapshots are disabled (FR_VECTOR_INDEX_SNAPSHOT_PATH), so the rebuilt index was not saved")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--m', type=int, nargs='+', default=[12, 16, 32], help='values of M to try')
+    parser.add_argument('--ef-construction', type=int, nargs='+', default=[200], help='values of ef_construction to try')
+    parser.add_argument('--ef', type=int, nargs='+', default=[10, 32, 64, 128], help='values of the query ef to try')
+    parser.add_argument('--k', type=int, default=10, help='neighbours per query')
+    parser.add_argument('--queries', type=int, default=1000, help='maximum number of queries (sampled from the enrolled images)')
+    parser.add_argument('--synthetic', type=int, default=0, help='tune on this many synthetic identities instead of the database')
+    parser.add_argument('--rebuild', action='store_true', help='rebuild the vector index with the configured parameters and save it as the snapshot')
+    args = parser.parse_args()
+    logging.basicConfig(level=LOG_LEVEL, format='%(levelname)s %(name)s: %(message)s')
+
+    init_database()
+
+    with Session(engine) as session:
+        if args.rebuild: return rebuild(session)
+
+        if args.synthetic: gallery, gallery_labels, queries, query_labels = make_synthetic_gallery(args.synthetic)
+        else: gallery, gallery_labels, queries, query_labels = load_gallery(session, FR_MANAGER_OPTIONS['gallery_mode'])
+
+    if not len(gallery): return print("The database has no enrolled faces (use --synthetic to tune on synthetic embeddings)")
+
+    sample = np.random.default_rng(0).permutation(len(queries))[:args.queries]
+    print("{} gallery vectors, {} queries".format(len(gallery), len(sample)))
+    tune(gallery, gallery_labels, queries[sample], query_labels[sample], args)
+
+if __name__ == '__main__':
+    main()